@@ -0,0 +1,151 @@
+"""
+Content-addressed storage for payloads too large to keep in the database.
+
+A codec given a blob store (see `condorcmf.dbqueue.codec`) writes every encoded
+payload of at least its `spill_threshold` bytes to the store and keeps only the
+payload's SHA-256 digest in the row. Identical payloads share one blob.
+"""
+
+import hashlib
+import logging
+import os
+import shutil
+import threading
+from pathlib import Path
+from time import time
+
+
+class FileBlobStore:
+    """
+    Blob store in a directory tree under `root`, with each blob at
+    `root/<d[:2]>/<d[2:4]>/<d>` for its hex SHA-256 digest `d`.
+
+    `root` should be on storage shared by every node of the session, such as
+    the submit node's filesystem mounted on the execute nodes; a local
+    directory works for tests and single-machine runs. Blobs are written to a
+    temporary file and renamed into place, so readers never see a partial
+    blob and concurrent writers of the same payload are harmless.
+
+    Blobs read from `root` are verified against their digest and copied to
+    `cache_dir` (by default a `blobs` directory in the package cache directory,
+    which is local to each node), so a node fetches each blob over the shared
+    filesystem at most once. Pass `cache=False` to read from `root` only.
+
+    Args:
+        root (str): Directory holding the blobs.
+        cache_dir (str): Local directory for cached copies.
+        cache (bool): Whether to cache fetched blobs locally.
+    """
+
+    def __init__(self, root, cache_dir=None, cache=True):
+        self.root = Path(root)
+        if cache and cache_dir is None:
+            from condorcmf import definitions
+
+            cache_dir = definitions.PACKAGE_CACHE_DIR / "blobs"
+        self.cache_dir = Path(cache_dir) if cache else None
+        if (
+            self.cache_dir is not None
+            and self.cache_dir.resolve() == self.root.resolve()
+        ):
+            self.cache_dir = None
+
+    def put(self, data):
+        """
+        Store `data` (bytes) and return its hex digest. Storing a blob that
+        already exists only refreshes its modification time, see `prune`.
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._path(self.root, digest)
+        if path.exists():
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+            return digest
+        _write(path, data)
+        logging.debug(f"Stored blob {digest} ({len(data)} bytes)")
+        return digest
+
+    def get(self, digest):
+        """
+        Return the bytes stored under `digest`, from the local cache if it has
+        them. Raises FileNotFoundError for an unknown digest and ValueError if
+        the blob in `root` does not match its digest.
+        """
+        if self.cache_dir is not None:
+            cached = self._path(self.cache_dir, digest)
+            try:
+                with open(cached, "rb") as f:
+                    return f.read()
+            except FileNotFoundError:
+                pass
+        with open(self._path(self.root, digest), "rb") as f:
+            data = f.read()
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise ValueError(f"Blob {digest} in {self.root} is corrupt")
+        if self.cache_dir is not None:
+            try:
+                _write(cached, data)
+            except OSError as error:
+                logging.warning(f"Failed to cache blob {digest}: {error}")
+        return data
+
+    def exists(self, digest):
+        return self._path(self.root, digest).exists()
+
+    def delete(self, digest):
+        """
+        Remove the blob stored under `digest` and its cached copy. Other rows
+        may refer to the same payload, so prefer `prune` unless the digest is
+        known to be unused.
+        """
+        for directory in (self.root, self.cache_dir):
+            if directory is not None:
+                try:
+                    os.remove(self._path(directory, digest))
+                except FileNotFoundError:
+                    pass
+
+    def prune(self, older_than):
+        """
+        Remove blobs that have not been stored for `older_than` seconds and
+        return how many were removed. Run it with an age beyond the lifetime of
+        any job, checkpoint or result that may still refer to a blob.
+        """
+        cutoff = time() - older_than
+        removed = 0
+        for path in self.root.glob("*/*/*"):
+            if path.name.startswith("."):
+                continue
+            try:
+                if path.stat().st_mtime < cutoff:
+                    os.remove(path)
+                    removed += 1
+            except FileNotFoundError:
+                pass
+        logging.info(f"Pruned {removed} blobs from {self.root}")
+        return removed
+
+    def clear_cache(self):
+        if self.cache_dir is not None:
+            shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    @staticmethod
+    def _path(directory, digest):
+        return directory / digest[:2] / digest[2:4] / digest
+
+
+def _write(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
@@ -0,0 +1,106 @@
+import logging
+import threading
+import uuid
+from collections import OrderedDict
+from time import time
+
+BROADCAST_COLUMNS = (
+    "(`session_id`, `broadcast_id`, `round_id`, `created_at`, `payload`)"
+)
+
+# Number of decoded broadcast payloads each process keeps
+CACHE_SIZE = 32
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+class Broadcast:
+    """
+    Payloads shared by many jobs, stored once in the `broadcast` table.
+
+    `Session.broadcast` writes the shared payload here and gives every job a
+    `broadcast_id` and only its own part of the payload. Readers merge the two
+    with `merge`: keys of the job's part override those of the shared
+    payload. Decoded shared payloads are cached per process (see
+    `CACHE_SIZE`), so a node taking many jobs of one broadcast fetches and
+    decodes the shared payload once. The cached values are shared between the
+    merged payloads and must not be modified in place.
+    """
+
+    def __init__(self, db, session_id: str):
+        self.db = db
+        self.session_id = session_id
+
+    def create(self, payload, round_id=None, broadcast_id=None, queue_query=False):
+        """
+        Store `payload` and return its broadcast id.
+        """
+        broadcast_id = str(uuid.uuid4()) if broadcast_id is None else broadcast_id
+        logging.info(f"Creating broadcast with id: {broadcast_id}")
+        self.db.insert(
+            "broadcast",
+            BROADCAST_COLUMNS,
+            (
+                self.session_id,
+                broadcast_id,
+                round_id,
+                time(),
+                self.db.codec.encode(payload),
+            ),
+            queue_query=queue_query,
+        )
+        return broadcast_id
+
+    def get(self, broadcast_id):
+        """
+        Return the shared payload of `broadcast_id`, or None if there is none.
+        """
+        key = (self.session_id, broadcast_id)
+        with _cache_lock:
+            if key in _cache:
+                _cache.move_to_end(key)
+                return _cache[key]
+        row = self.db.select_one(
+            "broadcast",
+            "`payload`",
+            "`session_id`=%s AND `broadcast_id`=%s",
+            params=key,
+        )
+        if row is None:
+            return None
+        payload = self.db.codec.decode(row[0])
+        with _cache_lock:
+            _cache[key] = payload
+            while len(_cache) > CACHE_SIZE:
+                _cache.popitem(last=False)
+        return payload
+
+    def merge(self, broadcast_id, payload):
+        """
+        Return the shared payload of `broadcast_id` updated with the job's own
+        `payload`, or `payload` alone if `broadcast_id` is None.
+        """
+        if broadcast_id is None:
+            return payload
+        shared = self.get(broadcast_id)
+        if shared is None:
+            logging.warning(f"Broadcast {broadcast_id} not found")
+            return payload
+        merged = dict(shared)
+        merged.update(payload or {})
+        return merged
+
+    def clear(self, round_id=None, queue_query=False):
+        """
+        Delete the session's broadcasts, or those of `round_id`.
+        """
+        logging.info(f"Clearing broadcasts with session id: {self.session_id}")
+        where_clause = "`session_id`=%s"
+        params = [self.session_id]
+        if round_id is not None:
+            where_clause += " AND `round_id`=%s"
+            params.append(round_id)
+        return self.db.delete(
+            "broadcast", where_clause, queue_query=queue_query, params=params
+        )
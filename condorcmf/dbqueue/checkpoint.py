@@ -1,9 +1,7 @@
-import json
 import logging
-import numpy as np
 from time import time
 
-from . import utils
+import numpy as np
 
 
 class Checkpoint:
@@ -17,7 +15,8 @@ class Checkpoint:
         _exists = self.db.select(
             "checkpoint",
             "id",
-            f"session_id = '{self.session_id}' AND `node_id` = '{self.node_id}' AND type = {type}",
+            "`session_id` = %s AND `node_id` = %s AND `type` = %s",
+            params=(self.session_id, self.node_id, type),
         )
         if _exists:
             return True
@@ -35,7 +34,7 @@ class Checkpoint:
                 self.node_type,
                 time(),
                 type,
-                json.dumps(payload, cls=utils.NpEncoder),
+                self.db.codec.encode(payload),
             ),
         )
         if _created:
@@ -47,10 +46,11 @@ class Checkpoint:
         _checkpoint = self.db.select_one(
             "checkpoint",
             "payload",
-            f"session_id = '{self.session_id}' AND `node_id` = '{self.node_id}' AND type = {type}",
+            "`session_id` = %s AND `node_id` = %s AND `type` = %s",
+            params=(self.session_id, self.node_id, type),
         )
         if _checkpoint:
-            payload = json.loads(_checkpoint[0])
+            payload = self.db.codec.decode(_checkpoint[0])
             return self._decode_payload(payload)
         return None
 
@@ -59,8 +59,14 @@ class Checkpoint:
         payload = self._encode_payload(payload)
         _updated = self.db.update(
             "checkpoint",
-            f"payload = '{json.dumps(payload, cls=utils.NpEncoder)}'",
-            f"session_id = '{self.session_id}' AND `node_id` = '{self.node_id}' AND type = {type}",
+            "`payload` = %s",
+            "`session_id` = %s AND `node_id` = %s AND `type` = %s",
+            params=(
+                self.db.codec.encode(payload),
+                self.session_id,
+                self.node_id,
+                type,
+            ),
         )
         if _updated:
             logging.info(f"Checkpoint updated for session {self.session_id}")
@@ -71,7 +77,8 @@ class Checkpoint:
         logging.info(f"Deleting checkpoint for session {self.session_id}")
         _deleted = self.db.delete(
             "checkpoint",
-            f"session_id = '{self.session_id}' AND `node_id` = '{self.node_id}' AND type = {type}",
+            "`session_id` = %s AND `node_id` = %s AND `type` = %s",
+            params=(self.session_id, self.node_id, type),
         )
         if _deleted:
             logging.info(f"Checkpoint deleted for session {self.session_id}")
@@ -79,11 +86,15 @@ class Checkpoint:
         return False
 
     def _encode_payload(self, payload):
+        # Binary codecs store arrays, NaN and inf as they are
+        if self.db.codec.arrays:
+            return payload
+
         for key, value in payload.items():
             if isinstance(value, np.ndarray):
                 payload[key] = value.tolist()
 
-        for key, value in payload.items():            
+        for key, value in payload.items():
             if isinstance(value, list):
                 for i, v in enumerate(value):
                     if isinstance(v, list):
@@ -97,7 +108,7 @@ class Checkpoint:
                 print(type(value))
                 if np.isinf(value) or np.isnan(value):
                     payload[key] = None
-        
+
         return payload
 
     def _decode_payload(self, payload):
@@ -0,0 +1,237 @@
+"""
+Payload codecs for the `payload` columns of `job_queue`, `checkpoint` and
+`results`.
+
+Every connector has a `codec` attribute used to encode payloads before they
+are written and to decode them when they are read. `JSONCodec`, the default,
+writes the same JSON text as earlier versions. `NumpyCodec` writes a binary
+format that keeps arrays as raw buffers:
+
+    MAGIC | header length (uint32, little endian) | JSON header | buffers
+
+The header holds the payload with each array replaced by a reference to its
+dtype, shape and buffer offset, and the buffers follow it, each aligned to
+`ALIGNMENT` bytes. Decoding maps the arrays onto the fetched value with
+`np.frombuffer`, so they are read-only views that share its memory; copy an
+array before modifying it in place.
+
+Either codec can also compress its output with zlib or lzma. An encoded value
+of at least `threshold` bytes is compressed and prefixed with a single marker
+byte naming the compressor (see `COMPRESSORS`); smaller values, and values
+that do not shrink, are stored as they are. The marker bytes cannot start a
+JSON text or a binary payload, so compressed and uncompressed rows decode
+side by side. Compressed values are binary, so MySQL databases need schema
+version 4 or later for them.
+
+A codec with a `blob_store` (see `condorcmf.dbqueue.blobstore`) spills
+encoded values of at least `spill_threshold` bytes, after compression, into
+the store and writes only a reference to them: the `BLOB_MARKER` byte followed
+by the blob's hex digest. Every node that decodes such a reference needs a
+codec with the same store.
+
+All codecs decode every format, so a session can switch codecs or compression
+without rewriting the rows already stored.
+"""
+
+import json
+import lzma
+import struct
+import zlib
+
+import numpy as np  # type: ignore
+
+from . import utils
+
+MAGIC = b"\x93CMF"
+HEADER_LENGTH = struct.Struct("<I")
+ALIGNMENT = 16
+
+# Key marking an array reference in the header of a binary payload
+ARRAY_KEY = "__ndarray__"
+
+# Marker byte, compress(data, level) and decompress(data) of each compressor.
+# A level of None selects the library default.
+COMPRESSORS = {
+    "zlib": (
+        1,
+        lambda data, level: zlib.compress(data, -1 if level is None else level),
+        zlib.decompress,
+    ),
+    "lzma": (
+        2,
+        lambda data, level: lzma.compress(data, preset=level),
+        lzma.decompress,
+    ),
+}
+DECOMPRESSORS = {marker: decompress for marker, _, decompress in COMPRESSORS.values()}
+
+BLOB_MARKER = 3
+
+
+class PayloadCodec:
+    """
+    Base class of the payload codecs. Subclasses implement `_encode`; `decode`
+    recognises every format.
+
+    `arrays` tells whether NumPy arrays come back from `decode` as arrays
+    (True) or as nested lists (False).
+
+    Args:
+        compression (str): "zlib", "lzma" or None for no compression.
+        level (int): Compression level (zlib) or preset (lzma), 0-9; None
+            selects the library default.
+        threshold (int): Size in bytes from which encoded payloads are
+            compressed.
+        blob_store: Store for large payloads, e.g. a `FileBlobStore`.
+        spill_threshold (int): Size in bytes from which encoded payloads are
+            written to `blob_store` instead of the row.
+    """
+
+    arrays = False
+
+    def __init__(
+        self,
+        compression=None,
+        level=None,
+        threshold=4096,
+        blob_store=None,
+        spill_threshold=1 << 20,
+    ):
+        if compression is not None and compression not in COMPRESSORS:
+            raise ValueError(f"Unknown compression {compression!r}")
+        self.compression = compression
+        self.level = level
+        self.threshold = threshold
+        self.blob_store = blob_store
+        self.spill_threshold = spill_threshold
+
+    def encode(self, payload):
+        data = self._compress(self._encode(payload))
+        if self.blob_store is None or len(data) < self.spill_threshold:
+            return data
+        if isinstance(data, str):
+            data = data.encode()
+        return bytes((BLOB_MARKER,)) + self.blob_store.put(data).encode()
+
+    def decode(self, value):
+        if value is None:
+            return None
+        if isinstance(value, str):
+            return json.loads(value)
+        if len(value) and value[0] == BLOB_MARKER:
+            if self.blob_store is None:
+                raise ValueError("Payload is in a blob store but the codec has none")
+            value = self.blob_store.get(bytes(value[1:]).decode())
+        if len(value) and value[0] in DECOMPRESSORS:
+            value = DECOMPRESSORS[value[0]](memoryview(value)[1:])
+        if bytes(value[: len(MAGIC)]) != MAGIC:
+            return json.loads(bytes(value))
+        return _decode_binary(value)
+
+    def _encode(self, payload):
+        raise NotImplementedError
+
+    def _compress(self, data):
+        if self.compression is None or len(data) < self.threshold:
+            return data
+        if isinstance(data, str):
+            data = data.encode()
+        marker, compress, _ = COMPRESSORS[self.compression]
+        compressed = compress(data, self.level)
+        if len(compressed) + 1 >= len(data):
+            return data
+        return bytes((marker,)) + compressed
+
+
+class JSONCodec(PayloadCodec):
+    """
+    Encodes payloads as JSON text, converting arrays with `tolist`.
+    """
+
+    def _encode(self, payload):
+        return json.dumps(payload, cls=utils.NpEncoder)
+
+
+class NumpyCodec(PayloadCodec):
+    """
+    Encodes payloads in the binary format described in the module docstring,
+    keeping the dtype, shape and raw bytes of every numeric array. Arrays of
+    Python objects are written as lists, as they have no raw buffer.
+    """
+
+    arrays = True
+
+    def _encode(self, payload):
+        buffers = []
+        tree = _extract_arrays(payload, buffers)
+        descriptors = []
+        offset = 0
+        for array in buffers:
+            offset += -offset % ALIGNMENT
+            descriptors.append(
+                [np.lib.format.dtype_to_descr(array.dtype), array.shape, offset]
+            )
+            offset += array.nbytes
+        header = json.dumps(
+            {"payload": tree, "arrays": descriptors}, cls=utils.NpEncoder
+        ).encode()
+        start = len(MAGIC) + HEADER_LENGTH.size + len(header)
+        parts = [MAGIC, HEADER_LENGTH.pack(len(header)), header]
+        parts.append(b"\0" * (-start % ALIGNMENT))
+        position = 0
+        for array, (_, _, offset) in zip(buffers, descriptors):
+            parts.append(b"\0" * (offset - position))
+            parts.append(memoryview(array.reshape(-1).view(np.uint8)))
+            position = offset + array.nbytes
+        return b"".join(parts)
+
+
+JSON = JSONCodec()
+
+
+def _extract_arrays(value, buffers):
+    """
+    Return `value` with every numeric array appended to `buffers` and replaced
+    by a reference to its position there, and NumPy scalars converted to
+    Python numbers.
+    """
+    if isinstance(value, np.ndarray):
+        if value.dtype.hasobject:
+            return _extract_arrays(value.tolist(), buffers)
+        buffers.append(value if value.flags.c_contiguous else value.copy(order="C"))
+        return {ARRAY_KEY: len(buffers) - 1}
+    if isinstance(value, dict):
+        return {key: _extract_arrays(item, buffers) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_extract_arrays(item, buffers) for item in value]
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _decode_binary(value):
+    (length,) = HEADER_LENGTH.unpack_from(value, len(MAGIC))
+    start = len(MAGIC) + HEADER_LENGTH.size
+    header = json.loads(bytes(value[start : start + length]))
+    start += length
+    start += -start % ALIGNMENT
+    arrays = []
+    for descr, shape, offset in header["arrays"]:
+        dtype = np.lib.format.descr_to_dtype(descr)
+        count = int(np.prod(shape, dtype=np.int64))
+        if count == 0:
+            arrays.append(np.empty(shape, dtype=dtype))
+            continue
+        array = np.frombuffer(value, dtype=dtype, count=count, offset=start + offset)
+        arrays.append(array.reshape(shape))
+    return _restore_arrays(header["payload"], arrays)
+
+
+def _restore_arrays(tree, arrays):
+    if isinstance(tree, dict):
+        if len(tree) == 1 and ARRAY_KEY in tree:
+            return arrays[tree[ARRAY_KEY]]
+        return {key: _restore_arrays(item, arrays) for key, item in tree.items()}
+    if isinstance(tree, list):
+        return [_restore_arrays(item, arrays) for item in tree]
+    return tree
@@ -0,0 +1,539 @@
+import logging
+import threading
+from time import monotonic, perf_counter
+
+from ..codec import JSON
+from .cache import StatementCache
+from .stats import NULL_TIMER, QueryStats, QueryTimer
+
+
+class DBQConnector:
+    """
+    Interface shared by the dbqueue connectors.
+
+    Every statement is built from a cached, parameterised shape and executed with
+    its values passed separately to the driver, so values are never interpolated
+    into the SQL text. Subclasses provide `_execute_query`, `_execute_query_queue`
+    and `transaction` for their driver.
+
+    Queries with `queue_query=True` are held in `query_queue` as
+    (operation, statement, params) entries until `_execute_query_queue` runs
+    them as a single transaction and returns one result per queued statement.
+    Each thread has its own `query_queue`, so threads sharing a connector
+    never run each other's statements.
+
+    Every call is recorded in `stats` under its query shape; see `QueryStats`.
+
+    Selects made with `read_only=True` may be served by one of `replicas`, a
+    list of connectors (or endpoints the subclass turns into connectors) for
+    read replicas of the database. A replica is only used while its
+    `replication_lag` is at most `max_staleness` seconds; lag is re-checked at
+    most every `lag_check_interval` seconds, and reads fall back to the primary
+    when no replica qualifies or a replica read fails. Writes, claims and
+    queued statements always run on the primary.
+
+    `dialect` names the SQL dialect the connector speaks, which selects the DDL
+    applied by `condorcmf.dbqueue.schema.migrate`.
+
+    `codec` encodes and decodes job, checkpoint and result payloads (see
+    `condorcmf.dbqueue.codec`). It defaults to uncompressed JSON; assign a
+    `NumpyCodec` to store arrays as raw binary buffers, and pass `compression`
+    to either codec to compress large payloads or `blob_store` to keep them
+    out of the rows altogether.
+    """
+
+    dialect = "mysql"
+    codec = JSON
+    placeholder = "%s"
+    lock_clause = " FOR UPDATE SKIP LOCKED"
+
+    def __init__(
+        self,
+        poll_delay=5,
+        max_retries=5,
+        replicas=None,
+        max_staleness=5.0,
+        lag_check_interval=1.0,
+    ):
+        self.poll_delay = poll_delay
+        self.max_retries = max_retries
+        self._queues = threading.local()
+        self.stats = QueryStats()
+        self.statements = StatementCache(self.placeholder, self.lock_clause, self.stats)
+        self.max_staleness = max_staleness
+        self.lag_check_interval = lag_check_interval
+        self.replicas = [
+            replica if isinstance(replica, DBQConnector) else self._replica(replica)
+            for replica in replicas or []
+        ]
+        self._replica_checks = {}
+        self._next_replica = 0
+
+    @property
+    def query_queue(self):
+        """
+        The queries queued by the calling thread.
+        """
+        queue = getattr(self._queues, "entries", None)
+        if queue is None:
+            queue = self._queues.entries = []
+        return queue
+
+    @query_queue.setter
+    def query_queue(self, entries):
+        self._queues.entries = entries
+
+    def insert(self, table, columns, values, limit=10, queue_query=False):
+        values = tuple(values)
+        statement = self.statements.get("insert", table, columns, n_values=len(values))
+        return self._run("insert", statement, values, limit, queue_query)
+
+    def insert_many(self, table, columns, rows, chunk_size=500, queue_query=False):
+        """
+        Insert `rows` with multi-row INSERT statements of at most `chunk_size`
+        rows each, all inside one transaction. Keep `chunk_size` small enough
+        that a statement stays under the server's `max_allowed_packet`.
+
+        Returns the number of rows inserted.
+        """
+        rows = [tuple(row) for row in rows]
+        if not rows:
+            return 0
+        n_values = len(rows[0])
+        chunks = []
+        for i in range(0, len(rows), chunk_size):
+            chunk = rows[i : i + chunk_size]
+            statement = self.statements.get(
+                "insert", table, columns, n_values=n_values, n_rows=len(chunk)
+            )
+            chunks.append((statement, tuple(v for row in chunk for v in row)))
+        if queue_query:
+            for statement, params in chunks:
+                self.query_queue.append(("insert", statement, params))
+            return len(rows)
+        with self.transaction() as cursor:
+            for statement, params in chunks:
+                start = perf_counter()
+                cursor.execute(statement.sql, params)
+                statement.record(perf_counter() - start)
+        return len(rows)
+
+    def select(
+        self,
+        table,
+        columns,
+        where_clause,
+        orderby=None,
+        limit=10,
+        queue_query=False,
+        params=None,
+        read_only=False,
+        groupby=None,
+    ):
+        """
+        With `read_only=True` the select may be served by a replica, see the
+        class docstring. `groupby` is the column list of a GROUP BY clause.
+        """
+        if read_only and self.replicas and not queue_query:
+            served, result = self._read_replica(
+                "select", table, columns, where_clause, orderby, limit, params, groupby
+            )
+            if served:
+                return result
+        statement = self.statements.get(
+            "select", table, columns, where_clause, orderby, groupby=groupby
+        )
+        return self._run("select", statement, params, limit, queue_query)
+
+    def select_one(
+        self,
+        table,
+        columns,
+        where_clause,
+        orderby=None,
+        limit=10,
+        queue_query=False,
+        params=None,
+        read_only=False,
+        groupby=None,
+    ):
+        if read_only and self.replicas and not queue_query:
+            served, result = self._read_replica(
+                "select_one",
+                table,
+                columns,
+                where_clause,
+                orderby,
+                limit,
+                params,
+                groupby,
+            )
+            if served:
+                return result
+        statement = self.statements.get(
+            "select_one", table, columns, where_clause, orderby, groupby=groupby
+        )
+        return self._run("select_one", statement, params, limit, queue_query)
+
+    def select_stream(
+        self,
+        table,
+        columns,
+        where_clause,
+        orderby=None,
+        params=None,
+        chunk_size=1000,
+    ):
+        """
+        Generator over the rows of a select in lists of at most `chunk_size`
+        rows, read from the server as they are consumed instead of buffered in
+        full first. Where the driver supports it the rows come from an
+        unbuffered server-side cursor on a dedicated connection, which stays
+        checked out until the generator is exhausted or closed, so consume or
+        close it promptly.
+        """
+        statement = self.statements.get("stream", table, columns, where_clause, orderby)
+        timer = QueryTimer(statement.stats)
+        error = True
+        try:
+            for rows in self._stream_query(
+                statement, tuple(params or ()), chunk_size, timer
+            ):
+                timer.fetched(rows)
+                yield rows
+                timer.restart()
+            error = False
+        except GeneratorExit:
+            error = False
+            raise
+        finally:
+            statement.record(timer.busy, timer.rows, error)
+
+    def update(
+        self, table, set_values, where_clause, limit=10, queue_query=False, params=None
+    ):
+        """
+        `params` holds the values for the placeholders of `set_values` followed by
+        those of `where_clause`.
+        """
+        statement = self.statements.get("update", table, set_values, where_clause)
+        return self._run("update", statement, params, limit, queue_query)
+
+    def update_rows(self, table, set_values, where_clause, params=None):
+        """
+        Run an UPDATE like `update`, in its own transaction, and return the
+        number of rows it changed, e.g. to tell whether a conditional update
+        applied.
+        """
+        statement = self.statements.get("update", table, set_values, where_clause)
+        start = perf_counter()
+        with self.transaction() as cursor:
+            cursor.execute(statement.sql, tuple(params or ()))
+            count = cursor.rowcount
+        statement.record(perf_counter() - start, rows=count)
+        return count
+
+    def delete(self, table, where_clause, limit=10, queue_query=False, params=None):
+        statement = self.statements.get("delete", table, where_clause=where_clause)
+        return self._run("delete", statement, params, limit, queue_query)
+
+    def claim(
+        self,
+        table,
+        columns,
+        where_clause,
+        set_values,
+        params=None,
+        set_params=None,
+        orderby=None,
+        n=1,
+    ):
+        """
+        Atomically claim up to `n` rows matching `where_clause`.
+
+        The rows are selected with `FOR UPDATE SKIP LOCKED`, so concurrent
+        claimers skip rows another transaction is claiming instead of waiting
+        on them, and `set_values` is applied to the selected rows in the same
+        transaction. `set_params` holds the values for the placeholders of
+        `set_values`. The table must have an integer `id` primary key.
+
+        Returns the claimed rows (without `id`), or an empty list.
+        """
+        select = self.statements.get(
+            "claim", table, f"`id`, {columns}", where_clause, orderby, n_rows=n
+        )
+        start = perf_counter()
+        with self.transaction() as cursor:
+            cursor.execute(select.sql, tuple(params or ()))
+            rows = cursor.fetchall()
+            if rows:
+                ids = [row[0] for row in rows]
+                update = self.statements.get(
+                    "update_ids", table, set_values, n_values=len(ids)
+                )
+                cursor.execute(update.sql, tuple(set_params or ()) + tuple(ids))
+        select.record(perf_counter() - start, rows=len(rows))
+        return [tuple(row[1:]) for row in rows]
+
+    def move(
+        self,
+        table,
+        to_table,
+        columns,
+        to_columns,
+        where_clause,
+        params=None,
+        extra_values=(),
+        n=500,
+    ):
+        """
+        Move up to `n` rows matching `where_clause` from `table` to `to_table`
+        in one transaction and return how many were moved.
+
+        The selected `columns` of each row, followed by `extra_values`, are
+        inserted into `to_columns` of `to_table`, and the rows are then deleted
+        from `table` by `id`. Rows locked by another transaction are skipped,
+        so concurrent movers never copy a row twice.
+        """
+        select = self.statements.get(
+            "claim", table, f"`id`, {columns}", where_clause, n_rows=n
+        )
+        extra_values = tuple(extra_values)
+        start = perf_counter()
+        with self.transaction() as cursor:
+            cursor.execute(select.sql, tuple(params or ()))
+            rows = cursor.fetchall()
+            if rows:
+                ids = tuple(row[0] for row in rows)
+                values = [tuple(row[1:]) + extra_values for row in rows]
+                insert = self.statements.get(
+                    "insert",
+                    to_table,
+                    to_columns,
+                    n_values=len(values[0]),
+                    n_rows=len(values),
+                )
+                cursor.execute(insert.sql, tuple(v for row in values for v in row))
+                delete = self.statements.get("delete_ids", table, n_values=len(ids))
+                cursor.execute(delete.sql, ids)
+        select.record(perf_counter() - start, rows=len(rows))
+        return len(rows)
+
+    def transition(
+        self,
+        table,
+        columns,
+        where_clause,
+        set_values,
+        log_table,
+        log_columns,
+        params=None,
+        set_params=None,
+        extra_values=(),
+        n=500,
+    ):
+        """
+        Apply `set_values` to up to `n` rows matching `where_clause` and log
+        them in one transaction, and return how many rows were changed.
+
+        The selected `columns` of each row, followed by `extra_values`, are
+        inserted into `log_columns` of `log_table`, e.g. the change feed. As in
+        `claim`, rows locked by another transaction are skipped, so callers
+        changing every matching row should repeat the call until it returns
+        less than `n`.
+        """
+        select = self.statements.get(
+            "claim", table, f"`id`, {columns}", where_clause, n_rows=n
+        )
+        extra_values = tuple(extra_values)
+        start = perf_counter()
+        with self.transaction() as cursor:
+            cursor.execute(select.sql, tuple(params or ()))
+            rows = cursor.fetchall()
+            if rows:
+                ids = tuple(row[0] for row in rows)
+                update = self.statements.get(
+                    "update_ids", table, set_values, n_values=len(ids)
+                )
+                cursor.execute(update.sql, tuple(set_params or ()) + ids)
+                values = [tuple(row[1:]) + extra_values for row in rows]
+                insert = self.statements.get(
+                    "insert",
+                    log_table,
+                    log_columns,
+                    n_values=len(values[0]),
+                    n_rows=len(values),
+                )
+                cursor.execute(insert.sql, tuple(v for row in values for v in row))
+        select.record(perf_counter() - start, rows=len(rows))
+        return len(rows)
+
+    def replication_lag(self):
+        """
+        Return how many seconds this connector's database lags behind the
+        primary it replicates, or None if replication is broken. A database that
+        is not a replica has no lag.
+        """
+        return 0.0
+
+    def statement_stats(self):
+        """
+        Return the per-shape instrumentation recorded by this connector, see
+        `QueryStats.snapshot`.
+        """
+        return self.stats.snapshot()
+
+    def _replica(self, endpoint):
+        """
+        Return a connector for the replica at `endpoint`. Subclasses that accept
+        replica endpoints rather than connectors override this.
+        """
+        raise TypeError(f"Replicas must be given as connectors, not {endpoint!r}")
+
+    def _choose_replica(self):
+        """
+        Return the next replica, round robin, whose lag is within
+        `max_staleness`, or None.
+        """
+        now = monotonic()
+        n = len(self.replicas)
+        for i in range(n):
+            index = (self._next_replica + i) % n
+            replica = self.replicas[index]
+            checked_at, usable = self._replica_checks.get(index, (None, False))
+            if checked_at is None or now - checked_at > self.lag_check_interval:
+                try:
+                    lag = replica.replication_lag()
+                except Exception as error:
+                    logging.warning(f"Failed to read replica lag: {error}")
+                    lag = None
+                usable = lag is not None and lag <= self.max_staleness
+                if not usable:
+                    logging.debug(f"Skipping replica {index} with lag {lag}")
+                self._replica_checks[index] = (now, usable)
+            if usable:
+                self._next_replica = (index + 1) % n
+                return replica
+        return None
+
+    def _read_replica(
+        self, operation, table, columns, where_clause, orderby, limit, params, groupby
+    ):
+        """
+        Run a select on a replica. Returns (True, result), or (False, None) if
+        the read should go to the primary instead.
+        """
+        replica = self._choose_replica()
+        if replica is None:
+            return False, None
+        try:
+            return True, getattr(replica, operation)(
+                table,
+                columns,
+                where_clause,
+                orderby=orderby,
+                limit=limit,
+                params=params,
+                groupby=groupby,
+            )
+        except Exception as error:
+            logging.warning(f"Replica read failed, using the primary: {error}")
+            # Keep the replica out of rotation until its lag is next checked
+            self._replica_checks[self.replicas.index(replica)] = (monotonic(), False)
+            return False, None
+
+    def _run(self, operation, statement, params, limit, queue_query):
+        params = tuple(params) if params is not None else ()
+        if queue_query:
+            self.query_queue.append((operation, statement, params))
+            return True
+        timer = QueryTimer(statement.stats)
+        error = True
+        try:
+            result = self._execute_query(
+                statement.sql,
+                params,
+                select=operation == "select",
+                select_one=operation == "select_one",
+                limit=limit,
+                timer=timer,
+            )
+            error = result is False
+            return result
+        finally:
+            statement.record(perf_counter() - timer.start, timer.rows, error)
+
+    def _execute_query(
+        self,
+        query,
+        params=(),
+        select=False,
+        select_one=False,
+        limit=10,
+        timer=NULL_TIMER,
+    ):
+        """
+        Execute `query` and return its rows (or None if there are none) for a
+        select, or True. `timer` receives the connect/execute/fetch laps, the
+        rows fetched and any retries.
+        """
+        raise NotImplementedError
+
+    def _stream_query(self, statement, params, chunk_size, timer):
+        """
+        Yield the rows of `statement` in lists of at most `chunk_size` rows.
+        Connectors with server-side cursors override this; the default runs
+        the select and splits its result.
+        """
+        rows = self._execute_query(statement.sql, params, select=True, timer=timer)
+        rows = list(rows or ())
+        for i in range(0, len(rows), chunk_size):
+            yield rows[i : i + chunk_size]
+
+    def _execute_query_queue(self, limit=10):
+        raise NotImplementedError
+
+    def _take_query_queue(self):
+        """
+        Return the calling thread's queued queries and start it a new queue, so
+        the batch an `_execute_query_queue` runs is exactly what its caller
+        queued.
+        """
+        query_queue = self.query_queue
+        self.query_queue = []
+        return query_queue
+
+    def _execute_queued(self, cursor, query_queue):
+        """
+        Execute the entries of `query_queue` on `cursor`, recording each under
+        its shape, and return one result per entry.
+        """
+        results = []
+        for operation, statement, params in query_queue:
+            timer = QueryTimer(statement.stats)
+            cursor.execute(statement.sql, params or None)
+            timer.lap("execute")
+            if operation == "select":
+                res = cursor.fetchall()
+            elif operation == "select_one":
+                res = cursor.fetchone()
+                # Drain any remaining rows so the cursor can be reused
+                cursor.fetchall()
+            else:
+                res = True
+            if operation in ("select", "select_one"):
+                timer.lap("fetch")
+                timer.fetched(res, many=operation == "select")
+            statement.record(perf_counter() - timer.start, timer.rows)
+            results.append(res if res else None)
+        return results
+
+    def transaction(self):
+        raise NotImplementedError
+
+
+def in_clause(values):
+    """
+    Return the placeholder list for an `IN (...)` clause over `values`.
+    """
+    return "(" + ", ".join(["%s"] * len(values)) + ")"
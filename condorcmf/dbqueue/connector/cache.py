@@ -0,0 +1,143 @@
+import threading
+
+from .stats import QueryStats, normalize
+
+
+class Statement:
+    """
+    A parameterised statement built once per query, sharing the instrumentation
+    of its shape with the other statements of that shape.
+    """
+
+    __slots__ = ("key", "shape", "sql", "stats")
+
+    def __init__(self, key, shape, sql, stats):
+        self.key = key
+        self.shape = shape
+        self.sql = sql
+        self.stats = stats
+
+    def __repr__(self):
+        return self.sql
+
+    def record(self, elapsed, rows=0, error=False):
+        self.stats.record(elapsed, rows, error)
+
+
+class StatementCache:
+    """
+    Client-side cache of the SQL text for each query shape issued through a
+    connector.
+
+    A shape is the operation, table, columns and WHERE/GROUP BY/ORDER BY
+    fragments of a query with its values left as placeholders, so a hot query
+    such as a job fetch is built once and then only its parameters change
+    between calls.
+
+    Args:
+        placeholder (str): Parameter marker used by the driver ("%s" or "?").
+        lock_clause (str): Row-locking suffix appended to claim selects.
+        stats (QueryStats): Instrumentation the statements record into.
+    """
+
+    def __init__(
+        self, placeholder="%s", lock_clause=" FOR UPDATE SKIP LOCKED", stats=None
+    ):
+        self.placeholder = placeholder
+        self.lock_clause = lock_clause
+        self.stats = stats if stats is not None else QueryStats()
+        self._statements = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._statements)
+
+    def get(
+        self,
+        operation,
+        table,
+        columns="",
+        where_clause=None,
+        orderby=None,
+        n_values=0,
+        n_rows=1,
+        groupby=None,
+    ):
+        key = (
+            operation,
+            table,
+            columns,
+            where_clause,
+            orderby,
+            n_values,
+            n_rows,
+            groupby,
+        )
+        statement = self._statements.get(key)
+        if statement is None:
+            sql = self._build(
+                operation,
+                table,
+                columns,
+                where_clause,
+                orderby,
+                n_values,
+                n_rows,
+                groupby,
+            )
+            if operation == "claim":
+                sql += self.lock_clause
+            if self.placeholder != "%s":
+                sql = sql.replace("%s", self.placeholder)
+            shape = f"{operation} {table}"
+            if where_clause:
+                shape += f" WHERE {normalize(where_clause)}"
+            if groupby:
+                shape += f" GROUP BY {groupby}"
+            with self._lock:
+                statement = self._statements.setdefault(
+                    key, Statement(key, shape, sql, self.stats.shape(shape))
+                )
+        return statement
+
+    def __iter__(self):
+        """
+        Iterate over the statements built so far.
+        """
+        with self._lock:
+            return iter(list(self._statements.values()))
+
+    def clear(self):
+        with self._lock:
+            self._statements = {}
+
+    @staticmethod
+    def _build(
+        operation, table, columns, where_clause, orderby, n_values, n_rows, groupby
+    ):
+        if operation == "insert":
+            row = "(" + ", ".join(["%s"] * n_values) + ")"
+            return f"INSERT INTO {table} {columns} VALUES " + ", ".join([row] * n_rows)
+        if operation in ("select", "select_one", "stream"):
+            query = f"SELECT {columns} FROM {table} WHERE {where_clause}"
+            if groupby is not None:
+                query += f" GROUP BY {groupby}"
+            if orderby is not None:
+                query += f" ORDER BY {orderby}"
+            return query
+        if operation == "claim":
+            query = f"SELECT {columns} FROM {table} WHERE {where_clause}"
+            if orderby is not None:
+                query += f" ORDER BY {orderby}"
+            return query + f" LIMIT {n_rows}"
+        if operation == "update":
+            return f"UPDATE {table} SET {columns} WHERE {where_clause}"
+        if operation == "update_ids":
+            placeholders = ", ".join(["%s"] * n_values)
+            return f"UPDATE {table} SET {columns} WHERE `id` IN ({placeholders})"
+        if operation == "delete":
+            return f"DELETE FROM {table} WHERE {where_clause}"
+        if operation == "delete_ids":
+            placeholders = ", ".join(["%s"] * n_values)
+            return f"DELETE FROM {table} WHERE `id` IN ({placeholders})"
+        raise ValueError(f"Unknown operation: {operation}")
@@ -0,0 +1,796 @@
+import itertools
+import operator
+import re
+import threading
+from contextlib import contextmanager
+from time import perf_counter
+
+from .base import DBQConnector
+
+# Primary key column and secondary indexes of each table. Every index maps the
+# tuple of its column values to the set of primary keys of the matching rows.
+TABLES = {
+    "session": ("id", [("session_id",)]),
+    "pool": ("id", [("session_id", "node_id"), ("session_id",)]),
+    "job_queue": (
+        "id",
+        [
+            ("session_id", "to_id", "status_code"),
+            ("session_id", "job_id"),
+            ("session_id", "round_id"),
+            ("session_id", "claimed_by", "status_code"),
+            ("session_id", "type"),
+            ("session_id",),
+        ],
+    ),
+    "job_feed": ("seq", [("session_id", "to_id"), ("session_id",)]),
+    "job_history": (
+        "id",
+        [("session_id", "job_id"), ("session_id", "round_id"), ("session_id",)],
+    ),
+    "broadcast": ("id", [("session_id", "broadcast_id"), ("session_id",)]),
+    "checkpoint": ("id", [("session_id", "node_id", "type")]),
+    "results": ("id", [("session_id", "job_id")]),
+}
+
+DEFAULTS = {"job_queue": {"status_code": 0, "attempts": 0}}
+
+TOKEN = re.compile(
+    r"\s*(?:"
+    r"`(?P<quoted>[^`]+)`"
+    r"|'(?P<string>(?:[^']|'')*)'"
+    r"|(?P<param>%s|\?)"
+    r"|(?P<number>\d+\.\d*|\d+)"
+    r"|(?P<op><=|>=|<>|!=|=|<|>|\(|\)|,|\*|\+|-)"
+    r"|(?P<word>[A-Za-z_][A-Za-z_0-9]*)"
+    r")"
+)
+
+COMPARISONS = {
+    "=": operator.eq,
+    "!=": operator.ne,
+    "<>": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+}
+
+AGGREGATES = {
+    "COUNT": len,
+    "MAX": lambda values: max(values) if values else None,
+    "MIN": lambda values: min(values) if values else None,
+    "SUM": lambda values: sum(values) if values else None,
+}
+
+
+class InMemoryConnector(DBQConnector):
+    """
+    In-process dbqueue backend for simulations and benchmarks.
+
+    Rows live in per-table dicts keyed by an auto-increment primary key, and
+    secondary indexes map column tuples such as (`session_id`, `to_id`,
+    `status_code`) to the matching keys (see `TABLES`). Each query shape the
+    dbqueue classes issue is compiled once into Python predicates, so a call
+    costs an index lookup plus a filter over the candidate rows, with no SQL
+    parsing and no I/O.
+
+    The supported WHERE grammar covers what the dbqueue classes issue:
+    comparisons, `IN`/`NOT IN`, `IS [NOT] NULL`, `AND`/`OR`/`NOT`, parentheses
+    and `+`/`-` between columns, literals and placeholders. Selects may use
+    `COUNT`, `MAX`, `MIN` and `SUM`, with or without `DISTINCT`, optionally
+    with `GROUP BY` over columns. Raw SQL through `transaction` is not
+    supported.
+
+    All operations hold one lock, so the connector can be shared by many
+    `Daemon` objects across threads. Each thread queues its own batch, which
+    runs under the lock and so atomically with respect to other threads.
+
+    Args:
+        poll_delay (float): Unused, kept for interface compatibility.
+        max_retries (int): Unused, kept for interface compatibility.
+        replicas (list): Read replicas, as connectors.
+        max_staleness (float): Maximum replica lag in seconds for reads.
+        lag_check_interval (float): Seconds between replica lag checks.
+    """
+
+    dialect = "memory"
+    lock_clause = ""
+
+    def __init__(
+        self,
+        poll_delay=0,
+        max_retries=1,
+        replicas=None,
+        max_staleness=5.0,
+        lag_check_interval=1.0,
+    ):
+        super().__init__(
+            poll_delay=poll_delay,
+            max_retries=max_retries,
+            replicas=replicas,
+            max_staleness=max_staleness,
+            lag_check_interval=lag_check_interval,
+        )
+        self.tables = {}
+        self._plans = {}
+        self._lock = threading.RLock()
+
+    def insert_many(self, table, columns, rows, chunk_size=500, queue_query=False):
+        rows = [tuple(row) for row in rows]
+        if not rows:
+            return 0
+        statement = self.statements.get("insert", table, columns, n_values=len(rows[0]))
+        if queue_query:
+            for row in rows:
+                self.query_queue.append(("insert", statement, row))
+            return len(rows)
+        start = perf_counter()
+        with self._lock:
+            for row in rows:
+                self._execute(statement, row)
+        statement.record(perf_counter() - start)
+        return len(rows)
+
+    def update_rows(self, table, set_values, where_clause, params=None):
+        statement = self.statements.get("update", table, set_values, where_clause)
+        params = tuple(params or ())
+        start = perf_counter()
+        with self._lock:
+            plan = self._plan(statement)
+            matches = self._matches(plan, params[plan["n_set"] :])
+            for key, row in matches:
+                plan["table"].update(key, plan["set"](row, params))
+        statement.record(perf_counter() - start, len(matches))
+        return len(matches)
+
+    def claim(
+        self,
+        table,
+        columns,
+        where_clause,
+        set_values,
+        params=None,
+        set_params=None,
+        orderby=None,
+        n=1,
+    ):
+        select = self.statements.get(
+            "claim", table, columns, where_clause, orderby, n_rows=n
+        )
+        update = self.statements.get("update_ids", table, set_values, n_values=1)
+        start = perf_counter()
+        with self._lock:
+            plan = self._plan(select)
+            matches = self._matches(plan, tuple(params or ()))[:n]
+            set_plan = self._plan(update)
+            # Project before updating, as the SQL connectors return the rows
+            # as they were selected
+            rows = [plan["project"]([row]) for _, row in matches]
+            for key, row in matches:
+                plan["table"].update(key, set_plan["set"](row, tuple(set_params or ())))
+        select.record(perf_counter() - start, len(rows))
+        return rows
+
+    def move(
+        self,
+        table,
+        to_table,
+        columns,
+        to_columns,
+        where_clause,
+        params=None,
+        extra_values=(),
+        n=500,
+    ):
+        select = self.statements.get("claim", table, columns, where_clause, n_rows=n)
+        extra_values = tuple(extra_values)
+        start = perf_counter()
+        with self._lock:
+            plan = self._plan(select)
+            matches = self._matches(plan, tuple(params or ()))[:n]
+            rows = [plan["project"]([row]) + extra_values for _, row in matches]
+            if rows:
+                insert = self.statements.get(
+                    "insert", to_table, to_columns, n_values=len(rows[0])
+                )
+                for (key, _), row in zip(matches, rows):
+                    self._execute(insert, row)
+                    plan["table"].delete(key)
+        select.record(perf_counter() - start, len(rows))
+        return len(rows)
+
+    def transition(
+        self,
+        table,
+        columns,
+        where_clause,
+        set_values,
+        log_table,
+        log_columns,
+        params=None,
+        set_params=None,
+        extra_values=(),
+        n=500,
+    ):
+        select = self.statements.get("claim", table, columns, where_clause, n_rows=n)
+        update = self.statements.get("update_ids", table, set_values, n_values=1)
+        extra_values = tuple(extra_values)
+        start = perf_counter()
+        with self._lock:
+            plan = self._plan(select)
+            matches = self._matches(plan, tuple(params or ()))[:n]
+            set_plan = self._plan(update)
+            rows = [plan["project"]([row]) + extra_values for _, row in matches]
+            for key, row in matches:
+                plan["table"].update(key, set_plan["set"](row, tuple(set_params or ())))
+            if rows:
+                insert = self.statements.get(
+                    "insert", log_table, log_columns, n_values=len(rows[0])
+                )
+                for row in rows:
+                    self._execute(insert, row)
+        select.record(perf_counter() - start, len(rows))
+        return len(rows)
+
+    @contextmanager
+    def transaction(self):
+        raise NotImplementedError("The in-memory connector does not execute raw SQL")
+        yield  # pragma: no cover
+
+    def close(self):
+        with self._lock:
+            self.tables = {}
+
+    def _run(self, operation, statement, params, limit, queue_query):
+        params = tuple(params) if params is not None else ()
+        if queue_query:
+            self.query_queue.append((operation, statement, params))
+            return True
+        start = perf_counter()
+        with self._lock:
+            result = self._execute(statement, params)
+        statement.record(perf_counter() - start, _n_rows(operation, result))
+        return result
+
+    def _execute_query(
+        self,
+        query,
+        params=(),
+        select=False,
+        select_one=False,
+        limit=10,
+        timer=None,
+    ):
+        raise NotImplementedError("The in-memory connector does not execute raw SQL")
+
+    def _stream_query(self, statement, params, chunk_size, timer):
+        with self._lock:
+            rows = self._execute(statement, params) or []
+        for i in range(0, len(rows), chunk_size):
+            yield rows[i : i + chunk_size]
+
+    def _execute_query_queue(self, limit=10):
+        query_queue = self._take_query_queue()
+        with self._lock:
+            # Compile everything first so a malformed statement cannot leave
+            # the batch half applied
+            for _, statement, _ in query_queue:
+                self._plan(statement)
+            results = []
+            for operation, statement, params in query_queue:
+                start = perf_counter()
+                result = self._execute(statement, params)
+                statement.record(perf_counter() - start, _n_rows(operation, result))
+                results.append(result)
+            return results
+
+    def _execute(self, statement, params):
+        plan = self._plan(statement)
+        operation = plan["operation"]
+        table = plan["table"]
+        if operation == "insert":
+            row = dict(DEFAULTS.get(table.name, {}))
+            row.update(zip(plan["columns"], params))
+            table.insert(row)
+            return True
+        if operation == "update":
+            n_set = plan["n_set"]
+            for key, row in self._matches(plan, params[n_set:]):
+                table.update(key, plan["set"](row, params))
+            return True
+        if operation == "delete":
+            for key, _ in self._matches(plan, params):
+                table.delete(key)
+            return True
+
+        rows = [row for _, row in self._matches(plan, params)]
+        if plan["group"] is not None:
+            groups = {}
+            for row in rows:
+                key = tuple(row.get(column) for column in plan["group"])
+                groups.setdefault(key, []).append(row)
+            rows = [plan["project"](group) for group in groups.values()]
+        elif plan["aggregate"]:
+            rows = [plan["project"](rows)]
+        else:
+            rows = [plan["project"]([row]) for row in rows]
+        if operation == "select_one":
+            return rows[0] if rows else None
+        return rows or None
+
+    def _matches(self, plan, params):
+        table = plan["table"]
+        keys = table.lookup(plan["index"], plan["probe"], params)
+        if keys is None:
+            items = table.rows.items()
+        else:
+            items = ((key, table.rows[key]) for key in keys if key in table.rows)
+        where = plan["where"]
+        matches = [(key, row) for key, row in items if where(row, params)]
+        if plan["order"] is not None:
+            for column, descending in reversed(plan["order"]):
+                matches.sort(
+                    key=lambda item: _sort_key(item[1].get(column)), reverse=descending
+                )
+        elif keys is not None:
+            matches.sort(key=operator.itemgetter(0))
+        return matches
+
+    def _plan(self, statement):
+        plan = self._plans.get(statement.key)
+        if plan is None:
+            plan = self._compile(statement.key)
+            self._plans[statement.key] = plan
+        return plan
+
+    def _compile(self, key):
+        operation, table_name, columns, where_clause, orderby, _, _, groupby = key
+        table = self._table(table_name)
+        plan = {
+            "operation": operation,
+            "table": table,
+            "where": _true,
+            "index": None,
+            "probe": [],
+            "order": None,
+            "aggregate": False,
+            "group": None,
+        }
+        if operation == "insert":
+            plan["columns"] = [name for name in _identifiers(columns)]
+            return plan
+
+        n_set = 0
+        if operation in ("update", "update_ids"):
+            plan["set"], n_set = _compile_set(columns)
+            plan["n_set"] = n_set
+        if operation == "update_ids":
+            return plan
+
+        if where_clause is not None:
+            parser = _Parser(where_clause)
+            tree = parser.parse_expression()
+            parser.expect_end()
+            terms = tree[1] if tree[0] == "and" else [tree]
+            equalities = _equalities(terms)
+            index = table.best_index(equalities)
+            if index is not None:
+                # Conditions answered by the index probe are not re-checked
+                plan["index"] = index
+                plan["probe"] = [equalities[column][0] for column in index]
+                covered = {id(equalities[column][1]) for column in index}
+                terms = [term for term in terms if id(term) not in covered]
+            if terms:
+                plan["where"] = _compile_predicate(("and", terms))
+        if operation in ("select", "select_one", "stream", "claim"):
+            plan["project"], plan["aggregate"] = _compile_columns(table, columns)
+        if groupby is not None:
+            plan["group"] = [name for name in _identifiers(groupby)]
+        if orderby is not None:
+            plan["order"] = _compile_order(orderby)
+        return plan
+
+    def _table(self, name):
+        table = self.tables.get(name)
+        if table is None:
+            key, indexes = TABLES.get(name, ("id", []))
+            table = _Table(name, key, indexes)
+            self.tables[name] = table
+        return table
+
+
+class _Table:
+    def __init__(self, name, key, indexes):
+        self.name = name
+        self.key = key
+        self.columns = [key]
+        self.rows = {}
+        self.indexes = {columns: {} for columns in indexes}
+        self._next_key = 1
+
+    def insert(self, row):
+        key = row.get(self.key)
+        if key is None:
+            key = self._next_key
+            row[self.key] = key
+        self._next_key = max(self._next_key, key + 1)
+        for column in row:
+            if column not in self.columns:
+                self.columns.append(column)
+        self.rows[key] = row
+        for columns, index in self.indexes.items():
+            index.setdefault(tuple(row.get(c) for c in columns), set()).add(key)
+
+    def update(self, key, changes):
+        row = self.rows[key]
+        for columns, index in self.indexes.items():
+            if any(column in changes for column in columns):
+                self._unindex(index, columns, row, key)
+                index.setdefault(
+                    tuple(changes.get(c, row.get(c)) for c in columns), set()
+                ).add(key)
+        for column in changes:
+            if column not in self.columns:
+                self.columns.append(column)
+        row.update(changes)
+
+    def delete(self, key):
+        row = self.rows.pop(key)
+        for columns, index in self.indexes.items():
+            self._unindex(index, columns, row, key)
+
+    def best_index(self, equalities):
+        """
+        Return the index covering the most of the `equalities` columns, or None
+        if no index applies.
+        """
+        best = None
+        for columns in self.indexes:
+            if all(c in equalities for c in columns):
+                if best is None or len(columns) > len(best):
+                    best = columns
+        return best
+
+    def lookup(self, index, probe, params):
+        """
+        Return the keys of the rows whose `index` columns equal one of the values
+        given by `probe`, or None to scan the whole table.
+        """
+        if index is None:
+            return None
+        choices = [
+            [value for value in values(params) if value is not None] for values in probe
+        ]
+        keys = set()
+        lookup = self.indexes[index]
+        for values in itertools.product(*choices):
+            keys.update(lookup.get(values, ()))
+        return keys
+
+    @staticmethod
+    def _unindex(index, columns, row, key):
+        values = tuple(row.get(c) for c in columns)
+        keys = index.get(values)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del index[values]
+
+
+class _Parser:
+    def __init__(self, text):
+        self.tokens = _tokenize(text)
+        self.position = 0
+        self.n_params = 0
+
+    def peek(self, offset=0):
+        position = self.position + offset
+        if position < len(self.tokens):
+            return self.tokens[position]
+        return (None, None)
+
+    def next(self):
+        token = self.peek()
+        self.position += 1
+        return token
+
+    def accept_word(self, *words):
+        kind, value = self.peek()
+        if kind == "word" and value.upper() in words:
+            self.position += 1
+            return value.upper()
+        return None
+
+    def accept_op(self, op):
+        if self.peek() == ("op", op):
+            self.position += 1
+            return True
+        return False
+
+    def expect_op(self, op):
+        if not self.accept_op(op):
+            raise ValueError(f"Expected '{op}' at token {self.peek()}")
+
+    def expect_end(self):
+        if self.position != len(self.tokens):
+            raise ValueError(f"Unexpected token {self.peek()}")
+
+    def parse_expression(self):
+        terms = [self.parse_and()]
+        while self.accept_word("OR"):
+            terms.append(self.parse_and())
+        return terms[0] if len(terms) == 1 else ("or", terms)
+
+    def parse_and(self):
+        terms = [self.parse_not()]
+        while self.accept_word("AND"):
+            terms.append(self.parse_not())
+        return terms[0] if len(terms) == 1 else ("and", terms)
+
+    def parse_not(self):
+        if self.accept_word("NOT"):
+            return ("not", self.parse_not())
+        return self.parse_predicate()
+
+    def parse_predicate(self):
+        if self.peek() == ("op", "("):
+            self.position += 1
+            tree = self.parse_expression()
+            self.expect_op(")")
+            return tree
+        left = self.parse_value()
+        kind, value = self.peek()
+        if kind == "op" and value in COMPARISONS:
+            self.position += 1
+            return ("cmp", value, left, self.parse_value())
+        negate = bool(self.accept_word("NOT"))
+        if self.accept_word("IN"):
+            self.expect_op("(")
+            values = [self.parse_value()]
+            while self.accept_op(","):
+                values.append(self.parse_value())
+            self.expect_op(")")
+            return ("in", left, values, negate)
+        if self.accept_word("IS"):
+            negate = bool(self.accept_word("NOT"))
+            if not self.accept_word("NULL"):
+                raise ValueError(f"Expected NULL at token {self.peek()}")
+            return ("isnull", left, negate)
+        raise ValueError(f"Unexpected token {self.peek()}")
+
+    def parse_value(self):
+        value = self.parse_term()
+        while True:
+            if self.accept_op("+"):
+                value = ("add", value, self.parse_term())
+            elif self.accept_op("-"):
+                value = ("sub", value, self.parse_term())
+            else:
+                return value
+
+    def parse_term(self):
+        kind, value = self.next()
+        if kind == "quoted":
+            return ("col", value)
+        if kind == "word":
+            if value.upper() == "NULL":
+                return ("lit", None)
+            return ("col", value)
+        if kind == "string":
+            return ("lit", value.replace("''", "'"))
+        if kind == "number":
+            return ("lit", float(value) if "." in value else int(value))
+        if kind == "param":
+            self.n_params += 1
+            return ("param", self.n_params - 1)
+        if kind == "op" and value == "-":
+            return ("sub", ("lit", 0), self.parse_term())
+        raise ValueError(f"Unexpected token {(kind, value)}")
+
+
+def _tokenize(text):
+    tokens = []
+    position = 0
+    text = text.rstrip()
+    while position < len(text):
+        match = TOKEN.match(text, position)
+        if match is None or match.end() == position:
+            raise ValueError(f"Cannot parse {text[position:]!r}")
+        position = match.end()
+        kind = match.lastgroup
+        tokens.append((kind, match.group(kind)))
+    return tokens
+
+
+def _identifiers(text):
+    return [value for kind, value in _tokenize(text) if kind in ("quoted", "word")]
+
+
+def _compile_value(tree, offset=0):
+    kind = tree[0]
+    if kind == "col":
+        name = tree[1]
+        return lambda row, params: row.get(name)
+    if kind == "lit":
+        value = tree[1]
+        return lambda row, params: value
+    if kind == "param":
+        index = tree[1] + offset
+        return lambda row, params: params[index]
+    left = _compile_value(tree[1], offset)
+    right = _compile_value(tree[2], offset)
+    combine = operator.add if kind == "add" else operator.sub
+    return lambda row, params: combine(left(row, params), right(row, params))
+
+
+def _compile_predicate(tree):
+    kind = tree[0]
+    if kind == "and":
+        terms = [_compile_predicate(term) for term in tree[1]]
+        return lambda row, params: all(term(row, params) for term in terms)
+    if kind == "or":
+        terms = [_compile_predicate(term) for term in tree[1]]
+        return lambda row, params: any(term(row, params) for term in terms)
+    if kind == "not":
+        term = _compile_predicate(tree[1])
+        return lambda row, params: not term(row, params)
+    if kind == "isnull":
+        value = _compile_value(tree[1])
+        negate = tree[2]
+        return lambda row, params: (value(row, params) is None) != negate
+    if kind == "in":
+        value = _compile_value(tree[1])
+        choices = [_compile_value(choice) for choice in tree[2]]
+        negate = tree[3]
+
+        def contains(row, params):
+            x = value(row, params)
+            if x is None:
+                return False
+            return (
+                any(_compare(operator.eq, x, c(row, params)) for c in choices) != negate
+            )
+
+        return contains
+    if kind == "cmp":
+        compare = COMPARISONS[tree[1]]
+        left = _compile_value(tree[2])
+        right = _compile_value(tree[3])
+        return lambda row, params: _compare(
+            compare, left(row, params), right(row, params)
+        )
+    raise ValueError(f"Cannot compile {tree}")
+
+
+def _compare(compare, x, y):
+    if x is None or y is None:
+        return False
+    try:
+        return compare(x, y)
+    except TypeError:
+        # Mirror MySQL's numeric coercion of mixed string/number comparisons
+        try:
+            return compare(float(x), float(y))
+        except (TypeError, ValueError):
+            return False
+
+
+def _equalities(terms):
+    """
+    Return {column: (values(params), term)} for the `column = value` and
+    `column IN (...)` conditions among the ANDed `terms`.
+    """
+    equalities = {}
+    for term in terms:
+        if term[0] == "cmp" and term[1] == "=" and term[2][0] == "col":
+            if term[3][0] in ("lit", "param"):
+                value = _compile_value(term[3])
+                equalities.setdefault(
+                    term[2][1],
+                    (lambda params, value=value: [value(None, params)], term),
+                )
+        elif term[0] == "in" and not term[3] and term[1][0] == "col":
+            if all(choice[0] in ("lit", "param") for choice in term[2]):
+                choices = [_compile_value(choice) for choice in term[2]]
+                equalities.setdefault(
+                    term[1][1],
+                    (
+                        lambda params, choices=choices: [
+                            c(None, params) for c in choices
+                        ],
+                        term,
+                    ),
+                )
+    return equalities
+
+
+def _compile_set(text):
+    parser = _Parser(text)
+    assignments = []
+    while True:
+        kind, column = parser.next()
+        if kind not in ("quoted", "word"):
+            raise ValueError(f"Expected a column in SET clause {text!r}")
+        parser.expect_op("=")
+        assignments.append((column, _compile_value(parser.parse_value())))
+        if not parser.accept_op(","):
+            break
+    parser.expect_end()
+
+    def apply(row, params):
+        return {column: value(row, params) for column, value in assignments}
+
+    return apply, parser.n_params
+
+
+def _compile_columns(table, text):
+    parser = _Parser(text)
+    getters = []
+    aggregate = False
+    while True:
+        kind, value = parser.next()
+        if (kind, value) == ("op", "*"):
+            getters.append(("star", None))
+        elif kind == "word" and value.upper() in AGGREGATES and parser.accept_op("("):
+            function = AGGREGATES[value.upper()]
+            distinct = parser.accept_word("DISTINCT")
+            if parser.accept_op("*"):
+                column = None
+            else:
+                column = parser.next()[1]
+            parser.expect_op(")")
+            getters.append(("aggregate", (function, column, distinct)))
+            aggregate = True
+        elif kind in ("quoted", "word"):
+            getters.append(("col", value))
+        else:
+            raise ValueError(f"Cannot select {text!r}")
+        if not parser.accept_op(","):
+            break
+    parser.expect_end()
+
+    def project(rows):
+        out = []
+        for kind, getter in getters:
+            if kind == "star":
+                out.extend(rows[0].get(column) for column in table.columns)
+            elif kind == "col":
+                out.append(rows[0].get(getter) if rows else None)
+            else:
+                function, column, distinct = getter
+                if column is None:
+                    out.append(function(rows))
+                else:
+                    values = [row.get(column) for row in rows]
+                    values = [v for v in values if v is not None]
+                    if distinct:
+                        values = list(dict.fromkeys(values))
+                    out.append(function(values))
+        return tuple(out)
+
+    return project, aggregate
+
+
+def _compile_order(text):
+    order = []
+    for part in text.split(","):
+        words = _tokenize(part)
+        descending = len(words) > 1 and words[1][1].upper() == "DESC"
+        order.append((words[0][1], descending))
+    return order
+
+
+def _sort_key(value):
+    # NULLs sort first, as in MySQL
+    return (value is not None, value)
+
+
+def _n_rows(operation, result):
+    if not result or operation not in ("select", "select_one"):
+        return 0
+    return len(result) if operation == "select" else 1
+
+
+def _true(row, params):
+    return True
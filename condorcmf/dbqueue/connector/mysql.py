@@ -1,160 +1,234 @@
 import logging
+import threading
 import time
+from contextlib import contextmanager
 
 import mysql.connector  # type: ignore
 
-from condorcmf import definitions
+from .base import DBQConnector
+from .stats import NULL_TIMER
 
 """
 TO DO
     - Add docstrings
 """
 
+# Too many connections, lock wait timeout, deadlock
+TRANSIENT_ERRORS = (1040, 1205, 1213)
 
-class MySQLConnector:
-    def __init__(self, host, user, password, database, poll_delay=5, max_retries=5):
+
+def is_transient(error):
+    """
+    Return True if `error` is worth retrying after a short wait.
+    """
+    return error.errno in TRANSIENT_ERRORS or "polling too quickly" in str(error)
+
+
+class MySQLConnector(DBQConnector):
+    def __init__(
+        self,
+        host,
+        user,
+        password,
+        database,
+        poll_delay=5,
+        max_retries=5,
+        replicas=None,
+        max_staleness=5.0,
+        lag_check_interval=1.0,
+    ):
         self.host = host
         self.user = user
         self.password = password
         self.database = database
-        self.poll_delay = poll_delay
-        self.max_retries = max_retries
         self.connection = None
         self.cursor = None
+        # The connection and its cursor are shared, so statements from the
+        # heartbeat and prefetch threads of a `Daemon` are serialised
+        self._lock = threading.RLock()
+        super().__init__(
+            poll_delay=poll_delay,
+            max_retries=max_retries,
+            replicas=replicas,
+            max_staleness=max_staleness,
+            lag_check_interval=lag_check_interval,
+        )
+
+    def _replica(self, endpoint):
+        options = {"host": endpoint} if isinstance(endpoint, str) else dict(endpoint)
+        kwargs = dict(
+            host=self.host,
+            user=self.user,
+            password=self.password,
+            database=self.database,
+            poll_delay=self.poll_delay,
+            max_retries=self.max_retries,
+        )
+        kwargs.update(options)
+        return MySQLConnector(**kwargs)
+
+    def replication_lag(self):
+        with self._lock:
+            if self.connection is None or not self.connection.is_connected():
+                self.connect()
+            cursor = self.connection.cursor(dictionary=True)
+            try:
+                try:
+                    cursor.execute("SHOW REPLICA STATUS")
+                except mysql.connector.ProgrammingError:
+                    cursor.execute("SHOW SLAVE STATUS")
+                status = cursor.fetchone()
+                cursor.fetchall()
+            finally:
+                cursor.close()
+        if not status:
+            return 0.0
+        lag = status.get("Seconds_Behind_Source", status.get("Seconds_Behind_Master"))
+        return None if lag is None else float(lag)
 
     def connect(self):
-        if self.connection is not None and self.connection.is_connected():
-            logging.warning("Already connected to MySQL database")
-            return
-        try:
-            self.connection = mysql.connector.connect(
-                host=self.host,
-                user=self.user,
-                password=self.password,
-                database=self.database,
-            )
-            self.cursor = self.connection.cursor()
-            logging.info("Connected to MySQL database")
-        except mysql.connector.Error as error:
-            logging.error("Failed to connect to MySQL database: {}".format(error))
+        with self._lock:
+            if self.connection is not None and self.connection.is_connected():
+                logging.warning("Already connected to MySQL database")
+                return
+            start = time.perf_counter()
+            try:
+                self.connection = mysql.connector.connect(
+                    host=self.host,
+                    user=self.user,
+                    password=self.password,
+                    database=self.database,
+                    autocommit=True,
+                )
+                self.cursor = self.connection.cursor()
+                self.stats.record_connect(time.perf_counter() - start)
+                logging.debug("Connected to MySQL database")
+            except mysql.connector.Error as error:
+                self.stats.record_event(error)
+                logging.error("Failed to connect to MySQL database: {}".format(error))
 
     def disconnect(self):
-        if self.connection.is_connected():
-            self.cursor.close()
-            self.connection.close()
-            logging.info("Disconnected from MySQL database")
+        with self._lock:
+            if self.connection.is_connected():
+                self.cursor.close()
+                self.connection.close()
+                logging.debug("Disconnected from MySQL database")
 
-    def insert(self, table, columns, values, limit=definitions.MYSQL_MAX_POLL_ATTEMPTS):
-        try:
-            self.cursor.execute(
-                "INSERT INTO {} {} VALUES {}".format(table, columns, values)
-            )
-            self.connection.commit()
-            logging.info(f"Inserted row into {table} table {values}")
-        except mysql.connector.Error as error:
-            logging.error(f"Error inserting row into {table} table: {error}")
-            if "polling too quickly" in str(error):
-                logging.error(
-                    f"Waiting {self.poll_delay} seconds before retrying {limit} attempts left..."
-                )
-                if limit > 1:
-                    time.sleep(self.poll_delay)
-                    self.insert(table, values)
-            return False
-        return True
+    @contextmanager
+    def transaction(self):
+        """
+        Run the statements issued on the yielded cursor in a single
+        transaction, holding the connection for the whole block.
+        """
+        with self._lock:
+            if self.connection is None or not self.connection.is_connected():
+                self.connect()
+            self.connection.start_transaction()
+            cursor = self.connection.cursor()
+            try:
+                yield cursor
+                self.connection.commit()
+            except BaseException:
+                self.connection.rollback()
+                raise
+            finally:
+                cursor.close()
 
-    def select(
+    def _execute_query(
         self,
-        table,
-        columns,
-        where_clause,
-        orderby=None,
-        limit=definitions.MYSQL_MAX_POLL_ATTEMPTS,
+        query,
+        params=(),
+        select=False,
+        select_one=False,
+        limit=10,
+        timer=NULL_TIMER,
     ):
         try:
-            query = f"SELECT {columns} FROM {table} WHERE {where_clause}"
-            if orderby is not None:
-                query += f" ORDER BY {orderby}"
-            self.cursor.execute(query)
-            result = self.cursor.fetchall()
-            logging.info(f"Selected row(s) from {table} table")
+            # Hold the lock for the statement only, not while waiting to retry
+            with self._lock:
+                if self.connection is None or not self.connection.is_connected():
+                    self.connect()
+                timer.lap("connect")
+                self.cursor.execute(query, params or None)
+                timer.lap("execute")
+                if select:
+                    result = self.cursor.fetchall()
+                elif select_one:
+                    result = self.cursor.fetchone()
+                    # Drain any remaining rows so the cursor can be reused
+                    self.cursor.fetchall()
+                else:
+                    return True
+                timer.lap("fetch")
+                timer.fetched(result, many=select)
         except mysql.connector.Error as error:
-            logging.error(f"Error selecting row(s) from {table} table: {error}")
-            if "polling too quickly" in str(error):
+            logging.error(f"Error executing query {query}: {error}")
+            if is_transient(error) and limit > 1:
                 logging.error(
                     f"Waiting {self.poll_delay} seconds before retrying {limit} attempts left..."
                 )
-                if limit > 1:
-                    limit -= 1
-                    time.sleep(self.poll_delay)
-                    self.select(table, columns, where_clause)
-            return False
-        return result
-
-    def select_one(
-        self,
-        table,
-        columns,
-        where_clause,
-        orderby=None,
-        limit=definitions.MYSQL_MAX_POLL_ATTEMPTS,
-    ):
-        try:
-            query = f"SELECT {columns} FROM {table} WHERE {where_clause}"
-            if orderby is not None:
-                query += f" ORDER BY {orderby}"
-            self.cursor.execute(query)
-            result = self.cursor.fetchone()
-            logging.info(f"Selected row(s) from {table} table")
-        except mysql.connector.Error as error:
-            logging.error(f"Error selecting row(s) from {table} table: {error}")
-            if "polling too quickly" in str(error):
-                logging.error(
-                    f"Waiting {self.poll_delay} seconds before retrying {limit} attempts left..."
+                time.sleep(self.poll_delay)
+                timer.retry(error)
+                return self._execute_query(
+                    query, params, select, select_one, limit - 1, timer
                 )
-                if limit > 1:
-                    limit -= 1
-                    time.sleep(self.poll_delay)
-                    self.select(table, columns, where_clause)
             return False
+        if not result:
+            return None
         return result
 
-    def update(
-        self, table, set_values, where_clause, limit=definitions.MYSQL_MAX_POLL_ATTEMPTS
-    ):
+    def _stream_query(self, statement, params, chunk_size, timer):
+        """
+        Read the rows through an unbuffered cursor on a dedicated connection,
+        `chunk_size` rows at a time, so other queries can use the shared
+        connection while the stream is open.
+        """
         try:
-            self.cursor.execute(
-                "UPDATE {} SET {} WHERE {}".format(table, set_values, where_clause)
+            connection = mysql.connector.connect(
+                host=self.host,
+                user=self.user,
+                password=self.password,
+                database=self.database,
+                autocommit=True,
             )
-            self.connection.commit()
-            logging.info(f"Updated row(s) in {table} table {set_values}")
         except mysql.connector.Error as error:
-            logging.error(f"Error updating row(s) in {table} table: {error}")
-            if "polling too quickly" in str(error):
-                logging.error(
-                    f"Waiting {self.poll_delay} seconds before retrying {limit} attempts left..."
-                )
-                if limit > 1:
-                    limit -= 1
-                    time.sleep(self.poll_delay)
-                    self.update(table, set_values, where_clause)
-            return False
-        return True
-
-    def delete(self, table, where_clause, limit=definitions.MYSQL_MAX_POLL_ATTEMPTS):
+            self.stats.record_event(error)
+            raise RuntimeError(f"Error streaming query {statement.sql}: {error}")
+        timer.lap("connect")
         try:
-            self.cursor.execute("DELETE FROM {} WHERE {}".format(table, where_clause))
-            self.connection.commit()
-            logging.info(f"Deleted row(s) from {table} table")
+            cursor = connection.cursor()
+            cursor.execute(statement.sql, params or None)
+            timer.lap("execute")
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                timer.lap("fetch")
+                if not rows:
+                    return
+                yield rows
         except mysql.connector.Error as error:
-            logging.error(f"Error deleting row(s) from {table} table: {error}")
-            if "polling too quickly" in str(error):
-                logging.error(
-                    f"Waiting {self.poll_delay} seconds before retrying {limit} attempts left..."
-                )
-                if limit > 1:
+            raise RuntimeError(f"Error streaming query {statement.sql}: {error}")
+        finally:
+            try:
+                connection.close()
+            except mysql.connector.Error:
+                pass
+
+    def _execute_query_queue(self, limit=10):
+        query_queue = self._take_query_queue()
+        while True:
+            try:
+                with self.transaction() as cursor:
+                    return self._execute_queued(cursor, query_queue)
+            except mysql.connector.Error as error:
+                logging.error(f"Error executing query queue: {error}")
+                if is_transient(error) and limit > 1:
+                    self.stats.record_event(error, shape="queue")
                     limit -= 1
+                    logging.error(
+                        f"Waiting {self.poll_delay} seconds before retrying {limit} attempts left..."
+                    )
                     time.sleep(self.poll_delay)
-                    self.delete(table, where_clause, limit)
-            return False
-        return True
+                    continue
+                raise RuntimeError(
+                    f"Exceeded maximum number of retries for query queue: {error}"
+                )
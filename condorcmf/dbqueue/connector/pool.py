@@ -0,0 +1,175 @@
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from time import monotonic
+
+# MySQL client errors after which a connection is unusable: can't connect,
+# server gone away, connection lost, commands out of sync, and lost connection
+# during a query or at a packet read
+CONNECTION_ERRORS = (2003, 2006, 2013, 2014, 2055)
+
+
+class PoolTimeout(RuntimeError):
+    """
+    Raised when no connection becomes available within the checkout timeout.
+    """
+
+
+class ConnectionPool:
+    """
+    A bounded pool of database connections shared by the threads of one process.
+
+    Connections are created lazily by `factory` up to `max_size`. On checkout a
+    connection is discarded and replaced if it is older than `recycle` seconds or
+    has been idle for more than `idle_timeout` seconds, and it is pinged if it has
+    been idle for more than `ping_after` seconds (0 pings on every checkout).
+
+    Args:
+        factory (callable): Returns a new DB-API connection.
+        max_size (int): Maximum number of open connections.
+        idle_timeout (float): Seconds a connection may sit idle in the pool.
+        recycle (float): Maximum age of a connection in seconds.
+        ping_after (float): Idle seconds after which a checkout pings the server.
+        timeout (float): Seconds to wait for a free connection before raising.
+    """
+
+    def __init__(
+        self,
+        factory,
+        max_size=4,
+        idle_timeout=300,
+        recycle=3600,
+        ping_after=10,
+        timeout=60,
+    ):
+        self.factory = factory
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.recycle = recycle
+        self.ping_after = ping_after
+        self.timeout = timeout
+
+        self._idle = deque()  # (connection, created_at, last_used)
+        self._created = {}  # id(connection) -> created_at
+        self._size = 0
+        self._lock = threading.Condition()
+
+    @property
+    def size(self):
+        return self._size
+
+    @property
+    def idle(self):
+        return len(self._idle)
+
+    def acquire(self):
+        deadline = monotonic() + self.timeout
+        while True:
+            with self._lock:
+                if self._idle:
+                    connection, created_at, last_used = self._idle.pop()
+                elif self._size < self.max_size:
+                    self._size += 1
+                    break
+                else:
+                    remaining = deadline - monotonic()
+                    if remaining <= 0:
+                        raise PoolTimeout(
+                            f"No database connection available after {self.timeout} seconds"
+                        )
+                    self._lock.wait(remaining)
+                    continue
+
+            # Health checks may ping the server so run them outside the lock
+            if self._healthy(connection, created_at, last_used):
+                return connection
+            with self._lock:
+                self._discard(connection)
+                self._lock.notify()
+
+        # Open the connection outside the lock so other threads are not blocked
+        # behind a slow (or retrying) connect.
+        try:
+            connection = self.factory()
+        except BaseException:
+            with self._lock:
+                self._size -= 1
+                self._lock.notify()
+            raise
+        with self._lock:
+            self._created[id(connection)] = monotonic()
+        return connection
+
+    def release(self, connection, discard=False):
+        with self._lock:
+            if discard or id(connection) not in self._created:
+                self._discard(connection)
+            else:
+                self._idle.append(
+                    (connection, self._created[id(connection)], monotonic())
+                )
+            self._lock.notify()
+
+    @contextmanager
+    def connection(self):
+        """
+        Check a connection out of the pool for the duration of a `with` block.
+        The connection is discarded if the block raises a connection-level error.
+        """
+        connection = self.acquire()
+        discard = False
+        try:
+            yield connection
+        except Exception as error:
+            discard = _is_connection_error(error)
+            raise
+        finally:
+            self.release(connection, discard=discard)
+
+    def close(self):
+        with self._lock:
+            while self._idle:
+                connection, _, _ = self._idle.pop()
+                self._discard(connection)
+            self._lock.notify_all()
+
+    def _healthy(self, connection, created_at, last_used):
+        now = monotonic()
+        if self.recycle is not None and now - created_at > self.recycle:
+            logging.debug("Recycling pooled connection past its maximum age")
+            return False
+        if self.idle_timeout is not None and now - last_used > self.idle_timeout:
+            logging.debug("Dropping pooled connection past its idle timeout")
+            return False
+        if now - last_used >= self.ping_after:
+            try:
+                connection.ping(reconnect=False)
+            except Exception as error:
+                logging.debug(f"Pooled connection failed ping: {error}")
+                return False
+        return True
+
+    def _discard(self, connection):
+        # Caller holds the lock
+        if self._created.pop(id(connection), None) is not None:
+            self._size -= 1
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+
+def _is_connection_error(error):
+    """
+    Return True if `error` means the connection itself can no longer be used.
+    Other operational errors, such as deadlocks and lock wait timeouts, leave
+    the connection usable and are retried on it.
+    """
+    name = type(error).__name__
+    if name == "InterfaceError":
+        return True
+    if name != "OperationalError":
+        return False
+    code = error.args[0] if error.args else None
+    return code in CONNECTION_ERRORS
@@ -1,38 +1,114 @@
 import logging
 import random
 import time
+from contextlib import contextmanager
 
 import pymysql
 
-"""
-TO DO
-    - Add docstrings
-"""
+from .base import DBQConnector
+from .pool import ConnectionPool
+from .stats import NULL_TIMER
 
+# Too many connections, lock wait timeout, deadlock
+TRANSIENT_ERRORS = (1040, 1205, 1213)
 
-class PyMySQLConnector:
-    def __init__(self, host, user, password, database, poll_delay=5, max_retries=5):
+
+def is_transient(error):
+    """
+    Return True if `error` is worth retrying after a short wait.
+    """
+    return error.args[0] in TRANSIENT_ERRORS or "polling too quickly" in str(error)
+
+
+class PyMySQLConnector(DBQConnector):
+    def __init__(
+        self,
+        host,
+        user,
+        password,
+        database,
+        poll_delay=5,
+        max_retries=5,
+        pool_size=4,
+        idle_timeout=300,
+        recycle=3600,
+        ping_after=10,
+        replicas=None,
+        max_staleness=5.0,
+        lag_check_interval=1.0,
+    ):
         self.host = host
         self.user = user
         self.password = password
         self.database = database
-        self.poll_delay = poll_delay
-        self.max_retries = max_retries
         self.connection = None
         self.cursor = None
-        self.query_queue = []
+        self.pool = ConnectionPool(
+            self._connect,
+            max_size=pool_size,
+            idle_timeout=idle_timeout,
+            recycle=recycle,
+            ping_after=ping_after,
+        )
+        super().__init__(
+            poll_delay=poll_delay,
+            max_retries=max_retries,
+            replicas=replicas,
+            max_staleness=max_staleness,
+            lag_check_interval=lag_check_interval,
+        )
+
+    def _replica(self, endpoint):
+        """
+        Build a connector for a replica given as a host name, or as a dict of
+        any of `host`, `user`, `password`, `database` and the pool options,
+        with the rest taken from the primary.
+        """
+        options = {"host": endpoint} if isinstance(endpoint, str) else dict(endpoint)
+        kwargs = dict(
+            host=self.host,
+            user=self.user,
+            password=self.password,
+            database=self.database,
+            poll_delay=self.poll_delay,
+            max_retries=self.max_retries,
+        )
+        kwargs.update(options)
+        return PyMySQLConnector(**kwargs)
 
-    def connect(self, limit=20):
+    def replication_lag(self):
+        """
+        Return the replica's `Seconds_Behind_Source`, 0 if the server is not a
+        replica, or None if replication is stopped.
+        """
+        with self.pool.connection() as connection:
+            with connection.cursor(pymysql.cursors.DictCursor) as cursor:
+                try:
+                    cursor.execute("SHOW REPLICA STATUS")
+                except pymysql.err.ProgrammingError:
+                    # Servers before MySQL 8.0.22 only know the old name
+                    cursor.execute("SHOW SLAVE STATUS")
+                status = cursor.fetchone()
+        if not status:
+            return 0.0
+        lag = status.get("Seconds_Behind_Source", status.get("Seconds_Behind_Master"))
+        return None if lag is None else float(lag)
+
+    def _connect(self, limit=20):
+        start = time.perf_counter()
         try:
-            self.connection = pymysql.connect(
+            connection = pymysql.connect(
                 host=self.host,
                 user=self.user,
                 password=self.password,
                 database=self.database,
+                autocommit=True,
             )
-            self.cursor = self.connection.cursor()
-            logging.info("Connected to MySQL database")
+            self.stats.record_connect(time.perf_counter() - start)
+            logging.debug("Connected to MySQL database")
+            return connection
         except pymysql.Error as error:
+            self.stats.record_event(error)
             error_code = error.args[0]
             sleep_time = random.randint(5, max(20, self.poll_delay))
 
@@ -42,193 +118,169 @@ class PyMySQLConnector:
                 )
 
                 if limit > 1:
-                    self.connection = None
                     time.sleep(sleep_time)
-                    return self.connect(limit - 1)
+                    return self._connect(limit - 1)
 
             if "polling too quickly" in str(error):
                 if limit > 1:
-                    self.connection = None
                     time.sleep(sleep_time)
-                    return self.connect(limit - 1)
+                    return self._connect(limit - 1)
 
-            raise RuntimeError(f"""
-                                    Exceeded maximum number of retries for query queue.
-                                    Error: {error}
-                                    Query Queue: {self.query_queue}
-                                """)
+            raise RuntimeError(
+                f"Failed to connect to MySQL database {self.database} at {self.host}: {error}"
+            ) from error
 
-            return False
+    def connect(self):
+        """
+        Check a connection out of the pool and expose it as `connection` and
+        `cursor` until `disconnect` is called.
+        """
+        if self.connection is not None:
+            logging.warning("Already connected to MySQL database")
+            return
+        self.connection = self.pool.acquire()
+        self.cursor = self.connection.cursor()
 
     def disconnect(self):
+        """
+        Return the connection checked out by `connect` to the pool.
+        """
         if self.connection is not None:
             self.cursor.close()
-            self.connection.close()
+            self.pool.release(self.connection)
             self.connection = None
-            logging.info("Disconnected from MySQL database")
+            self.cursor = None
 
-    def insert(self, table, columns, values, limit=10, queue_query=False):
-        query = f"INSERT INTO {table} {columns} VALUES {values}"
-        if queue_query:
-            self.query_queue.append(("insert", query))
-            return True
-        res = self._execute_query(query, limit=limit)
-        return res
+    def close(self):
+        """
+        Close every idle pooled connection.
+        """
+        self.disconnect()
+        self.pool.close()
 
-    def select(
-        self,
-        table,
-        columns,
-        where_clause,
-        orderby=None,
-        limit=10,
-        queue_query=False,
-    ):
-        query = f"SELECT {columns} FROM {table} WHERE {where_clause}"
-        if orderby is not None:
-            query += f" ORDER BY {orderby}"
-        if queue_query:
-            self.query_queue.append(("select", query))
-            return True
-        res = self._execute_query(query, limit=limit, select=True)
-        return res
-
-    def select_one(
+    @contextmanager
+    def transaction(self):
+        """
+        Run the statements issued on the yielded cursor in a single transaction
+        on a pooled connection. The transaction is committed when the block exits
+        and rolled back if it raises.
+        """
+        with self.pool.connection() as connection:
+            connection.begin()
+            cursor = connection.cursor()
+            try:
+                yield cursor
+                connection.commit()
+            except BaseException:
+                try:
+                    connection.rollback()
+                except pymysql.Error:
+                    pass
+                raise
+            finally:
+                cursor.close()
+
+    def _execute_query(
         self,
-        table,
-        columns,
-        where_clause,
-        orderby=None,
+        query,
+        params=(),
+        select=False,
+        select_one=False,
         limit=10,
-        queue_query=False,
+        timer=NULL_TIMER,
     ):
-        query = f"SELECT {columns} FROM {table} WHERE {where_clause}"
-        if orderby is not None:
-            query += f" ORDER BY {orderby}"
-        if queue_query:
-            self.query_queue.append(("select_one", query))
-            return True
-        res = self._execute_query(query, limit=limit, select_one=True)
-        return res
-
-    def update(
-        self, table, set_values, where_clause, limit=10, queue_query=False
-    ):
-        query = f"UPDATE {table} SET {set_values} WHERE {where_clause}"
-        if queue_query:
-            self.query_queue.append(("update", query))
-            return True
-        res = self._execute_query(query, limit=limit)
-        return res
-
-    def delete(self, table, where_clause, limit=10, queue_query=False):
-        query = f"DELETE FROM {table} WHERE {where_clause}"
-        if queue_query:
-            self.query_queue.append(("delete", query))
-            return True
-        res = self._execute_query(query, limit=limit)
-        return res
-
-    def _execute_query(self, query, select=False, select_one=False, limit=10):
         try:
-            if select:
-                self.connect()
-                self.cursor.execute(query)
-                res = self.cursor.fetchall()
-                self.disconnect()
-                if not res:
-                    return None
-                return res
-            elif select_one:
-                self.connect()
-                self.cursor.execute(query)
-                res = self.cursor.fetchone()
-                self.disconnect()
-                if not res:
-                    return None
-                return res
-            else:
-                self.connect()
-                self.cursor.execute(query)
-                self.connection.commit()
-                self.disconnect()
-                return True
+            with self.pool.connection() as connection:
+                timer.lap("connect")
+                with connection.cursor() as cursor:
+                    cursor.execute(query, params or None)
+                    timer.lap("execute")
+                    if select:
+                        res = cursor.fetchall()
+                    elif select_one:
+                        res = cursor.fetchone()
+                    else:
+                        return True
+                    timer.lap("fetch")
+                    timer.fetched(res, many=select)
+            if not res:
+                return None
+            return res
         except pymysql.Error as error:
-            error_code = error.args[0]
-            sleep_time = random.randint(1, max(2, self.poll_delay))
-
-            if error_code == 1040:
-                if limit > 1:
-                    self.connection = None
-                    time.sleep(sleep_time)
-                    return self._execute_query(query_queue, select, select_one, limit - 1)
-
-            if "polling too quickly" in str(error):
-                if limit > 1:
-                    self.connection = None
-                    time.sleep(sleep_time)
-                    return self._execute_query(query_queue, select, select_one, limit - 1)
+            if is_transient(error) and limit > 1:
+                sleep_time = random.randint(1, max(2, self.poll_delay))
+                logging.warning(
+                    f"Waiting {sleep_time} seconds before retrying query {limit - 1} attempts left: {error}"
+                )
+                time.sleep(sleep_time)
+                timer.retry(error)
+                return self._execute_query(
+                    query, params, select, select_one, limit - 1, timer
+                )
 
             raise RuntimeError(f"""
-                                    Exceeded maximum number of retries for query queue.
+                                    Exceeded maximum number of retries for query.
                                     Error: {error}
-                                    Query Queue: {self.query_queue}
+                                    Query: {query}
                                 """)
 
-            return False
-
-    def _execute_query_queue(self, limit=10):
-        self.connect()
-
+    def _stream_query(self, statement, params, chunk_size, timer):
+        """
+        Read the rows through an unbuffered `SSCursor` on a pooled connection,
+        `chunk_size` rows at a time. Streams are not retried since part of the
+        result may already have been consumed.
+        """
         try:
-            results = []
-
-            for query in self.query_queue:
-                if query[0] == "select":
-                    self.cursor.execute(query[1])
-                    res = self.cursor.fetchall()
-                    if not res:
-                        results.append(None)
-                    else:
-                        results.append(res)
-                elif query[0] == "select_one":
-                    self.cursor.execute(query[1])
-                    res = self.cursor.fetchone()
-                    if not res:
-                        results.append(None)
-                    else:
-                        results.append(res)
-                else:
-                    self.cursor.execute(query[1])
-                    self.connection.commit()
-                    results.append(True)
-
-            self.disconnect()
-            self.query_queue = []
-            return results
+            with self.pool.connection() as connection:
+                timer.lap("connect")
+                cursor = connection.cursor(pymysql.cursors.SSCursor)
+                try:
+                    cursor.execute(statement.sql, params or None)
+                    timer.lap("execute")
+                    while True:
+                        rows = cursor.fetchmany(chunk_size)
+                        timer.lap("fetch")
+                        if not rows:
+                            return
+                        yield list(rows)
+                finally:
+                    # Closing an unbuffered cursor reads any rows left unconsumed
+                    # so the connection can go back to the pool
+                    cursor.close()
         except pymysql.Error as error:
-            error_code = error.args[0]
-            sleep_time = random.randint(1, max(2, self.poll_delay))
+            raise RuntimeError(
+                f"Error streaming query {statement.sql}: {error}"
+            ) from error
 
-            if error_code == 1040:
-                logging.error(
-                    f"Waiting {sleep_time} seconds before retrying {limit} attempts left..."
-                )
+    def _execute_query_queue(self, limit=10):
+        """
+        Execute the queued statements as one transaction with a single commit.
 
-                if limit > 1:
-                    self.connection = None
-                    time.sleep(sleep_time)
-                    return self._execute_query(query_queue, select, select_one, limit - 1)
+        If a transient error (too many connections, deadlock, lock wait timeout
+        or polling too quickly) interrupts the batch, the transaction is rolled
+        back and the whole batch is retried, up to `limit` attempts.
 
-            if "polling too quickly" in str(error):
-                if limit > 1:
+        Returns one result per queued statement, in order: the rows of a select
+        (or None if there were none) and True for any other statement.
+        """
+        query_queue = self._take_query_queue()
+        while True:
+            try:
+                with self.transaction() as cursor:
+                    return self._execute_queued(cursor, query_queue)
+            except pymysql.Error as error:
+                if is_transient(error) and limit > 1:
+                    self.stats.record_event(error, shape="queue")
+                    limit -= 1
+                    sleep_time = random.randint(1, max(2, self.poll_delay))
+                    logging.warning(
+                        f"Waiting {sleep_time} seconds before retrying query queue {limit} attempts left: {error}"
+                    )
                     time.sleep(sleep_time)
-                    return self._execute_query(query_queue, select, select_one, limit - 1)
-
-            raise RuntimeError(f"""
-                                    Exceeded maximum number of retries for query queue.
-                                    Error: {error}
-                                    Query Queue: {self.query_queue}
-                                """)
+                    continue
 
-            return False
+                raise RuntimeError(f"""
+                                        Exceeded maximum number of retries for query queue.
+                                        Error: {error}
+                                        Query Queue: {query_queue}
+                                    """)
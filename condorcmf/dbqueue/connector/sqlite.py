@@ -0,0 +1,242 @@
+import logging
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from .. import schema
+from .base import DBQConnector
+from .stats import NULL_TIMER
+
+
+def is_transient(error):
+    """
+    Return True if `error` means another connection holds the database lock.
+    """
+    message = str(error)
+    return "locked" in message or "busy" in message
+
+
+class SQLiteCursor:
+    """
+    Wraps an sqlite3 cursor so statements written with "%s" placeholders for
+    the MySQL connectors run unchanged.
+    """
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, query, params=None):
+        self._cursor.execute(query.replace("%s", "?"), tuple(params or ()))
+        return self
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class SQLiteConnector(DBQConnector):
+    """
+    Embedded dbqueue backend storing a session in a single SQLite file.
+
+    Each thread gets its own connection to `path`, and the dbqueue tables are
+    created on first use. Write transactions start with BEGIN IMMEDIATE, so
+    claims from several processes are serialised by SQLite's database lock
+    instead of row locks, and writers that find the database locked wait up to
+    `timeout` seconds before retrying.
+
+    WAL mode lets readers proceed while a writer commits, but it needs shared
+    memory between the processes and so only works when they run on the same
+    host. For processes on several hosts sharing a network filesystem use
+    `journal_mode="delete"`, which relies on the filesystem's file locks.
+    Passing ":memory:" as `path` gives a private in-memory database shared by
+    the threads of this process.
+
+    Args:
+        path (str): Database file, or ":memory:".
+        poll_delay (float): Maximum seconds to wait between retries.
+        max_retries (int): Retries for a statement that finds the database locked.
+        timeout (float): Seconds SQLite waits for a lock before raising.
+        journal_mode (str): SQLite journal mode, "wal" or "delete".
+        create_schema (bool): Create the dbqueue tables, or migrate them to the
+            current schema version, on first use.
+        replicas (list): Read replicas, as connectors or database paths.
+        max_staleness (float): Maximum replica lag in seconds for reads.
+        lag_check_interval (float): Seconds between replica lag checks.
+    """
+
+    dialect = "sqlite"
+    placeholder = "?"
+    lock_clause = ""
+
+    def __init__(
+        self,
+        path,
+        poll_delay=5,
+        max_retries=5,
+        timeout=30,
+        journal_mode="wal",
+        create_schema=True,
+        replicas=None,
+        max_staleness=5.0,
+        lag_check_interval=1.0,
+    ):
+        self.path = str(path)
+        self.timeout = timeout
+        self.journal_mode = journal_mode
+        super().__init__(
+            poll_delay=poll_delay,
+            max_retries=max_retries,
+            replicas=replicas,
+            max_staleness=max_staleness,
+            lag_check_interval=lag_check_interval,
+        )
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.RLock()
+        self._shared = None
+        if self.path == ":memory:":
+            self._shared = self._open()
+
+        if create_schema:
+            schema.migrate(self)
+
+    def _replica(self, endpoint):
+        """
+        Open the database file at `endpoint`, e.g. a copy kept up to date by an
+        external replication tool, as a replica.
+        """
+        return SQLiteConnector(
+            endpoint,
+            poll_delay=self.poll_delay,
+            max_retries=self.max_retries,
+            timeout=self.timeout,
+            journal_mode=self.journal_mode,
+            create_schema=False,
+        )
+
+    def _open(self):
+        connection = sqlite3.connect(
+            self.path,
+            timeout=self.timeout,
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        if self.path != ":memory:":
+            connection.execute(f"PRAGMA journal_mode={self.journal_mode}")
+            connection.execute("PRAGMA synchronous=NORMAL")
+        with self._lock:
+            self._connections.append(connection)
+        logging.debug(f"Opened SQLite database {self.path}")
+        return connection
+
+    @contextmanager
+    def _connection(self):
+        if self._shared is not None:
+            with self._lock:
+                yield self._shared
+            return
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._open()
+            self._local.connection = connection
+        yield connection
+
+    def close(self):
+        with self._lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections = []
+            self._shared = None
+        self._local = threading.local()
+
+    @contextmanager
+    def transaction(self):
+        """
+        Run the statements issued on the yielded cursor in a single write
+        transaction, committed when the block exits and rolled back if it raises.
+        """
+        with self._connection() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            cursor = SQLiteCursor(connection.cursor())
+            try:
+                yield cursor
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            finally:
+                cursor.close()
+
+    def _execute_query(
+        self,
+        query,
+        params=(),
+        select=False,
+        select_one=False,
+        limit=10,
+        timer=NULL_TIMER,
+    ):
+        try:
+            with self._connection() as connection:
+                timer.lap("connect")
+                cursor = connection.execute(query, params)
+                timer.lap("execute")
+                if select:
+                    res = cursor.fetchall()
+                elif select_one:
+                    res = cursor.fetchone()
+                else:
+                    return True
+                timer.lap("fetch")
+                timer.fetched(res, many=select)
+            if not res:
+                return None
+            return res
+        except sqlite3.OperationalError as error:
+            if is_transient(error) and limit > 1:
+                time.sleep(random.uniform(0, min(1, self.poll_delay)))
+                timer.retry(error)
+                return self._execute_query(
+                    query, params, select, select_one, limit - 1, timer
+                )
+            raise RuntimeError(f"Error executing query {query}: {error}")
+
+    def _stream_query(self, statement, params, chunk_size, timer):
+        """
+        Step through the rows `chunk_size` at a time; SQLite produces rows
+        lazily, so nothing beyond the current chunk is held in memory.
+        """
+        with self._connection() as connection:
+            timer.lap("connect")
+            cursor = connection.execute(statement.sql, params)
+            timer.lap("execute")
+            try:
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    timer.lap("fetch")
+                    if not rows:
+                        return
+                    yield rows
+            finally:
+                cursor.close()
+
+    def _execute_query_queue(self, limit=10):
+        """
+        Execute the queued statements as one transaction with a single commit,
+        retrying the whole batch while the database is locked.
+        """
+        query_queue = self._take_query_queue()
+        while True:
+            try:
+                with self.transaction() as cursor:
+                    return self._execute_queued(cursor, query_queue)
+            except sqlite3.OperationalError as error:
+                if is_transient(error) and limit > 1:
+                    self.stats.record_event(error, shape="queue")
+                    limit -= 1
+                    time.sleep(random.uniform(0, min(1, self.poll_delay)))
+                    continue
+                raise RuntimeError(
+                    f"Exceeded maximum number of retries for query queue: {error}"
+                )
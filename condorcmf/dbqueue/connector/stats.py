@@ -0,0 +1,324 @@
+import json
+import logging
+import os
+import re
+import socket
+import threading
+from bisect import bisect_left
+from pathlib import Path
+from time import perf_counter, time
+
+# Upper bounds in seconds of the histogram buckets, doubling from 10us to ~20s.
+# Anything slower lands in a final overflow bucket.
+BUCKETS = [1e-5 * 2**i for i in range(22)]
+
+PHASES = ("connect", "execute", "fetch")
+
+
+def normalize(where_clause):
+    """
+    Return `where_clause` with whitespace collapsed and IN lists folded to
+    `IN (...)`, so chunked statements with different list lengths share a shape.
+    """
+    where_clause = re.sub(r"\s+", " ", where_clause.strip())
+    where_clause = re.sub(r"\s*(<=|>=|<>|!=|=|<|>)\s*", r" \1 ", where_clause)
+    return re.sub(r"IN \((?:%s|\?)(?:, ?(?:%s|\?))*\)", "IN (...)", where_clause)
+
+
+def classify(error):
+    """
+    Return the event name for a connector error worth counting separately:
+    "too_many_connections" for MySQL error 1040, "polling_too_quickly" for the
+    server's rate limit, or None.
+    """
+    if "polling too quickly" in str(error):
+        return "polling_too_quickly"
+    args = getattr(error, "args", ())
+    errno = getattr(error, "errno", None) or (args[0] if args else None)
+    if errno == 1040:
+        return "too_many_connections"
+    return None
+
+
+class Histogram:
+    """
+    Latency histogram over the fixed log-spaced `BUCKETS`.
+    """
+
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, elapsed):
+        self.counts[bisect_left(BUCKETS, elapsed)] += 1
+        self.count += 1
+        self.total += elapsed
+        if elapsed > self.max:
+            self.max = elapsed
+
+    def quantile(self, q):
+        """
+        Return the upper bound of the bucket holding the `q` quantile.
+        """
+        if self.count == 0:
+            return None
+        target = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= target:
+                return BUCKETS[i] if i < len(BUCKETS) else self.max
+        return self.max
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "total": self.total,
+            "mean": self.total / self.count if self.count else None,
+            "max": self.max,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "buckets": [
+                [BUCKETS[i] if i < len(BUCKETS) else None, n]
+                for i, n in enumerate(self.counts)
+                if n
+            ],
+        }
+
+
+class ShapeStats:
+    """
+    Counters and phase histograms for one query shape.
+    """
+
+    def __init__(self, shape):
+        self.shape = shape
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.calls = 0
+        self.errors = 0
+        self.rows = 0
+        self.retries = 0
+        self.events = {"too_many_connections": 0, "polling_too_quickly": 0}
+        self.total = Histogram()
+        self.phases = {phase: Histogram() for phase in PHASES}
+
+    def record(self, elapsed, rows=0, error=False):
+        with self._lock:
+            self.calls += 1
+            self.rows += rows
+            if error:
+                self.errors += 1
+            self.total.record(elapsed)
+
+    def record_phase(self, phase, elapsed):
+        with self._lock:
+            self.phases[phase].record(elapsed)
+
+    def record_retry(self, error):
+        event = classify(error)
+        with self._lock:
+            self.retries += 1
+            if event is not None:
+                self.events[event] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "errors": self.errors,
+                "rows": self.rows,
+                "retries": self.retries,
+                "events": dict(self.events),
+                "latency": self.total.snapshot(),
+                "phases": {
+                    phase: histogram.snapshot()
+                    for phase, histogram in self.phases.items()
+                    if histogram.count
+                },
+            }
+
+
+class QueryTimer:
+    """
+    Splits one call into connect/execute/fetch phases. Each `lap` records the
+    time since the previous lap (or since the timer started) under `phase`.
+    """
+
+    __slots__ = ("stats", "start", "mark", "rows", "busy")
+
+    def __init__(self, stats):
+        self.stats = stats
+        self.start = self.mark = perf_counter()
+        self.rows = 0
+        self.busy = 0.0
+
+    def lap(self, phase):
+        now = perf_counter()
+        self.stats.record_phase(phase, now - self.mark)
+        self.busy += now - self.mark
+        self.mark = now
+
+    def restart(self):
+        """
+        Start the next lap now, e.g. after a streaming caller has processed a
+        chunk, so time spent outside the connector is not recorded.
+        """
+        self.mark = perf_counter()
+
+    def fetched(self, rows, many=True):
+        if rows:
+            self.rows += len(rows) if many else 1
+
+    def retry(self, error):
+        """
+        Count a retry after `error`. Call it once the backoff sleep is over so
+        the sleep is not charged to the next phase.
+        """
+        self.stats.record_retry(error)
+        self.mark = perf_counter()
+
+
+class _NullTimer:
+    """
+    Timer used when `_execute_query` is called without one.
+    """
+
+    def lap(self, phase):
+        pass
+
+    def restart(self):
+        pass
+
+    def fetched(self, rows, many=True):
+        pass
+
+    def retry(self, error):
+        pass
+
+
+NULL_TIMER = _NullTimer()
+
+
+class QueryStats:
+    """
+    Per-shape instrumentation for a connector.
+
+    A shape is the operation, table and normalized WHERE clause of a statement
+    (see `normalize`). For each shape this records call counts, rows returned,
+    errors, retries, MySQL 1040 and "polling too quickly" events, the latency
+    of whole calls and, where the connector can tell them apart, separate
+    connect/execute/fetch histograms. Connection-level events that happen
+    outside any statement, such as a refused connect, are recorded under the
+    "connect" shape.
+
+    `snapshot` returns everything as a JSON-serialisable dict, and
+    `start_dump` writes it to a file periodically from a background thread.
+    """
+
+    def __init__(self):
+        self._shapes = {}
+        self._lock = threading.Lock()
+        self._dump_thread = None
+        self._stop = threading.Event()
+
+    def shape(self, shape):
+        stats = self._shapes.get(shape)
+        if stats is None:
+            with self._lock:
+                stats = self._shapes.setdefault(shape, ShapeStats(shape))
+        return stats
+
+    def timer(self, shape):
+        return QueryTimer(self.shape(shape))
+
+    def record_connect(self, elapsed):
+        self.shape("connect").record(elapsed)
+
+    def record_event(self, error, shape="connect"):
+        self.shape(shape).record_retry(error)
+
+    def snapshot(self):
+        """
+        Return {"timestamp": ..., "shapes": {shape: stats}} for every shape
+        that has been called or retried.
+        """
+        with self._lock:
+            shapes = list(self._shapes.values())
+        snapshot = {
+            stats.shape: stats.snapshot()
+            for stats in shapes
+            if stats.calls or stats.retries
+        }
+        return {"timestamp": time(), "shapes": snapshot}
+
+    def reset(self):
+        with self._lock:
+            shapes = list(self._shapes.values())
+        for stats in shapes:
+            stats.reset()
+
+    def dump(self, path):
+        """
+        Write `snapshot` to `path` as JSON, replacing the file atomically.
+        """
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        with open(tmp, "w") as f:
+            json.dump(self.snapshot(), f, indent=2)
+        os.replace(tmp, path)
+
+    def start_dump(self, session_id=None, interval=60, path=None):
+        """
+        Dump the snapshot every `interval` seconds until `stop_dump` is called.
+        By default the file is `dbqueue-stats-<host>-<pid>.json` in the
+        session's log directory, so every daemon of a session writes its own
+        file next to the others.
+        """
+        if path is None:
+            from condorcmf import definitions
+
+            if session_id is None:
+                raise ValueError("Either session_id or path must be given")
+            path = definitions.SESSION_LOG_DIR(session_id) / (
+                f"dbqueue-stats-{socket.gethostname()}-{os.getpid()}.json"
+            )
+        self.stop_dump()
+        self._stop = threading.Event()
+        self._dump_thread = threading.Thread(
+            target=self._dump_loop,
+            args=(Path(path), interval, self._stop),
+            name="dbqueue-stats",
+            daemon=True,
+        )
+        self._dump_thread.start()
+        return path
+
+    def stop_dump(self):
+        """
+        Stop the periodic dump, writing a final snapshot.
+        """
+        if self._dump_thread is None:
+            return
+        self._stop.set()
+        self._dump_thread.join()
+        self._dump_thread = None
+
+    def _dump_loop(self, path, interval, stop):
+        while not stop.wait(interval):
+            self._try_dump(path)
+        self._try_dump(path)
+
+    def _try_dump(self, path):
+        try:
+            self.dump(path)
+        except OSError as error:
+            logging.warning(f"Failed to write dbqueue stats to {path}: {error}")
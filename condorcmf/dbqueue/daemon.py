@@ -1,12 +1,68 @@
 import json
 import logging
+import threading
 import uuid
-from time import time
+from collections import deque
+from time import sleep, time
 
-from .job import Job
+from . import utils
+from .broadcast import Broadcast
+from .connector.base import in_clause
+from .feed import FEED_COLUMNS, FEED_JOB_COLUMNS, ChangeFeed, FeedCursor
+from .job import MAX_ATTEMPTS, Job, iter_job_records
+
+# Claims take pending jobs and in-progress jobs whose lease has expired and that
+# have attempts left. Its placeholders are the current time and `max_attempts`.
+CLAIMABLE = "(`status_code`=0 OR (`lease_expires` < %s AND `attempts` < %s))"
+
+# Claims of the jobs assigned to this node by `take_job`, newest first, and of
+# unassigned or assigned jobs by `fetch_global_jobs`, oldest first. Filters are
+# appended to the WHERE clauses, and `CLAIMABLE` last.
+TAKE_WHERE = "`session_id`=%s AND `to_id`=%s AND `status_code` IN (0, 1)"
+TAKE_ORDER = "`created_at` DESC"
+GLOBAL_WHERE = "`session_id`=%s AND `status_code` IN (0, 1) AND `to_id` IN (%s, %s)"
+GLOBAL_ORDER = "`created_at` ASC"
+
+# Seconds between the `last_seen` updates of a heartbeat thread
+HEARTBEAT_INTERVAL = 10.0
+
+# Seconds after which `wait_for_job(use_feed=True)` queries `job_queue` even
+# though the feed shows no new job, to pick up jobs whose lease has expired
+FEED_PROBE_INTERVAL = 10.0
 
 
 class Daemon:
+    """
+    A node of a session's pool that claims and works on jobs.
+
+    Jobs claimed with `take_job` or `fetch_global_jobs` are leased for
+    `lease_time` seconds: the daemon keeps the lease with `renew_leases` (or
+    `Job.extend_lease`) while it works, and a job whose lease expires goes back
+    to the claimable pool for another daemon, up to `max_attempts` claims in
+    total. With `lease_time=None` claims do not expire.
+
+    `start_heartbeat` keeps the daemon's `last_seen` in the pool fresh from a
+    background thread, so `Session.clean_stale_daemons` does not hold a daemon
+    that is busy with a long job. While the heartbeat runs, `set_status` only
+    records the status and the next beat writes it together with `last_seen`,
+    so the pool row gets one UPDATE per interval however often the status
+    changes.
+
+    With `prefetch` set to K > 0, `take_job` and `fetch_job` claim up to K of
+    the daemon's jobs at once into `self.job_queue` and serve later calls from
+    there. Whenever fewer than `low_water` jobs (by default K // 2) are left, a
+    background thread claims more, so the database round trip overlaps with
+    work on the jobs already taken. Prefetched jobs are claimed and leased
+    when they are fetched: keep `lease_time` above the time a job may wait in
+    the queue, or renew the leases with the heartbeat. Jobs whose lease has
+    been lost or whose deadline has passed are not served, and `leave` (or
+    `release_prefetched`) returns the jobs still queued to pending.
+
+    The heartbeat and prefetch threads issue their statements through `db`
+    alongside the caller, so `db` must be safe to share between threads, as
+    the bundled connectors are.
+    """
+
     def __init__(
         self,
         db,
@@ -14,22 +70,42 @@ class Daemon:
         role: int,
         node_id: str = None,
         created_at: float = None,
+        lease_time: float = None,
+        max_attempts: int = MAX_ATTEMPTS,
+        prefetch: int = 0,
+        low_water: int = None,
     ):
         self.db = db
         self.session_id = session_id
         self.role = role
+        self.lease_time = lease_time
+        self.max_attempts = max_attempts
+        self.prefetch = prefetch
+        self.low_water = prefetch // 2 if low_water is None else low_water
 
         self.node_id = str(uuid.uuid4()) if node_id is None else node_id
         self.created_at = time() if created_at is None else created_at
         self.last_seen = created_at
         self.status_code = 0
-        self.job_queue = []  # type: ignore
+        self.job_queue = deque()  # type: ignore
+        self.backoff = utils.Backoff(seed=self.node_id)
+        self.polls = 0
+        self.feed_cursor = FeedCursor()
+        self._heartbeat = None
+        self._heartbeat_stop = threading.Event()
+        self._heartbeat_lock = threading.Lock()
+        self._pending_status = None
+        self._prefetch_lock = threading.Lock()
+        self._refill = None
 
     def join(self, payload=json.dumps({})):
         logging.info(f"{self.node_id} joining pool with session id: {self.session_id}")
         self.last_seen = time()
         node = self.db.select_one(
-            "pool", "node_id", f"`session_id`='{self.session_id}' AND `node_id`='{self.node_id}'"
+            "pool",
+            "node_id",
+            "`session_id`=%s AND `node_id`=%s",
+            params=(self.session_id, self.node_id),
         )
         if node is None:
             self.db.insert(
@@ -48,9 +124,13 @@ class Daemon:
         else:
             self.db.update(
                 table="pool",
-                set_values=f"`status_code` = 1, `last_seen` = '{self.last_seen}'",
-                where_clause=f"session_id = '{self.session_id}' AND `node_id` = '{self.node_id}'",
+                set_values="`status_code` = 1, `last_seen` = %s",
+                where_clause="`session_id` = %s AND `node_id` = %s",
+                params=(self.last_seen, self.session_id, self.node_id),
             )
+        # Jobs sent before joining are found by probing job_queue, so the feed
+        # is only read from here on
+        self.feed_cursor = FeedCursor(ChangeFeed(self.db, self.session_id).latest())
         logging.info(f"{self.node_id} joined pool with session id: {self.session_id}")
         self.status_code = 1
 
@@ -59,44 +139,69 @@ class Daemon:
             f"getting status of {self.node_id} with session id: {self.session_id}"
         )
         status = self.db.select_one(
-            "pool", "status_code", f"`session_id`='{self.session_id}'"
+            "pool",
+            "status_code",
+            "`session_id`=%s AND `node_id`=%s",
+            params=(self.session_id, self.node_id),
         )
         logging.info(f"got status of {self.node_id} with session id: {self.session_id}")
         self.status_code = status[0]
         return status[0]
 
     def set_status(self, status=1):
+        """
+        Set the daemon's status in the pool. While the heartbeat runs the
+        write is left to its next beat, see `start_heartbeat`.
+        """
+        if self._heartbeat is not None:
+            with self._heartbeat_lock:
+                self._pending_status = status
+                self.status_code = status
+            return
         logging.info(f"{self.node_id} updating pool with session id: {self.session_id}")
         self.last_seen = time()
         self.db.update(
             table="pool",
-            set_values=f"`status_code` = '{status}', `last_seen` = '{self.last_seen}'",
-            where_clause=f"session_id = '{self.session_id}' AND `node_id` = '{self.node_id}'",
+            set_values="`status_code` = %s, `last_seen` = %s",
+            where_clause="`session_id` = %s AND `node_id` = %s",
+            params=(status, self.last_seen, self.session_id, self.node_id),
         )
         logging.info(f"{self.node_id} updated pool with session id: {self.session_id}")
         self.status_code = status
 
     def fetch_job(self, round_id=None, job_type=None, job_id=None):
+        """
+        Return the latest pending job assigned to this node, without its
+        payload, or None if there is none. With `prefetch` the job comes from
+        `self.job_queue` and is already in progress with its payload loaded.
+        """
+        if self.prefetch and job_id is None:
+            return self._next_prefetched(round_id, job_type)
         logging.info(
             f"{self.node_id} fetching latest job with session id: {self.session_id}"
         )
 
-        where_clause = f"`session_id`='{self.session_id}' AND `to_id`='{self.node_id}' AND `status_code`=0"
+        where_clause = "`session_id`=%s AND `to_id`=%s AND `status_code`=0"
+        params = [self.session_id, self.node_id]
 
         if round_id is not None:
-            where_clause += f" AND `round_id`='{round_id}'"
+            where_clause += " AND `round_id`=%s"
+            params.append(round_id)
 
         if job_id is not None:
-            where_clause += f" AND `job_id`='{job_id}'"
+            where_clause += " AND `job_id`=%s"
+            params.append(job_id)
 
         if job_type is not None:
-            where_clause += f" AND `type`='{job_type}'"
+            where_clause += " AND `type`=%s"
+            params.append(job_type)
 
         job = self.db.select_one(
             "job_queue",
             "`id`, `session_id`, `job_id`, `round_id`, `to_id`, `from_id`, `type`, `created_at`, `deadline`",
             where_clause,
             orderby="created_at DESC",
+            params=params,
         )
 
         logging.info(
@@ -122,19 +227,23 @@ class Daemon:
         logging.info(
             f"{self.node_id} fetching all jobs with session id: {self.session_id}"
         )
-        where_clause = f"`session_id`='{self.session_id}' AND `to_id`='{self.node_id}' AND `status_code`=0"
+        where_clause = "`session_id`=%s AND `to_id`=%s AND `status_code`=0"
+        params = [self.session_id, self.node_id]
 
         if round_id is not None:
-            where_clause += f" AND `round_id`='{round_id}'"
+            where_clause += " AND `round_id`=%s"
+            params.append(round_id)
 
         if job_type is not None:
-            where_clause += f" AND `type`='{job_type}'"
+            where_clause += " AND `type`=%s"
+            params.append(job_type)
 
         jobs = self.db.select(
             "job_queue",
             "`id`, `session_id`, `job_id`, `round_id`, `to_id`, `from_id`, `type`, `created_at`, `deadline`",
             where_clause,
             orderby="created_at DESC",
+            params=params,
         )
         logging.info(
             f"{self.node_id} fetched all jobs with session id: {self.session_id}"
@@ -156,19 +265,483 @@ class Daemon:
             ]
         return []
 
-    def fetch_global_jobs(self):
+    def iter_jobs(
+        self, round_id=None, job_type=None, with_payload=False, chunk_size=1000
+    ):
+        """
+        Streaming variant of `fetch_all_jobs`: yield a `JobRecord` for each
+        pending job addressed to this daemon, newest first, while later rows are
+        still being read from the server. Pass `with_payload=True` to decode
+        each job's payload into its record instead of fetching it separately.
+        """
+        where_clause = "`session_id`=%s AND `to_id`=%s AND `status_code`=0"
+        params = [self.session_id, self.node_id]
+
+        if round_id is not None:
+            where_clause += " AND `round_id`=%s"
+            params.append(round_id)
+
+        if job_type is not None:
+            where_clause += " AND `type`=%s"
+            params.append(job_type)
+
+        return iter_job_records(
+            self.db,
+            where_clause,
+            params,
+            orderby="`created_at` DESC",
+            with_payload=with_payload,
+            chunk_size=chunk_size,
+        )
+
+    def take_job(self, round_id=None, job_type=None, job_id=None, n=None):
+        """
+        Fetch the latest pending job assigned to this node together with its
+        payload and mark it in progress (status 1), all in one transaction.
+        This replaces `fetch_job` followed by `get_payload` and `set_status(1)`.
+
+        In-progress jobs assigned to this node whose lease has expired are
+        taken again as if they were pending.
+
+        If `n` is given, take up to `n` jobs at once and return them as a list.
+        Otherwise return a single Job, or None if no job is pending. With
+        `prefetch` single jobs are served from `self.job_queue`.
+        """
+        if self.prefetch and n is None and job_id is None:
+            return self._next_prefetched(round_id, job_type)
+        logging.info(f"{self.node_id} taking jobs with session id: {self.session_id}")
+
+        where_clause, params = self._take_where(round_id, job_type, job_id)
+        jobs = self._claim_jobs(where_clause, params, TAKE_ORDER, n or 1)
+
+        logging.info(
+            f"{self.node_id} took {len(jobs)} jobs with session id: {self.session_id}"
+        )
+
+        if n is None:
+            return jobs[0] if jobs else None
+        return jobs
+
+    def _take_where(self, round_id=None, job_type=None, job_id=None):
+        where_clause = TAKE_WHERE
+        params = [self.session_id, self.node_id]
+
+        if round_id is not None:
+            where_clause += " AND `round_id`=%s"
+            params.append(round_id)
+
+        if job_id is not None:
+            where_clause += " AND `job_id`=%s"
+            params.append(job_id)
+
+        if job_type is not None:
+            where_clause += " AND `type`=%s"
+            params.append(job_type)
+
+        return where_clause, params
+
+    def changes(self, since=None):
+        """
+        Return the change feed entries for jobs sent to this node that this
+        daemon has not seen since it joined, tracked by `self.feed_cursor`, or
+        all entries after sequence number `since` if it is given.
+
+        Entries are tuples of
+        (seq, job_id, round_id, to_id, from_id, type, status_code, created_at).
+        """
+        feed = ChangeFeed(self.db, self.session_id)
+        if since is not None:
+            return feed.since(since, to_id=self.node_id)
+        return feed.read(self.feed_cursor, to_id=self.node_id)
+
+    def wait_for_job(
+        self,
+        timeout=None,
+        job_type=None,
+        round_id=None,
+        use_feed=False,
+        probe_interval=FEED_PROBE_INTERVAL,
+    ):
+        """
+        Block until a job assigned to this node is available and take it with
+        `take_job`, or return None once `timeout` seconds have passed.
+
+        Empty polls back off exponentially according to `self.backoff`, with
+        jitter seeded by the node id, and the backoff is reset as soon as a job
+        arrives so a busy daemon keeps polling quickly. The number of polls made
+        is stored in `self.polls`.
+
+        With `use_feed`, polls after the first only probe the change feed for
+        new entries and query `job_queue` once a new pending job shows up, or
+        when `probe_interval` seconds have passed since the last query: a job
+        whose lease expires becomes claimable again without a feed entry.
+        """
+        start = time()
+        self.polls = 0
+        pending = True
+        probed = start
+        while True:
+            self.polls += 1
+            if use_feed:
+                # Read the feed before querying job_queue so that a job created
+                # in between still shows up on the next probe
+                changes = self.changes()
+                pending = pending or any(change[6] == 0 for change in changes)
+                pending = pending or time() - probed >= probe_interval
+            if pending or not use_feed:
+                probed = time()
+                job = self.take_job(round_id=round_id, job_type=job_type)
+                if job is not None:
+                    self.backoff.reset()
+                    logging.info(
+                        f"{self.node_id} received job {job.job_id} after {self.polls} polls"
+                    )
+                    return job
+                pending = False
+
+            delay = self.backoff.next()
+            if timeout is not None:
+                remaining = start + timeout - time()
+                if remaining <= 0:
+                    logging.info(
+                        f"{self.node_id} timed out waiting for a job after {self.polls} polls"
+                    )
+                    return None
+                delay = min(delay, remaining)
+            sleep(delay)
+
+    def fetch_global_jobs(self, n=1, round_id=None, job_type=None, assigned=True):
+        """
+        Claim up to `n` pending jobs that are not assigned to any node (`to_id`
+        is empty), and, if `assigned` is True, jobs assigned to this node.
+
+        Jobs are claimed atomically: concurrent daemons skip rows another daemon
+        is claiming, and each claimed job is set in progress (status 1) and
+        stamped with this node's id in `claimed_by` in the same transaction, so
+        no job is handed to two daemons while its lease lasts. Jobs are claimed
+        oldest first, including in-progress jobs whose lease has expired.
+
+        Returns a list of in-progress Job objects with their payloads loaded.
+        """
+        logging.info(
+            f"{self.node_id} claiming up to {n} jobs with session id: {self.session_id}"
+        )
+        if assigned:
+            where_clause = GLOBAL_WHERE
+            params = [self.session_id, "", self.node_id]
+        else:
+            where_clause = "`session_id`=%s AND `status_code` IN (0, 1) AND `to_id`=%s"
+            params = [self.session_id, ""]
+
+        if round_id is not None:
+            where_clause += " AND `round_id`=%s"
+            params.append(round_id)
+
+        if job_type is not None:
+            where_clause += " AND `type`=%s"
+            params.append(job_type)
+
+        jobs = self._claim_jobs(where_clause, params, GLOBAL_ORDER, n)
+        logging.info(
+            f"{self.node_id} claimed {len(jobs)} jobs with session id: {self.session_id}"
+        )
+        return jobs
+
+    def _claim_jobs(self, where_clause, params, orderby, n):
+        now = time()
+        lease_expires = None if self.lease_time is None else now + self.lease_time
+        rows = self.db.claim(
+            "job_queue",
+            "`session_id`, `job_id`, `round_id`, `to_id`, `from_id`, `type`, `created_at`, `deadline`, "
+            "`payload`, `attempts`, `broadcast_id`",
+            f"{where_clause} AND {CLAIMABLE}",
+            "`status_code` = 1, `claimed_by` = %s, `last_updated` = %s, "
+            "`lease_expires` = %s, `attempts` = `attempts` + 1",
+            params=list(params) + [now, self.max_attempts],
+            set_params=(self.node_id, now, lease_expires),
+            orderby=orderby,
+            n=n,
+        )
+        broadcasts = Broadcast(self.db, self.session_id)
+        jobs = []
+        for row in rows:
+            job = Job(
+                db=self.db,
+                session_id=row[0],
+                to_id=row[3],
+                from_id=row[4],
+                type=row[5],
+                job_id=row[1],
+                round_id=row[2],
+                created_at=row[6],
+                deadline=row[7],
+                payload=broadcasts.merge(row[10], self.db.codec.decode(row[8])),
+                broadcast_id=row[10],
+            )
+            job.status_code = 1
+            job.claimed_by = self.node_id
+            job.lease_expires = lease_expires
+            job.attempts = row[9] + 1
+            if job.attempts > 1:
+                logging.info(
+                    f"{self.node_id} reclaimed job {job.job_id} (attempt {job.attempts})"
+                )
+            jobs.append(job)
+        return jobs
+
+    def renew_leases(self, lease_time=None):
+        """
+        Extend the lease on every job this daemon holds in progress to
+        `lease_time` (default `self.lease_time`) seconds from now with one
+        UPDATE, and return the new expiry. Call it more often than the lease
+        time while working on claimed jobs.
+        """
+        lease_time = self.lease_time if lease_time is None else lease_time
+        if lease_time is None:
+            raise ValueError("No lease time given and the daemon has no lease_time")
+        lease_expires = time() + lease_time
+        self.db.update(
+            table="job_queue",
+            set_values="`lease_expires` = %s",
+            where_clause="`session_id` = %s AND `claimed_by` = %s AND `status_code` = 1",
+            params=(lease_expires, self.session_id, self.node_id),
+        )
+        return lease_expires
+
+    def start_heartbeat(self, interval=HEARTBEAT_INTERVAL, renew_leases=False):
         """
-        Fetches all jobs from the job queue that are not assigned to any node.
-        Should use locking to prevent other nodes from fetching the same jobs.
+        Start a background thread that calls `heartbeat` every `interval`
+        seconds until `stop_heartbeat` or `leave` is called. Pick an interval
+        well below the `timeout` given to `Session.clean_stale_daemons`.
+
+        With `renew_leases=True` every beat also renews the leases on the jobs
+        this daemon holds, see `renew_leases`; `interval` should then also be
+        well below `lease_time`.
         """
-        raise NotImplementedError
+        if self._heartbeat is not None:
+            return
+        if renew_leases and self.lease_time is None:
+            raise ValueError("Cannot renew leases: the daemon has no lease_time")
+        self._heartbeat_stop.clear()
+        self._heartbeat = threading.Thread(
+            target=self._beat,
+            args=(interval, renew_leases),
+            name=f"heartbeat-{self.node_id}",
+            daemon=True,
+        )
+        self._heartbeat.start()
+        logging.info(f"{self.node_id} started heartbeat every {interval}s")
+
+    def stop_heartbeat(self, flush=True):
+        """
+        Stop the heartbeat thread and, if `flush` is True, write any status set
+        since its last beat.
+        """
+        if self._heartbeat is None:
+            return
+        self._heartbeat_stop.set()
+        if self._heartbeat is not threading.current_thread():
+            self._heartbeat.join()
+        self._heartbeat = None
+        if flush and self._pending_status is not None:
+            self.heartbeat()
+        self._pending_status = None
+        logging.info(f"{self.node_id} stopped heartbeat")
+
+    def heartbeat(self, renew_leases=False):
+        """
+        Update `last_seen` in the pool, together with the status set since the
+        last beat if there is one, with a single UPDATE.
+        """
+        with self._heartbeat_lock:
+            status = self._pending_status
+            self._pending_status = None
+            self.last_seen = time()
+        try:
+            if status is None:
+                self.db.update(
+                    table="pool",
+                    set_values="`last_seen` = %s",
+                    where_clause="`session_id` = %s AND `node_id` = %s",
+                    params=(self.last_seen, self.session_id, self.node_id),
+                )
+            else:
+                self.db.update(
+                    table="pool",
+                    set_values="`status_code` = %s, `last_seen` = %s",
+                    where_clause="`session_id` = %s AND `node_id` = %s",
+                    params=(status, self.last_seen, self.session_id, self.node_id),
+                )
+        except Exception:
+            # Keep the status for the next beat unless a newer one was set
+            if status is not None:
+                with self._heartbeat_lock:
+                    if self._pending_status is None:
+                        self._pending_status = status
+            raise
+        if renew_leases:
+            self.renew_leases()
+
+    def _beat(self, interval, renew_leases):
+        while not self._heartbeat_stop.wait(interval):
+            try:
+                self.heartbeat(renew_leases)
+            except Exception as error:
+                logging.warning(f"{self.node_id} heartbeat failed: {error}")
+
+    def release_prefetched(self):
+        """
+        Return the jobs in `self.job_queue` to pending (status 0) in one
+        transaction, undoing their claim and recording them in the change feed,
+        and return how many were released.
+        """
+        self._wait_for_refill()
+        with self._prefetch_lock:
+            jobs = list(self.job_queue)
+            self.job_queue.clear()
+        return self._release(jobs)
+
+    def _next_prefetched(self, round_id, job_type):
+        """
+        Pop the next job matching `round_id` and `job_type` from
+        `self.job_queue`, claiming more jobs first if none is queued, and start
+        a refill if the queue is running low.
+        """
+        job = self._pop_prefetched(round_id, job_type)
+        if job is None:
+            self._wait_for_refill()
+            job = self._pop_prefetched(round_id, job_type)
+        if job is None:
+            self._fill(round_id, job_type)
+            job = self._pop_prefetched(round_id, job_type)
+        if job is not None and len(self.job_queue) < self.low_water:
+            self._start_refill(round_id, job_type)
+        return job
+
+    def _pop_prefetched(self, round_id, job_type):
+        """
+        Pop the next queued job matching `round_id` and `job_type`, releasing
+        jobs past their deadline and dropping jobs whose lease was lost. The
+        lease is extended outside `self._prefetch_lock` so a slow database does
+        not block the refill.
+        """
+        expired = []
+        job = None
+        while job is None:
+            with self._prefetch_lock:
+                queued = next(
+                    (
+                        job
+                        for job in self.job_queue
+                        if self._matches(job, round_id, job_type)
+                    ),
+                    None,
+                )
+                if queued is None:
+                    break
+                self.job_queue.remove(queued)
+            now = time()
+            if queued.deadline is not None and queued.deadline < now:
+                expired.append(queued)
+            elif (
+                queued.lease_expires is not None
+                and queued.lease_expires < now
+                and not queued.extend_lease(self.lease_time)
+            ):
+                logging.info(
+                    f"{self.node_id} lost the lease on prefetched job {queued.job_id}"
+                )
+            else:
+                job = queued
+        if expired:
+            self._release(expired)
+        return job
+
+    @staticmethod
+    def _matches(job, round_id, job_type):
+        return (round_id is None or job.round_id == round_id) and (
+            job_type is None or job.type == job_type
+        )
+
+    def _start_refill(self, round_id, job_type):
+        with self._prefetch_lock:
+            if self._refill is not None and self._refill.is_alive():
+                return
+            self._refill = threading.Thread(
+                target=self._refill_jobs,
+                args=(round_id, job_type),
+                name=f"prefetch-{self.node_id}",
+                daemon=True,
+            )
+            self._refill.start()
+
+    def _fill(self, round_id, job_type):
+        """
+        Claim jobs into `self.job_queue` until it holds `prefetch` jobs matching
+        `round_id` and `job_type`, skipping jobs whose deadline has passed.
+        """
+        with self._prefetch_lock:
+            n = self.prefetch - sum(
+                self._matches(job, round_id, job_type) for job in self.job_queue
+            )
+        if n <= 0:
+            return
+        now = time()
+        where_clause, params = self._take_where(round_id, job_type)
+        jobs = self._claim_jobs(
+            where_clause + " AND `deadline` > %s",
+            params + [now],
+            TAKE_ORDER,
+            n,
+        )
+        logging.info(
+            f"{self.node_id} prefetched {len(jobs)} jobs with session id: {self.session_id}"
+        )
+        with self._prefetch_lock:
+            self.job_queue.extend(jobs)
+
+    def _refill_jobs(self, round_id, job_type):
+        try:
+            self._fill(round_id, job_type)
+        except Exception as error:
+            logging.warning(f"{self.node_id} failed to prefetch jobs: {error}")
+
+    def _wait_for_refill(self):
+        refill = self._refill
+        if refill is not None and refill is not threading.current_thread():
+            refill.join()
+
+    def _release(self, jobs):
+        if not jobs:
+            return 0
+        job_ids = tuple(job.job_id for job in jobs)
+        logging.info(f"{self.node_id} releasing {len(job_ids)} prefetched jobs")
+        now = time()
+        return self.db.transition(
+            "job_queue",
+            FEED_JOB_COLUMNS,
+            f"`session_id` = %s AND `claimed_by` = %s AND `status_code` = 1 "
+            f"AND `job_id` IN {in_clause(job_ids)}",
+            "`status_code` = 0, `claimed_by` = NULL, `lease_expires` = NULL, "
+            "`attempts` = `attempts` - 1, `last_updated` = %s",
+            "job_feed",
+            FEED_COLUMNS,
+            params=(self.session_id, self.node_id) + job_ids,
+            set_params=(now,),
+            extra_values=(0, now),
+            n=len(job_ids),
+        )
 
     def leave(self):
+        self.stop_heartbeat(flush=False)
+        if self.prefetch:
+            self.release_prefetched()
         logging.info(f"{self.node_id} leaving pool with session id: {self.session_id}")
         self.last_seen = time()
         self.db.update(
             table="pool",
-            set_values=f"`status_code` = 0, `last_seen` = '{self.last_seen}'",
-            where_clause=f"session_id = '{self.session_id}' AND `node_id` = '{self.node_id}'",
+            set_values="`status_code` = 0, `last_seen` = %s",
+            where_clause="`session_id` = %s AND `node_id` = %s",
+            params=(self.last_seen, self.session_id, self.node_id),
         )
         logging.info(f"{self.node_id} left pool with session id: {self.session_id}")
@@ -0,0 +1,182 @@
+import logging
+from time import time
+
+from .connector.base import in_clause
+
+FEED_COLUMNS = "(`session_id`, `job_id`, `round_id`, `to_id`, `from_id`, `type`, `status_code`, `created_at`)"
+
+# Columns of `job_queue` copied into a feed entry, followed by the status and time
+FEED_JOB_COLUMNS = "`session_id`, `job_id`, `round_id`, `to_id`, `from_id`, `type`"
+
+# Seconds within which an entry is expected to become visible after its
+# `created_at`, allowing for the length of the writing transaction and for
+# clock differences between nodes
+SETTLE_TIME = 5.0
+
+
+class FeedCursor:
+    """
+    A reader's position in the change feed, see `ChangeFeed.read`.
+
+    Sequence numbers are assigned when an entry is inserted but the entry only
+    becomes visible when its transaction commits, so on MySQL an entry can
+    appear after entries with higher numbers. The cursor therefore keeps
+    re-reading the entries created in the last `settle` seconds, remembering
+    which of them it has returned, and only moves `seq` past entries older
+    than that.
+
+    Args:
+        seq (int): Sequence number up to which every entry has been read.
+        settle (float): Seconds an entry may take to become visible.
+    """
+
+    def __init__(self, seq=0, settle=SETTLE_TIME):
+        self.seq = seq
+        self.settle = settle
+        self.seen = set()
+
+
+class ChangeFeed:
+    """
+    Append-only log of job creations and status changes in the `job_feed` table.
+
+    Every entry gets a monotonically increasing `seq` from the table's
+    auto-increment key, so a reader can ask for entries after a sequence number
+    with an indexed range probe instead of re-scanning `job_queue`. Readers
+    polling for new entries should use `read` with a `FeedCursor`, which
+    also returns entries that become visible after higher-numbered ones.
+
+    Entries are written by `Job.create`, `Job.create_many`, `Job.set_status`,
+    `JobBatch.set_status`, the `Session.clean_stale_jobs`,
+    `Session.clean_exhausted_jobs` and `Session.clean_stale_daemons` sweeps and
+    `Daemon.release_prefetched`. Claims are not recorded since the claimant
+    already knows about them, and neither is a lease expiring, which makes the
+    job claimable again without changing its status.
+
+    Entries are returned as tuples of
+    (seq, job_id, round_id, to_id, from_id, type, status_code, created_at).
+    """
+
+    def __init__(self, db, session_id: str):
+        self.db = db
+        self.session_id = session_id
+
+    def record(self, jobs, status, queue_query=False, chunk_size=500):
+        """
+        Record that each of `jobs` was created or moved to `status`. `jobs` may
+        hold Job objects, JobRecords or bare job ids, whose round, addressees
+        and type are looked up in `job_queue` with one select per `chunk_size`
+        ids.
+        """
+        job_ids = [job for job in jobs if isinstance(job, str)]
+        known = self._lookup(job_ids, chunk_size) if job_ids else {}
+        rows = [self._row(job, status, known) for job in jobs]
+        if len(rows) == 1:
+            return self.db.insert(
+                "job_feed", FEED_COLUMNS, rows[0], queue_query=queue_query
+            )
+        return self.db.insert_many(
+            "job_feed",
+            FEED_COLUMNS,
+            rows,
+            chunk_size=chunk_size,
+            queue_query=queue_query,
+        )
+
+    def since(self, seq=0, to_id=None, from_id=None, round_id=None):
+        """
+        Return the entries after sequence number `seq`, oldest first, optionally
+        restricted to jobs sent to `to_id`, sent by `from_id` or in `round_id`.
+        """
+        where_clause = "`session_id`=%s AND `seq` > %s"
+        params = [self.session_id, seq]
+        if to_id is not None:
+            where_clause += " AND `to_id`=%s"
+            params.append(to_id)
+        if from_id is not None:
+            where_clause += " AND `from_id`=%s"
+            params.append(from_id)
+        if round_id is not None:
+            where_clause += " AND `round_id`=%s"
+            params.append(round_id)
+        changes = self.db.select(
+            "job_feed",
+            "`seq`, `job_id`, `round_id`, `to_id`, `from_id`, `type`, `status_code`, `created_at`",
+            where_clause,
+            orderby="`seq` ASC",
+            params=params,
+        )
+        if changes is None:
+            return []
+        return list(changes)
+
+    def read(self, cursor, to_id=None, from_id=None, round_id=None):
+        """
+        Return the entries `cursor` has not returned yet, oldest first, with the
+        same filters as `since`, and advance the cursor.
+        """
+        changes = self.since(
+            cursor.seq, to_id=to_id, from_id=from_id, round_id=round_id
+        )
+        new = [change for change in changes if change[0] not in cursor.seen]
+        cutoff = time() - cursor.settle
+        for change in changes:
+            if change[7] >= cutoff:
+                break
+            cursor.seq = change[0]
+        cursor.seen = {change[0] for change in changes if change[0] > cursor.seq}
+        return new
+
+    def latest(self):
+        """
+        Return the most recent sequence number in the session, or 0.
+        """
+        seq = self.db.select_one(
+            "job_feed", "MAX(`seq`)", "`session_id`=%s", params=(self.session_id,)
+        )
+        if seq is None or seq[0] is None:
+            return 0
+        return seq[0]
+
+    def clear(self, queue_query=False):
+        logging.info(f"Clearing change feed with session id: {self.session_id}")
+        return self.db.delete(
+            "job_feed",
+            "`session_id`=%s",
+            queue_query=queue_query,
+            params=(self.session_id,),
+        )
+
+    def _lookup(self, job_ids, chunk_size):
+        """
+        Return the feed columns of the jobs in `job_ids` found in `job_queue`,
+        keyed by job id.
+        """
+        known = {}
+        for i in range(0, len(job_ids), chunk_size):
+            chunk = tuple(job_ids[i : i + chunk_size])
+            rows = self.db.select(
+                "job_queue",
+                FEED_JOB_COLUMNS,
+                f"`session_id`=%s AND `job_id` IN {in_clause(chunk)}",
+                params=(self.session_id,) + chunk,
+            )
+            for row in rows or []:
+                known[row[1]] = tuple(row)
+        return known
+
+    def _row(self, job, status, known=None):
+        if isinstance(job, str):
+            if known and job in known:
+                return known[job] + (status, time())
+            return (self.session_id, job, None, None, None, None, status, time())
+        return (
+            self.session_id,
+            job.job_id,
+            job.round_id,
+            job.to_id,
+            job.from_id,
+            job.type,
+            status,
+            time(),
+        )
@@ -1,9 +1,13 @@
 import json
 import logging
 import uuid
+from collections import namedtuple
 from time import time
 
-from . import utils
+from .broadcast import Broadcast
+from .codec import JSON
+from .connector.base import in_clause
+from .feed import ChangeFeed
 
 """
 TO DO
@@ -13,6 +17,20 @@ TO DO
     - Add docstrings
 """
 
+JOB_COLUMNS = (
+    "(`session_id`, `job_id`, `round_id`, `to_id`, `from_id`, `type`, `created_at`, "
+    "`deadline`, `last_updated`, `status_code`, `payload`, `broadcast_id`)"
+)
+
+RECORD_COLUMNS = (
+    "`session_id`, `job_id`, `round_id`, `to_id`, `from_id`, `type`, `created_at`, "
+    "`deadline`, `status_code`"
+)
+
+# Number of times a job is handed out before an expired lease stops returning
+# it to the claimable pool
+MAX_ATTEMPTS = 3
+
 
 class Job:
     def __init__(
@@ -27,6 +45,7 @@ class Job:
         created_at: float = None,
         deadline: float = None,
         payload=json.dumps({}),
+        broadcast_id: str = None,
     ):
         self.db = db
         self.session_id = session_id
@@ -34,7 +53,11 @@ class Job:
         self.from_id = from_id
         self.type = type
         self.payload = payload
+        self.broadcast_id = broadcast_id
         self.status_code = 0
+        self.claimed_by = None
+        self.lease_expires = None
+        self.attempts = 0
 
         self.round_id = str(uuid.uuid4()) if round_id is None else round_id
         self.job_id = str(uuid.uuid4()) if job_id is None else job_id
@@ -45,23 +68,9 @@ class Job:
     def create(self, status=0, clear_payload=True):
         logging.info(f"Creating job with id: {self.job_id}")
         self.last_updated = time()
-        _created = self.db.insert(
-            "job_queue",
-            "(`session_id`, `job_id`, `round_id`, `to_id`, `from_id`, `type`, `created_at`, `deadline`, `last_updated`, `status_code`, `payload`)",
-            (
-                self.session_id,
-                self.job_id,
-                self.round_id,
-                self.to_id,
-                self.from_id,
-                self.type,
-                self.created_at,
-                self.deadline,
-                self.last_updated,
-                status,
-                json.dumps(self.payload, cls=utils.NpEncoder),
-            ),
-        )
+        self.db.insert("job_queue", JOB_COLUMNS, self._row(status), queue_query=True)
+        ChangeFeed(self.db, self.session_id).record([self], status, queue_query=True)
+        _created = self.db._execute_query_queue()[0]
         if _created:
             if clear_payload:
                 self.payload = {}
@@ -69,13 +78,77 @@ class Job:
             return True
         return False
 
+    @staticmethod
+    def create_many(jobs, status=0, clear_payload=True, chunk_size=500):
+        """
+        Create `jobs` and their change feed entries with chunked multi-row
+        inserts in a single transaction and return their job ids. All jobs must
+        share the same connector and session.
+        """
+        jobs = list(jobs)
+        if not jobs:
+            return []
+        db = jobs[0].db
+        logging.info(f"Creating {len(jobs)} jobs")
+        last_updated = time()
+        for job in jobs:
+            job.last_updated = last_updated
+        db.insert_many(
+            "job_queue",
+            JOB_COLUMNS,
+            [job._row(status) for job in jobs],
+            chunk_size=chunk_size,
+            queue_query=True,
+        )
+        ChangeFeed(db, jobs[0].session_id).record(
+            jobs, status, queue_query=True, chunk_size=chunk_size
+        )
+        db._execute_query_queue()
+        for job in jobs:
+            job.status_code = status
+            if clear_payload:
+                job.payload = {}
+        logging.info(f"Created {len(jobs)} jobs")
+        return [job.job_id for job in jobs]
+
+    def _row(self, status):
+        return (
+            self.session_id,
+            self.job_id,
+            self.round_id,
+            self.to_id,
+            self.from_id,
+            self.type,
+            self.created_at,
+            self.deadline,
+            self.last_updated,
+            status,
+            self.db.codec.encode(self.payload),
+            self.broadcast_id,
+        )
+
     def status(self):
+        """
+        Return the job's status code. The read may be served by a replica of the
+        database, so it can lag a recent `set_status` by up to the connector's
+        `max_staleness`.
+        """
         logging.info(f"Getting status of job with id {self.job_id}")
         status = self.db.select_one(
             "job_queue",
             "status_code",
-            f"`session_id`='{self.session_id}' AND `job_id`='{self.job_id}'",
+            "`session_id`=%s AND `job_id`=%s",
+            params=(self.session_id, self.job_id),
+            read_only=True,
         )
+        if status is None:
+            # A job created moments ago may not have reached the replica yet
+            status = self.db.select_one(
+                "job_queue",
+                "status_code",
+                "`session_id`=%s AND `job_id`=%s",
+                params=(self.session_id, self.job_id),
+            )
         logging.info(f"Status of job with id {self.job_id} is {status}")
         self.status_code = status[0]
         return status[0]
@@ -85,46 +158,89 @@ class Job:
         logging.info(f"Setting status of job with id {self.job_id} to {status}")
         self.db.update(
             table="job_queue",
-            set_values=f"`status_code` = '{status}'",
-            where_clause=f"session_id = '{self.session_id}' AND `job_id` = '{self.job_id}'",
+            set_values="`status_code` = %s, `last_updated` = %s",
+            where_clause="`session_id` = %s AND `job_id` = %s",
+            queue_query=True,
+            params=(status, self.last_updated, self.session_id, self.job_id),
         )
+        ChangeFeed(self.db, self.session_id).record([self], status, queue_query=True)
+        self.db._execute_query_queue()
         logging.info(f"Status of job with id {self.job_id} set to {status}")
         self.status_code = status
 
+    def extend_lease(self, lease_time: float):
+        """
+        Move the lease on this in-progress job to `lease_time` seconds from now.
+
+        Returns False if the job is no longer held by `claimed_by`, because its
+        lease expired and another daemon claimed it or it has been completed.
+        The caller should then abandon the job, as its result may be reported
+        twice otherwise.
+        """
+        lease_expires = time() + lease_time
+        logging.info(f"Extending lease of job with id {self.job_id} to {lease_expires}")
+        # A conditional UPDATE waits for a row locked by a concurrent claim
+        # instead of skipping it, so a held lease is never reported lost
+        held = self.db.update_rows(
+            "job_queue",
+            "`lease_expires` = %s",
+            "`session_id`=%s AND `job_id`=%s AND `status_code`=1 AND `claimed_by`=%s",
+            params=(lease_expires, self.session_id, self.job_id, self.claimed_by),
+        )
+        if not held:
+            logging.info(f"Lease of job with id {self.job_id} was lost")
+            return False
+        self.lease_expires = lease_expires
+        return True
+
     def set_payload(self, payload: str):
         self.last_updated = time()
         logging.info(f"Setting payload of job with id {self.job_id} to {payload}")
-        query = "UPDATE `job` SET payload = %s WHERE job_id = %s"
-        self.db.connect()
-        self.db.cursor.execute(query, (json.dumps(payload), self.job_id))
-        self.db.connection.commit()
-        self.db.disconnect()
+        self.db.update(
+            table="job_queue",
+            set_values="`payload` = %s, `last_updated` = %s",
+            where_clause="`session_id` = %s AND `job_id` = %s",
+            params=(
+                self.db.codec.encode(payload),
+                self.last_updated,
+                self.session_id,
+                self.job_id,
+            ),
+        )
         logging.info(f"Payload of job with id {self.job_id} set to {payload}")
 
     def get_payload(self, store_payload=True):
         logging.info(f"Getting payload of job with id {self.job_id}")
         payload = self.db.select_one(
             "job_queue",
-            "payload",
-            f"`session_id`='{self.session_id}' AND `job_id`='{self.job_id}'",
+            "`payload`, `broadcast_id`",
+            "`session_id`=%s AND `job_id`=%s",
+            params=(self.session_id, self.job_id),
         )
         logging.info(f"Payload of job with id {self.job_id} is {payload}")
+        self.broadcast_id = payload[1]
+        payload = Broadcast(self.db, self.session_id).merge(
+            payload[1], self.db.codec.decode(payload[0])
+        )
         if store_payload:
-            self.payload = json.loads(payload[0])
-        return json.loads(payload[0])
+            self.payload = payload
+        return payload
 
     def results_available(self, type=None):
         """
         Check if the results of the job are available
         """
         logging.info(f"Checking if results are available for job with id {self.job_id}")
-        where_clause = f"`session_id`='{self.session_id}' AND `job_id`='{self.job_id}' AND `round_id`='{self.round_id}' AND `to_id`='{self.from_id}' AND `from_id`='{self.to_id}'"
+        where_clause = "`session_id`=%s AND `job_id`=%s AND `round_id`=%s AND `to_id`=%s AND `from_id`=%s"
+        params = [self.session_id, self.job_id, self.round_id, self.from_id, self.to_id]
         if type:
-            where_clause += f" AND `type`='{type}'"
+            where_clause += " AND `type`=%s"
+            params.append(type)
         results_available = self.db.select_one(
             "job_queue",
             "status_code",
             where_clause,
+            params=params,
         )
         logging.info(
             f"Results are available for job with id {self.job_id}: {results_available}"
@@ -136,6 +252,151 @@ class Job:
         logging.info(f"Deleting job with id {self.job_id}")
         self.db.delete(
             "job_queue",
-            f"`session_id`='{self.session_id}' AND `job_id`='{self.job_id}'",
+            "`session_id`=%s AND `job_id`=%s",
+            params=(self.session_id, self.job_id),
         )
         logging.info(f"Job with id {self.job_id} deleted")
+
+
+class JobRecord(
+    namedtuple(
+        "JobRecord",
+        [
+            "session_id",
+            "job_id",
+            "round_id",
+            "to_id",
+            "from_id",
+            "type",
+            "created_at",
+            "deadline",
+            "status_code",
+            "payload",
+        ],
+    )
+):
+    """
+    Read-only view of a `job_queue` row yielded by the streaming job iterators.
+    It is a plain tuple, so a coordinator can hold tens of thousands of them
+    where full `Job` objects would not fit; `payload` is None unless the
+    iterator was asked for payloads. Use `job` to get a `Job` for one record.
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def from_row(cls, row, codec=JSON):
+        """
+        Build a record from a row selected with `RECORD_COLUMNS`, optionally
+        followed by `payload`, which is decoded with `codec`.
+        """
+        payload = codec.decode(row[9]) if len(row) > 9 else None
+        return cls(*row[:9], payload)
+
+    def job(self, db):
+        job = Job(
+            db=db,
+            session_id=self.session_id,
+            to_id=self.to_id,
+            from_id=self.from_id,
+            type=self.type,
+            round_id=self.round_id,
+            job_id=self.job_id,
+            created_at=self.created_at,
+            deadline=self.deadline,
+            payload=self.payload if self.payload is not None else {},
+        )
+        job.status_code = self.status_code
+        return job
+
+
+def iter_job_records(
+    db,
+    where_clause,
+    params,
+    orderby=None,
+    with_payload=False,
+    chunk_size=1000,
+    table="job_queue",
+):
+    """
+    Yield a `JobRecord` for each row of `table` (`job_queue` or `job_history`)
+    matching `where_clause`, streaming the rows from the server `chunk_size` at
+    a time. Payloads of broadcast jobs are merged with their shared part.
+    """
+    columns = (
+        RECORD_COLUMNS + ", `payload`, `broadcast_id`"
+        if with_payload
+        else RECORD_COLUMNS
+    )
+    for rows in db.select_stream(
+        table,
+        columns,
+        where_clause,
+        orderby=orderby,
+        params=params,
+        chunk_size=chunk_size,
+    ):
+        for row in rows:
+            record = JobRecord.from_row(row, db.codec)
+            if with_payload and row[10] is not None:
+                payload = Broadcast(db, record.session_id).merge(
+                    row[10], record.payload
+                )
+                record = record._replace(payload=payload)
+            yield record
+
+
+class JobBatch:
+    """
+    A set of jobs in one session whose status is changed together.
+
+    Status changes are issued as `UPDATE ... WHERE job_id IN (...)` statements
+    over chunks of at most `chunk_size` jobs, sent together with their change
+    feed entries as a single batch.
+
+    Args:
+        db: Database connector.
+        session_id (str): Session the jobs belong to.
+        jobs (list): Job objects, JobRecords or job ids.
+        chunk_size (int): Maximum number of jobs per statement.
+    """
+
+    def __init__(self, db, session_id: str, jobs, chunk_size=500):
+        self.db = db
+        self.session_id = session_id
+        self.jobs = list(jobs)
+        self.chunk_size = chunk_size
+
+    def __len__(self):
+        return len(self.jobs)
+
+    @property
+    def job_ids(self):
+        return [job if isinstance(job, str) else job.job_id for job in self.jobs]
+
+    def set_status(self, status: int):
+        if not self.jobs:
+            return True
+        last_updated = time()
+        job_ids = self.job_ids
+        logging.info(f"Setting status of {len(job_ids)} jobs to {status}")
+        for i in range(0, len(job_ids), self.chunk_size):
+            chunk = tuple(job_ids[i : i + self.chunk_size])
+            self.db.update(
+                table="job_queue",
+                set_values="`status_code` = %s, `last_updated` = %s",
+                where_clause=f"`session_id` = %s AND `job_id` IN {in_clause(chunk)}",
+                queue_query=True,
+                params=(status, last_updated, self.session_id) + chunk,
+            )
+        ChangeFeed(self.db, self.session_id).record(
+            self.jobs, status, queue_query=True, chunk_size=self.chunk_size
+        )
+        self.db._execute_query_queue()
+        for job in self.jobs:
+            if isinstance(job, Job):
+                job.status_code = status
+                job.last_updated = last_updated
+        logging.info(f"Status of {len(job_ids)} jobs set to {status}")
+        return True
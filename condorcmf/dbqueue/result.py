@@ -29,7 +29,15 @@ class Result:
         res = self.db.insert(
             "results",
             "(`session_id`, `node_id`, `role`, `job_id`, `attributes`, `payload`, `created_at`)",
-            (self.session_id, self.node_id, self.role, self.results_id, json.dumps(self.attributes, cls=utils.NpEncoder), json.dumps(self.payload, cls=utils.NpEncoder), time()),
+            (
+                self.session_id,
+                self.node_id,
+                self.role,
+                self.results_id,
+                json.dumps(self.attributes, cls=utils.NpEncoder),
+                self.db.codec.encode(self.payload),
+                time(),
+            ),
         )
         return res
 
@@ -37,8 +45,14 @@ class Result:
         results = self.db.select(
             "results",
             "*",
-            "WHERE `results_id` = %s",
+            "`session_id` = %s AND `job_id` = %s",
+            params=(self.session_id, self.results_id),
         )
+        return results
 
     def delete(self):
-        self.db.delete("results", "results_id", self.results_id)
\ No newline at end of file
+        self.db.delete(
+            "results",
+            "`session_id` = %s AND `job_id` = %s",
+            params=(self.session_id, self.results_id),
+        )
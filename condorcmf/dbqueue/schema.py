@@ -0,0 +1,613 @@
+"""
+DDL for the dbqueue tables and the forward migrations between schema versions.
+
+Each migration lists its statements for every supported dialect ("mysql" for
+the MySQL/MariaDB connectors, "sqlite" for SQLiteConnector). `migrate` records
+the applied versions in the `schema_version` table and only runs migrations
+newer than the recorded version, so it is safe to call on every start-up from
+any number of nodes. Statements must be idempotent as well, since MySQL commits
+DDL implicitly and a migration interrupted half-way is re-run from the start.
+
+The indexes follow the WHERE/ORDER BY shapes issued by `Daemon`, `Session`,
+`Job` and `ChangeFeed`; `HOT_QUERIES` lists those shapes and
+`verify_index_coverage` checks each of them against the database's plan.
+"""
+
+import logging
+import re
+from time import time
+
+from .daemon import CLAIMABLE, GLOBAL_WHERE, TAKE_ORDER, TAKE_WHERE
+
+LOCK_NAME = "condorcmf_schema"
+
+
+class Migration:
+    """
+    A numbered schema change with its statements for each dialect. A statement
+    is either SQL text or a callable taking (cursor, dialect) for changes that
+    must first inspect the database.
+    """
+
+    def __init__(self, version, description, mysql, sqlite):
+        self.version = version
+        self.description = description
+        self.statements = {"mysql": mysql, "sqlite": sqlite}
+
+
+def create_index(name, table, columns):
+    """
+    Return a migration step creating index `name` on `table` (`columns` is the
+    SQL column list) unless it already exists. MySQL has no
+    `CREATE INDEX IF NOT EXISTS`, so there the step checks the catalogue first.
+    """
+
+    def step(cursor, dialect):
+        if dialect == "sqlite":
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS `{name}` ON `{table}` ({columns})"
+            )
+            return
+        cursor.execute(
+            "SELECT COUNT(*) FROM information_schema.statistics WHERE "
+            "`table_schema` = DATABASE() AND `table_name` = %s AND `index_name` = %s",
+            (table, name),
+        )
+        if cursor.fetchone()[0] == 0:
+            cursor.execute(f"CREATE INDEX `{name}` ON `{table}` ({columns})")
+
+    return step
+
+
+def add_column(table, column, definition):
+    """
+    Return a migration step adding `column` with the SQL type `definition` to
+    `table` unless the table already has it. Neither MySQL nor SQLite supports
+    `ADD COLUMN IF NOT EXISTS`, so the step checks the table's columns first.
+    """
+
+    def step(cursor, dialect):
+        if dialect == "sqlite":
+            cursor.execute(f"PRAGMA table_info(`{table}`)")
+            exists = any(row[1] == column for row in cursor.fetchall())
+        else:
+            cursor.execute(
+                "SELECT COUNT(*) FROM information_schema.columns WHERE "
+                "`table_schema` = DATABASE() AND `table_name` = %s AND `column_name` = %s",
+                (table, column),
+            )
+            exists = cursor.fetchone()[0] > 0
+        if not exists:
+            cursor.execute(f"ALTER TABLE `{table}` ADD COLUMN `{column}` {definition}")
+
+    return step
+
+
+VERSION_TABLE = {
+    "mysql": """CREATE TABLE IF NOT EXISTS `schema_version` (
+        `version` INT NOT NULL PRIMARY KEY,
+        `description` VARCHAR(255),
+        `applied_at` DOUBLE
+    ) ENGINE=InnoDB""",
+    "sqlite": """CREATE TABLE IF NOT EXISTS `schema_version` (
+        `version` INTEGER NOT NULL PRIMARY KEY,
+        `description` TEXT,
+        `applied_at` REAL
+    )""",
+}
+
+MIGRATIONS = [
+    Migration(
+        1,
+        "Create the dbqueue tables",
+        mysql=[
+            """CREATE TABLE IF NOT EXISTS `session` (
+                `id` BIGINT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+                `session_id` VARCHAR(64) NOT NULL,
+                `created_at` DOUBLE,
+                `active` TINYINT,
+                `deadline` DOUBLE,
+                `payload` LONGTEXT,
+                KEY `session_session` (`session_id`)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4""",
+            """CREATE TABLE IF NOT EXISTS `pool` (
+                `id` BIGINT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+                `session_id` VARCHAR(64) NOT NULL,
+                `node_id` VARCHAR(64) NOT NULL,
+                `role` INT,
+                `created_at` DOUBLE,
+                `last_seen` DOUBLE,
+                `status_code` INT,
+                `payload` LONGTEXT,
+                KEY `pool_session_node` (`session_id`, `node_id`),
+                KEY `pool_session_status` (`session_id`, `status_code`, `last_seen`)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4""",
+            """CREATE TABLE IF NOT EXISTS `job_queue` (
+                `id` BIGINT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+                `session_id` VARCHAR(64) NOT NULL,
+                `job_id` VARCHAR(64) NOT NULL,
+                `round_id` VARCHAR(64),
+                `to_id` VARCHAR(64),
+                `from_id` VARCHAR(64),
+                `type` INT,
+                `created_at` DOUBLE,
+                `deadline` DOUBLE,
+                `last_updated` DOUBLE,
+                `status_code` INT NOT NULL DEFAULT 0,
+                `payload` LONGTEXT,
+                `claimed_by` VARCHAR(64),
+                KEY `job_queue_fetch` (`session_id`, `to_id`, `status_code`, `created_at`),
+                KEY `job_queue_job` (`session_id`, `job_id`),
+                KEY `job_queue_round` (`session_id`, `round_id`),
+                KEY `job_queue_status` (`session_id`, `status_code`, `deadline`)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4""",
+            """CREATE TABLE IF NOT EXISTS `job_feed` (
+                `seq` BIGINT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+                `session_id` VARCHAR(64) NOT NULL,
+                `job_id` VARCHAR(64) NOT NULL,
+                `round_id` VARCHAR(64),
+                `to_id` VARCHAR(64),
+                `from_id` VARCHAR(64),
+                `type` INT,
+                `status_code` INT,
+                `created_at` DOUBLE,
+                KEY `job_feed_session` (`session_id`, `seq`),
+                KEY `job_feed_to` (`session_id`, `to_id`, `seq`)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4""",
+            """CREATE TABLE IF NOT EXISTS `checkpoint` (
+                `id` BIGINT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+                `session_id` VARCHAR(64) NOT NULL,
+                `node_id` VARCHAR(64) NOT NULL,
+                `node_type` INT,
+                `created_at` DOUBLE,
+                `type` INT,
+                `payload` LONGTEXT,
+                KEY `checkpoint_node` (`session_id`, `node_id`, `type`)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4""",
+            """CREATE TABLE IF NOT EXISTS `results` (
+                `id` BIGINT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+                `session_id` VARCHAR(64) NOT NULL,
+                `node_id` VARCHAR(64),
+                `role` INT,
+                `job_id` VARCHAR(64),
+                `attributes` LONGTEXT,
+                `payload` LONGTEXT,
+                `created_at` DOUBLE,
+                KEY `results_job` (`session_id`, `job_id`)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4""",
+        ],
+        sqlite=[
+            """CREATE TABLE IF NOT EXISTS `session` (
+                `id` INTEGER PRIMARY KEY AUTOINCREMENT,
+                `session_id` TEXT NOT NULL,
+                `created_at` REAL,
+                `active` INTEGER,
+                `deadline` REAL,
+                `payload` TEXT
+            )""",
+            """CREATE TABLE IF NOT EXISTS `pool` (
+                `id` INTEGER PRIMARY KEY AUTOINCREMENT,
+                `session_id` TEXT NOT NULL,
+                `node_id` TEXT NOT NULL,
+                `role` INTEGER,
+                `created_at` REAL,
+                `last_seen` REAL,
+                `status_code` INTEGER,
+                `payload` TEXT
+            )""",
+            """CREATE TABLE IF NOT EXISTS `job_queue` (
+                `id` INTEGER PRIMARY KEY AUTOINCREMENT,
+                `session_id` TEXT NOT NULL,
+                `job_id` TEXT NOT NULL,
+                `round_id` TEXT,
+                `to_id` TEXT,
+                `from_id` TEXT,
+                `type` INTEGER,
+                `created_at` REAL,
+                `deadline` REAL,
+                `last_updated` REAL,
+                `status_code` INTEGER NOT NULL DEFAULT 0,
+                `payload` TEXT,
+                `claimed_by` TEXT
+            )""",
+            """CREATE TABLE IF NOT EXISTS `job_feed` (
+                `seq` INTEGER PRIMARY KEY AUTOINCREMENT,
+                `session_id` TEXT NOT NULL,
+                `job_id` TEXT NOT NULL,
+                `round_id` TEXT,
+                `to_id` TEXT,
+                `from_id` TEXT,
+                `type` INTEGER,
+                `status_code` INTEGER,
+                `created_at` REAL
+            )""",
+            """CREATE TABLE IF NOT EXISTS `checkpoint` (
+                `id` INTEGER PRIMARY KEY AUTOINCREMENT,
+                `session_id` TEXT NOT NULL,
+                `node_id` TEXT NOT NULL,
+                `node_type` INTEGER,
+                `created_at` REAL,
+                `type` INTEGER,
+                `payload` TEXT
+            )""",
+            """CREATE TABLE IF NOT EXISTS `results` (
+                `id` INTEGER PRIMARY KEY AUTOINCREMENT,
+                `session_id` TEXT NOT NULL,
+                `node_id` TEXT,
+                `role` INTEGER,
+                `job_id` TEXT,
+                `attributes` TEXT,
+                `payload` TEXT,
+                `created_at` REAL
+            )""",
+            "CREATE INDEX IF NOT EXISTS `session_session` ON `session` (`session_id`)",
+            "CREATE INDEX IF NOT EXISTS `pool_session_node` ON `pool` (`session_id`, `node_id`)",
+            "CREATE INDEX IF NOT EXISTS `pool_session_status` ON `pool` (`session_id`, `status_code`, `last_seen`)",
+            "CREATE INDEX IF NOT EXISTS `job_queue_fetch` "
+            "ON `job_queue` (`session_id`, `to_id`, `status_code`, `created_at`)",
+            "CREATE INDEX IF NOT EXISTS `job_queue_job` ON `job_queue` (`session_id`, `job_id`)",
+            "CREATE INDEX IF NOT EXISTS `job_queue_round` ON `job_queue` (`session_id`, `round_id`)",
+            "CREATE INDEX IF NOT EXISTS `job_queue_status` ON `job_queue` (`session_id`, `status_code`, `deadline`)",
+            "CREATE INDEX IF NOT EXISTS `job_feed_session` ON `job_feed` (`session_id`, `seq`)",
+            "CREATE INDEX IF NOT EXISTS `job_feed_to` ON `job_feed` (`session_id`, `to_id`, `seq`)",
+            "CREATE INDEX IF NOT EXISTS `checkpoint_node` ON `checkpoint` (`session_id`, `node_id`, `type`)",
+            "CREATE INDEX IF NOT EXISTS `results_job` ON `results` (`session_id`, `job_id`)",
+        ],
+    ),
+    Migration(
+        2,
+        "Add the job_history archive table",
+        mysql=[
+            """CREATE TABLE IF NOT EXISTS `job_history` (
+                `id` BIGINT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+                `session_id` VARCHAR(64) NOT NULL,
+                `job_id` VARCHAR(64) NOT NULL,
+                `round_id` VARCHAR(64),
+                `to_id` VARCHAR(64),
+                `from_id` VARCHAR(64),
+                `type` INT,
+                `created_at` DOUBLE,
+                `deadline` DOUBLE,
+                `last_updated` DOUBLE,
+                `status_code` INT,
+                `payload` LONGTEXT,
+                `claimed_by` VARCHAR(64),
+                `archived_at` DOUBLE,
+                KEY `job_history_job` (`session_id`, `job_id`),
+                KEY `job_history_round` (`session_id`, `round_id`),
+                KEY `job_history_archived` (`session_id`, `archived_at`)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4""",
+            create_index(
+                "job_queue_archive",
+                "job_queue",
+                "`session_id`, `status_code`, `last_updated`",
+            ),
+        ],
+        sqlite=[
+            """CREATE TABLE IF NOT EXISTS `job_history` (
+                `id` INTEGER PRIMARY KEY AUTOINCREMENT,
+                `session_id` TEXT NOT NULL,
+                `job_id` TEXT NOT NULL,
+                `round_id` TEXT,
+                `to_id` TEXT,
+                `from_id` TEXT,
+                `type` INTEGER,
+                `created_at` REAL,
+                `deadline` REAL,
+                `last_updated` REAL,
+                `status_code` INTEGER,
+                `payload` TEXT,
+                `claimed_by` TEXT,
+                `archived_at` REAL
+            )""",
+            "CREATE INDEX IF NOT EXISTS `job_history_job` ON `job_history` (`session_id`, `job_id`)",
+            "CREATE INDEX IF NOT EXISTS `job_history_round` ON `job_history` (`session_id`, `round_id`)",
+            "CREATE INDEX IF NOT EXISTS `job_history_archived` ON `job_history` (`session_id`, `archived_at`)",
+            create_index(
+                "job_queue_archive",
+                "job_queue",
+                "`session_id`, `status_code`, `last_updated`",
+            ),
+        ],
+    ),
+    Migration(
+        3,
+        "Add job leases",
+        mysql=[
+            add_column("job_queue", "lease_expires", "DOUBLE"),
+            add_column("job_queue", "attempts", "INT NOT NULL DEFAULT 0"),
+            add_column("job_history", "attempts", "INT"),
+            create_index(
+                "job_queue_lease",
+                "job_queue",
+                "`session_id`, `claimed_by`, `status_code`",
+            ),
+        ],
+        sqlite=[
+            add_column("job_queue", "lease_expires", "REAL"),
+            add_column("job_queue", "attempts", "INTEGER NOT NULL DEFAULT 0"),
+            add_column("job_history", "attempts", "INTEGER"),
+            create_index(
+                "job_queue_lease",
+                "job_queue",
+                "`session_id`, `claimed_by`, `status_code`",
+            ),
+        ],
+    ),
+    # SQLite stores bytes in a TEXT column as they are, so only MySQL needs
+    # binary payload columns. Existing JSON text is kept as its UTF-8 bytes.
+    Migration(
+        4,
+        "Store payloads as binary",
+        mysql=[
+            "ALTER TABLE `job_queue` MODIFY `payload` LONGBLOB",
+            "ALTER TABLE `job_history` MODIFY `payload` LONGBLOB",
+            "ALTER TABLE `checkpoint` MODIFY `payload` LONGBLOB",
+            "ALTER TABLE `results` MODIFY `payload` LONGBLOB",
+        ],
+        sqlite=[],
+    ),
+    Migration(
+        5,
+        "Add the broadcast table",
+        mysql=[
+            """CREATE TABLE IF NOT EXISTS `broadcast` (
+                `id` BIGINT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+                `session_id` VARCHAR(64) NOT NULL,
+                `broadcast_id` VARCHAR(64) NOT NULL,
+                `round_id` VARCHAR(64),
+                `created_at` DOUBLE,
+                `payload` LONGBLOB,
+                KEY `broadcast_id` (`session_id`, `broadcast_id`),
+                KEY `broadcast_round` (`session_id`, `round_id`)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4""",
+            add_column("job_queue", "broadcast_id", "VARCHAR(64)"),
+            add_column("job_history", "broadcast_id", "VARCHAR(64)"),
+        ],
+        sqlite=[
+            """CREATE TABLE IF NOT EXISTS `broadcast` (
+                `id` INTEGER PRIMARY KEY AUTOINCREMENT,
+                `session_id` TEXT NOT NULL,
+                `broadcast_id` TEXT NOT NULL,
+                `round_id` TEXT,
+                `created_at` REAL,
+                `payload` BLOB
+            )""",
+            "CREATE INDEX IF NOT EXISTS `broadcast_id` ON `broadcast` (`session_id`, `broadcast_id`)",
+            "CREATE INDEX IF NOT EXISTS `broadcast_round` ON `broadcast` (`session_id`, `round_id`)",
+            add_column("job_queue", "broadcast_id", "TEXT"),
+            add_column("job_history", "broadcast_id", "TEXT"),
+        ],
+    ),
+    Migration(
+        6,
+        "Index the replies of a round for gather",
+        mysql=[
+            create_index(
+                "job_queue_gather",
+                "job_queue",
+                "`session_id`, `round_id`, `status_code`, `created_at`",
+            ),
+        ],
+        sqlite=[
+            create_index(
+                "job_queue_gather",
+                "job_queue",
+                "`session_id`, `round_id`, `status_code`, `created_at`",
+            ),
+        ],
+    ),
+    Migration(
+        7,
+        "Index a node's jobs by age so claims need no sort",
+        mysql=[
+            create_index(
+                "job_queue_claim",
+                "job_queue",
+                "`session_id`, `to_id`, `created_at`, `status_code`",
+            ),
+        ],
+        sqlite=[
+            create_index(
+                "job_queue_claim",
+                "job_queue",
+                "`session_id`, `to_id`, `created_at`, `status_code`",
+            ),
+        ],
+    ),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1].version
+
+# (name, table, where_clause, orderby) of the queries issued on every poll or
+# status change. Each must be answered from an index, including its ORDER BY.
+HOT_QUERIES = [
+    (
+        "Daemon.fetch_job",
+        "job_queue",
+        "`session_id`=%s AND `to_id`=%s AND `status_code`=0",
+        "created_at DESC",
+    ),
+    # The claims exactly as `Daemon._claim_jobs` issues them
+    ("Daemon.take_job", "job_queue", f"{TAKE_WHERE} AND {CLAIMABLE}", TAKE_ORDER),
+    (
+        "Daemon.take_job (prefetch)",
+        "job_queue",
+        f"{TAKE_WHERE} AND `deadline` > %s AND {CLAIMABLE}",
+        TAKE_ORDER,
+    ),
+    # Global claims read two `to_id` ranges and sort the few candidate rows, so
+    # only the index lookup is checked
+    ("Daemon.fetch_global_jobs", "job_queue", f"{GLOBAL_WHERE} AND {CLAIMABLE}", None),
+    (
+        "Daemon.renew_leases",
+        "job_queue",
+        "`session_id` = %s AND `claimed_by` = %s AND `status_code` = 1",
+        None,
+    ),
+    ("Job.status", "job_queue", "`session_id`=%s AND `job_id`=%s", None),
+    (
+        "Session.count_stale_jobs",
+        "job_queue",
+        "`session_id`=%s AND `deadline` < %s AND `status_code` NOT IN (1,2,3)",
+        None,
+    ),
+    (
+        "Session.gather",
+        "job_queue",
+        "`session_id`=%s AND `status_code`=0 AND `round_id`=%s AND `from_id` IN (%s, %s)",
+        "`created_at` ASC",
+    ),
+    (
+        "Session.gather (count)",
+        "job_queue",
+        "`session_id`=%s AND `status_code`=0 AND `round_id`=%s",
+        "`created_at` ASC",
+    ),
+    ("Session.clean_jobs", "job_queue", "`session_id`=%s AND `round_id`=%s", None),
+    (
+        "Session.archive_jobs",
+        "job_queue",
+        "`session_id`=%s AND `status_code` IN (%s, %s, %s) AND `last_updated` < %s",
+        None,
+    ),
+    (
+        "Session.iter_history",
+        "job_history",
+        "`session_id`=%s AND `round_id`=%s",
+        "`id` ASC",
+    ),
+    (
+        "Broadcast.get",
+        "broadcast",
+        "`session_id`=%s AND `broadcast_id`=%s",
+        None,
+    ),
+    ("Daemon.status", "pool", "`session_id`=%s AND `node_id`=%s", None),
+    (
+        "Session.clean_stale_daemons",
+        "pool",
+        "`session_id`=%s AND `status_code` NOT IN (2,3) AND `last_seen` < %s",
+        None,
+    ),
+    ("Session.status", "session", "`session_id`=%s", None),
+    (
+        "ChangeFeed.since",
+        "job_feed",
+        "`session_id`=%s AND `seq` > %s AND `to_id`=%s",
+        "`seq` ASC",
+    ),
+    (
+        "Checkpoint.get",
+        "checkpoint",
+        "`session_id` = %s AND `node_id` = %s AND `type` = %s",
+        None,
+    ),
+    ("Result.fetch", "results", "`session_id` = %s AND `job_id` = %s", None),
+]
+
+
+def migrate(db, target=None, lock_timeout=60):
+    """
+    Bring the database behind connector `db` up to schema version `target`
+    (default: the latest) and return the resulting version. Migrations already
+    recorded in `schema_version` are skipped.
+
+    On MySQL the migrations run under a named lock so nodes starting together
+    do not apply the same migration concurrently.
+    """
+    dialect = getattr(db, "dialect", None)
+    if dialect not in VERSION_TABLE:
+        return SCHEMA_VERSION
+    if target is None:
+        target = SCHEMA_VERSION
+
+    with db.transaction() as cursor:
+        if dialect == "mysql":
+            cursor.execute("SELECT GET_LOCK(%s, %s)", (LOCK_NAME, lock_timeout))
+            if cursor.fetchone()[0] != 1:
+                raise RuntimeError("Timed out waiting for the schema migration lock")
+        try:
+            cursor.execute(VERSION_TABLE[dialect])
+            version = _version(cursor)
+            for migration in MIGRATIONS:
+                if not version < migration.version <= target:
+                    continue
+                logging.info(
+                    f"Applying schema migration {migration.version}: {migration.description}"
+                )
+                for statement in migration.statements[dialect]:
+                    if callable(statement):
+                        statement(cursor, dialect)
+                    else:
+                        cursor.execute(statement)
+                cursor.execute(
+                    "INSERT INTO `schema_version` (`version`, `description`, `applied_at`) VALUES (%s, %s, %s)",
+                    (migration.version, migration.description, time()),
+                )
+                version = migration.version
+        finally:
+            if dialect == "mysql":
+                cursor.execute("SELECT RELEASE_LOCK(%s)", (LOCK_NAME,))
+                cursor.fetchall()
+    return version
+
+
+def schema_version(db):
+    """
+    Return the schema version recorded in the database, or 0 if none is.
+    """
+    try:
+        row = db.select_one("schema_version", "MAX(`version`)", "1=1")
+    except Exception:
+        return 0
+    if not row or row[0] is None:
+        return 0
+    return row[0]
+
+
+def verify_index_coverage(db, queries=None):
+    """
+    Explain each of `queries` (default `HOT_QUERIES`) on the database behind
+    `db` and return {name: plan} for those that are not answered from an index,
+    or that need a sort for their ORDER BY. An empty dict means every query is
+    covered.
+    """
+    dialect = getattr(db, "dialect", None)
+    if dialect not in VERSION_TABLE:
+        raise ValueError(f"Cannot explain queries for dialect {dialect}")
+    uncovered = {}
+    with db.transaction() as cursor:
+        for name, table, where_clause, orderby in queries or HOT_QUERIES:
+            query = f"SELECT * FROM `{table}` WHERE {where_clause}"
+            if orderby is not None:
+                query += f" ORDER BY {orderby}"
+            params = ("0",) * where_clause.count("%s")
+            if dialect == "sqlite":
+                cursor.execute(f"EXPLAIN QUERY PLAN {query}", params)
+                details = [row[-1] for row in cursor.fetchall()]
+                covered = any(
+                    re.match(r"SEARCH .* USING (COVERING )?INDEX", detail)
+                    for detail in details
+                ) and not any("TEMP B-TREE" in detail for detail in details)
+            else:
+                cursor.execute(f"EXPLAIN {query}", params)
+                names = [column[0].lower() for column in cursor.description]
+                rows = [dict(zip(names, row)) for row in cursor.fetchall()]
+                details = [str(row) for row in rows]
+                covered = all(
+                    row.get("key") is not None
+                    and "filesort" not in (row.get("extra") or "")
+                    for row in rows
+                )
+            if not covered:
+                uncovered[name] = details
+    return uncovered
+
+
+def _version(cursor):
+    cursor.execute("SELECT MAX(`version`) FROM `schema_version`")
+    row = cursor.fetchone()
+    if row is None or row[0] is None:
+        return 0
+    return row[0]
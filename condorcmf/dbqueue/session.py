@@ -1,9 +1,27 @@
 import json
 import logging
+import numbers
 import uuid
-from time import time
+from collections import namedtuple
+from time import sleep, time
 
-from .job import Job
+import numpy as np  # type: ignore
+
+from . import utils
+from .broadcast import Broadcast
+from .connector.base import in_clause
+from .feed import FEED_COLUMNS, FEED_JOB_COLUMNS, ChangeFeed
+from .job import MAX_ATTEMPTS, Job, JobBatch, iter_job_records
+
+ARCHIVE_COLUMNS = (
+    "`session_id`, `job_id`, `round_id`, `to_id`, `from_id`, `type`, `created_at`, "
+    "`deadline`, `last_updated`, `status_code`, `payload`, `claimed_by`, `attempts`, "
+    "`broadcast_id`"
+)
+
+# Result of `Session.gather`: the replies' JobRecords, their payloads (stacked
+# into one array if requested) and the followers that did not reply in time
+Gathered = namedtuple("Gathered", ["records", "payloads", "stragglers"])
 
 
 class Session:
@@ -26,6 +44,8 @@ class Session:
         else:
             self.deadline = deadline
         self.active = False
+        self._stats = None
+        self._stats_at = 0.0
 
     def create(self, active=False):
         logging.info(f"Creating session with id: {self.session_id}")
@@ -40,7 +60,7 @@ class Session:
     def status(self):
         logging.info(f"Getting status of session with id: {self.session_id}")
         status = self.db.select_one(
-            "session", "active", f"`session_id`='{self.session_id}'"
+            "session", "active", "`session_id`=%s", params=(self.session_id,)
         )
         logging.info(f"Got status of session with id: {self.session_id}")
         self.active = status[0]
@@ -49,7 +69,10 @@ class Session:
     def set_status(self, active=False):
         logging.info(f"Setting session status to: {active}")
         self.db.update(
-            "session", f"`active`='{active}'", f"`session_id`='{self.session_id}'"
+            "session",
+            "`active`=%s",
+            "`session_id`=%s",
+            params=(active, self.session_id),
         )
         logging.info(f"Session status set to: {active}")
         self.active = active
@@ -58,14 +81,17 @@ class Session:
         logging.info(f"Updating session payload")
         payload = json.dumps(payload)
         self.db.update(
-            "session", f"`payload`='{payload}'", f"`session_id`='{self.session_id}'"
+            "session",
+            "`payload`=%s",
+            "`session_id`=%s",
+            params=(payload, self.session_id),
         )
         self.payload = payload
         logging.info(f"Updated session payload")
 
     def delete(self):
         logging.info(f"Deleting session with id: {self.session_id}")
-        self.db.delete("session", f"`session_id`='{self.session_id}'")
+        self.db.delete("session", "`session_id`=%s", params=(self.session_id,))
         logging.info(f"Session deleted with id: {self.session_id}")
 
     def pool_status(self, id: str = None):
@@ -94,26 +120,30 @@ class Session:
             result = self.db.select(
                 "pool",
                 "`node_id`, `role`, `status_code`, `payload`",
-                f"`session_id`='{self.session_id}'",
+                "`session_id`=%s",
+                params=(self.session_id,),
+                read_only=True,
             )
         else:
             result = self.db.select(
                 "pool",
                 "`node_id`, `role`, `status_code`, `payload`",
-                f"`session_id`='{self.session_id}' AND `node_id`='{id}'",
+                "`session_id`=%s AND `node_id`=%s",
+                params=(self.session_id, id),
+                read_only=True,
             )
         logging.info(f"Pool status retrieved with session id: {self.session_id}")
 
         if id is None:
             status = {}
-            for row in result:
+            for row in result or []:
                 status[row[0]] = {
                     "role": row[1],
                     "status_code": row[2],
                 }
             return {"session_id": self.session_id, "status": status}
         else:
-            for row in result:
+            for row in result or []:
                 if row[0] == id:
                     return {
                         "session_id": self.session_id,
@@ -144,46 +174,26 @@ class Session:
         )
         if ids:
             ids = tuple(ids)
-            result = self.db.select(
-                "pool",
-                "`node_id`",
-                f"`session_id`='{self.session_id}' AND `role`='{role}' AND `status_code` NOT IN (2,3) AND `node_id` IN {ids}",
-            )
-            logging.info(
-                f"Got number of active daemons with session id: {self.session_id}"
-            )
-
-            if result is None:
-                return 0
-
-            return len(result)
-        
-        if role is None:
-            result = self.db.select(
-                "pool",
-                "`node_id`",
-                f"`session_id`='{self.session_id}' AND `status_code` NOT IN (2,3)",
+            where_clause = (
+                "`session_id`=%s AND `role`=%s AND `status_code` NOT IN (2,3) "
+                f"AND `node_id` IN {in_clause(ids)}"
             )
-            logging.info(
-                f"Got number of active daemons with session id: {self.session_id}"
+            params = (self.session_id, role) + ids
+        elif role is None:
+            where_clause = "`session_id`=%s AND `status_code` NOT IN (2,3)"
+            params = (self.session_id,)
+        else:
+            where_clause = (
+                "`session_id`=%s AND `role`=%s AND `status_code` NOT IN (2,3)"
             )
-
-            if result is None:
-                return 0
-
-            return len(result)
-
-        result = self.db.select(
-            "pool",
-            "`node_id`",
-            f"`session_id`='{self.session_id}' AND `role`='{role}' AND `status_code` NOT IN (2,3)",
+            params = (self.session_id, role)
+        result = self.db.select_one(
+            "pool", "COUNT(*)", where_clause, params=params, read_only=True
         )
         logging.info(f"Got number of active daemons with session id: {self.session_id}")
-
         if result is None:
             return 0
-
-        return len(result)
+        return result[0]
 
     def job_queue(self, status_code=None):
         """
@@ -192,12 +202,15 @@ class Session:
         """
         logging.info(f"Getting job queue with session id: {self.session_id}")
         if status_code is None:
-            self.db.select("job_queue", "*", f"`session_id`='{self.session_id}'")
+            result = self.db.select(
+                "job_queue", "*", "`session_id`=%s", params=(self.session_id,)
+            )
         else:
-            self.db.select( 
+            result = self.db.select(
                 "job_queue",
                 "*",
-                f"`session_id`='{self.session_id}' AND `status_code`='{status_code}'",
+                "`session_id`=%s AND `status_code`=%s",
+                params=(self.session_id, status_code),
             )
 
         logging.info(f"Got job queue with session id: {self.session_id}")
@@ -211,49 +224,361 @@ class Session:
         logging.info(
             f"Getting number of active jobs with session id: {self.session_id}"
         )
+        qry = "`session_id`=%s AND `status_code` NOT IN (0,3,4)"
+        params = [self.session_id]
         if job_type is not None:
-            qry = f"`session_id`='{self.session_id}' AND `type`='{job_type}' AND `status_code` NOT IN (0,3,4)"
-        else:
-            qry = f"`session_id`='{self.session_id}' AND `status_code` NOT IN (0,3,4)"
+            qry += " AND `type`=%s"
+            params.append(job_type)
         if round_id is not None:
-            qry += f" AND `round_id`='{round_id}'"
+            qry += " AND `round_id`=%s"
+            params.append(round_id)
         if from_id is not None:
-            qry += f" AND `from_id`='{from_id}'"
+            qry += " AND `from_id`=%s"
+            params.append(from_id)
         if to_id is not None:
-            qry += f" AND `to_id`='{to_id}'"
-        result = self.db.select(
-            "job_queue",
-            "`job_id`",
-            qry
+            qry += " AND `to_id`=%s"
+            params.append(to_id)
+        result = self.db.select_one(
+            "job_queue", "COUNT(*)", qry, params=params, read_only=True
         )
         logging.info(f"Got number of active jobs with session id: {self.session_id}")
         if result is None:
             return 0
-        return len(result)
+        return result[0]
 
-    def fetch_latest_job(self, return_query=False):
-        logging.info(f"Pulling the latest inactive job from the queue")
-        job = self.db.select_one(
-            "job_queue",
-            "`id`, `session_id`, `job_id`, `to_id`, `from_id`, `type`,  `created_at`, `deadline`",
-            f"`status_code` NOT IN (0, 3, 4) AND `active` = 0 AND `to_id` = '' ORDER BY `created_at` DESC LIMIT 1 FOR UPDATE",
+    def stats(self, ttl=1.0):
+        """
+        Return a snapshot of the pool and job counts of the session, computed
+        with one `GROUP BY role, status_code` query on `pool` and one
+        `GROUP BY type, status_code` query on `job_queue`.
+
+        The snapshot is cached on the Session for `ttl` seconds, so repeated
+        calls within a poll interval do not touch the database. Writes made
+        through this Session drop the cached snapshot (see `invalidate_stats`);
+        writes by Daemons or other processes show up once it expires.
+
+        The snapshot is a dictionary of the form:
+        {
+            "timestamp": time the counts were read,
+            "pool": {role: {status_code: count}},
+            "jobs": {type: {status_code: count}},
+            "active_daemons": daemons not held or left (status not in 2, 3),
+            "pending_jobs": jobs with status 0,
+            "active_jobs": jobs with status not in 0, 3, 4,
+            "stale_jobs": jobs with status 3,
+        }
+        """
+        now = time()
+        if self._stats is not None and now - self._stats_at < ttl:
+            return self._stats
+        pool = (
+            self.db.select(
+                "pool",
+                "`role`, `status_code`, COUNT(*)",
+                "`session_id`=%s",
+                params=(self.session_id,),
+                read_only=True,
+                groupby="`role`, `status_code`",
+            )
+            or []
         )
-        if job:
-            self.db.update("jobs", "`active`=1", f"`job_id`='{job['job_id']}'")
-        if job is not None:
-            if return_query:
-                return jobs
-            return Job(
-                db=self.db,
-                session_id=job[1],
-                to_id=job[3],
-                from_id=job[4],
-                type=job[5],
-                job_id=job[2],
-                created_at=job[6],
-                deadline=job[7],
+        jobs = (
+            self.db.select(
+                "job_queue",
+                "`type`, `status_code`, COUNT(*)",
+                "`session_id`=%s",
+                params=(self.session_id,),
+                read_only=True,
+                groupby="`type`, `status_code`",
+            )
+            or []
+        )
+        stats = {
+            "timestamp": now,
+            "pool": {},
+            "jobs": {},
+            "active_daemons": sum(n for _, status, n in pool if status not in (2, 3)),
+            "pending_jobs": sum(n for _, status, n in jobs if status == 0),
+            "active_jobs": sum(n for _, status, n in jobs if status not in (0, 3, 4)),
+            "stale_jobs": sum(n for _, status, n in jobs if status == 3),
+        }
+        for role, status, n in pool:
+            stats["pool"].setdefault(role, {})[status] = n
+        for job_type, status, n in jobs:
+            stats["jobs"].setdefault(job_type, {})[status] = n
+        self._stats = stats
+        self._stats_at = now
+        return stats
+
+    def invalidate_stats(self):
+        """
+        Drop the snapshot cached by `stats`, so the next call reads the counts
+        from the database.
+        """
+        self._stats = None
+
+    def scatter(
+        self,
+        to_ids,
+        from_id,
+        job_type,
+        payload=None,
+        payloads=None,
+        round_id=None,
+        deadline=None,
+        chunk_size=500,
+    ):
+        """
+        Create one job for each daemon in `to_ids` with chunked multi-row inserts
+        in a single transaction. Every job carries `payload`, or the matching entry
+        of `payloads` if given, and all jobs share `round_id`.
+
+        Returns the ids of the created jobs in the order of `to_ids`.
+        """
+        to_ids = list(to_ids)
+        if payloads is not None and len(payloads) != len(to_ids):
+            raise ValueError("payloads must have one entry per id in to_ids")
+        round_id = str(uuid.uuid4()) if round_id is None else round_id
+        logging.info(
+            f"Scattering {len(to_ids)} jobs in round {round_id} with session id: {self.session_id}"
+        )
+        jobs = [
+            Job(
+                self.db,
+                self.session_id,
+                to_id,
+                from_id,
+                job_type,
+                round_id=round_id,
+                deadline=deadline,
+                payload=(payload or {}) if payloads is None else payloads[i],
+            )
+            for i, to_id in enumerate(to_ids)
+        ]
+        job_ids = Job.create_many(jobs, chunk_size=chunk_size)
+        self.invalidate_stats()
+        logging.info(
+            f"Scattered jobs in round {round_id} with session id: {self.session_id}"
+        )
+        return job_ids
+
+    def broadcast(
+        self,
+        to_ids,
+        from_id,
+        job_type,
+        payload,
+        payloads=None,
+        round_id=None,
+        deadline=None,
+        chunk_size=500,
+    ):
+        """
+        Like `scatter`, but `payload` is stored once in the `broadcast` table
+        rather than in every job. Each job carries only the matching entry of
+        `payloads` (or nothing), and readers see `payload` updated with it. The
+        broadcast and the jobs are written in a single transaction.
+
+        Returns the ids of the created jobs in the order of `to_ids`.
+        """
+        to_ids = list(to_ids)
+        if payloads is not None and len(payloads) != len(to_ids):
+            raise ValueError("payloads must have one entry per id in to_ids")
+        if not to_ids:
+            return []
+        round_id = str(uuid.uuid4()) if round_id is None else round_id
+        logging.info(
+            f"Broadcasting to {len(to_ids)} jobs in round {round_id} with session id: {self.session_id}"
+        )
+        broadcast_id = Broadcast(self.db, self.session_id).create(
+            payload, round_id=round_id, queue_query=True
+        )
+        jobs = [
+            Job(
+                self.db,
+                self.session_id,
+                to_id,
+                from_id,
+                job_type,
+                round_id=round_id,
+                deadline=deadline,
+                payload={} if payloads is None else payloads[i],
+                broadcast_id=broadcast_id,
+            )
+            for i, to_id in enumerate(to_ids)
+        ]
+        job_ids = Job.create_many(jobs, chunk_size=chunk_size)
+        self.invalidate_stats()
+        logging.info(
+            f"Broadcast jobs in round {round_id} with session id: {self.session_id}"
+        )
+        return job_ids
+
+    def gather(
+        self,
+        round_id,
+        expected,
+        timeout=None,
+        to_id=None,
+        job_type=None,
+        stack=None,
+        status=2,
+        chunk_size=1000,
+    ):
+        """
+        Wait for the pending replies of round `round_id` and return them as a
+        `Gathered` tuple.
+
+        `expected` is the number of replies, or the list of follower ids
+        expected to reply (matched against the replies' `from_id`). While
+        replies are missing, a single COUNT query is polled with
+        `utils.Backoff`; the backoff is reset whenever new replies arrive, so
+        polling stays fast while a round is completing. Once all replies are
+        in, or after `timeout` seconds, every reply is read with its payload in
+        one streaming query and, unless `status` is None, set to `status` in a
+        single batch.
+
+        With a list of follower ids, only replies from those followers are
+        read and the round is complete once each of them has replied. Replies
+        are returned in the order of the list, `stragglers` lists the
+        followers that did not reply, and any further replies from a follower
+        are dropped and, unless `status` is None, set to cleaned (status 4) so
+        they do not count towards later gathers of the round. With a count,
+        replies are returned oldest first and `stragglers` is the number
+        missing.
+
+        If `stack` is a payload key, `payloads` is that key of every reply
+        stacked into one NumPy array; if it is True, the payloads themselves
+        are stacked.
+        """
+        # A count may come from NumPy, e.g. the size of an array of followers
+        from_ids = None if isinstance(expected, numbers.Integral) else list(expected)
+        n_expected = int(expected) if from_ids is None else len(from_ids)
+        where_clause = "`session_id`=%s AND `status_code`=0 AND `round_id`=%s"
+        params = [self.session_id, round_id]
+        if to_id is not None:
+            where_clause += " AND `to_id`=%s"
+            params.append(to_id)
+        if job_type is not None:
+            where_clause += " AND `type`=%s"
+            params.append(job_type)
+        if from_ids is None:
+            count_column = "COUNT(*)"
+        else:
+            # Count each expected follower once, however often it replied
+            from_ids = list(dict.fromkeys(from_ids))
+            n_expected = len(from_ids)
+            where_clause += f" AND `from_id` IN {in_clause(from_ids)}"
+            params.extend(from_ids)
+            count_column = "COUNT(DISTINCT `from_id`)"
+
+        logging.info(
+            f"Gathering {n_expected} replies in round {round_id} with session id: {self.session_id}"
+        )
+        start = time()
+        backoff = utils.Backoff(seed=round_id)
+        received = 0
+        while True:
+            count = self.db.select_one(
+                "job_queue", count_column, where_clause, params=params
+            )
+            count = count[0] if count else 0
+            if count >= n_expected:
+                break
+            if count > received:
+                backoff.reset()
+            received = count
+            delay = backoff.next()
+            if timeout is not None:
+                remaining = start + timeout - time()
+                if remaining <= 0:
+                    break
+                delay = min(delay, remaining)
+            sleep(delay)
+
+        records = list(
+            iter_job_records(
+                self.db,
+                where_clause,
+                params,
+                orderby="`created_at` ASC",
+                with_payload=True,
+                chunk_size=chunk_size,
+            )
+        )
+        duplicates = []
+        if from_ids is None:
+            stragglers = max(n_expected - len(records), 0)
+        else:
+            by_follower = {}
+            for record in records:
+                if record.from_id in by_follower:
+                    duplicates.append(record)
+                else:
+                    by_follower[record.from_id] = record
+            stragglers = [i for i in from_ids if i not in by_follower]
+            records = [by_follower[i] for i in from_ids if i in by_follower]
+        if stragglers:
+            logging.warning(
+                f"Gathered {len(records)} of {n_expected} replies in round {round_id}, "
+                f"stragglers: {stragglers}"
+            )
+        if status is not None and records:
+            JobBatch(self.db, self.session_id, records).set_status(status)
+        if status is not None and duplicates:
+            logging.warning(
+                f"Dropped {len(duplicates)} duplicate replies in round {round_id}"
+            )
+            JobBatch(self.db, self.session_id, duplicates).set_status(4)
+
+        payloads = [record.payload for record in records]
+        if stack is True:
+            payloads = np.stack(payloads) if payloads else np.empty(0)
+        elif stack is not None:
+            payloads = (
+                np.stack([payload[stack] for payload in payloads])
+                if payloads
+                else np.empty(0)
             )
-        return None
+        self.invalidate_stats()
+        logging.info(
+            f"Gathered replies in round {round_id} with session id: {self.session_id}"
+        )
+        return Gathered(records, payloads, stragglers)
+
+    def set_status_many(self, jobs, status, chunk_size=500):
+        """
+        Set the status of `jobs` (Job objects or job ids) to `status` with one
+        `UPDATE ... WHERE job_id IN (...)` per `chunk_size` jobs, sent as a
+        single batch.
+        """
+        logging.info(
+            f"Setting status of {len(jobs)} jobs to {status} with session id: {self.session_id}"
+        )
+        JobBatch(self.db, self.session_id, jobs, chunk_size=chunk_size).set_status(
+            status
+        )
+        self.invalidate_stats()
+        logging.info(f"Set status of jobs with session id: {self.session_id}")
+
+    def changes(self, since=0, to_id=None, from_id=None, round_id=None, cursor=None):
+        """
+        Return the change feed entries recorded after sequence number `since`,
+        oldest first, optionally restricted to jobs sent to `to_id`, sent by
+        `from_id` or in `round_id`.
+
+        To poll for new entries pass the same `FeedCursor` as `cursor` on every
+        call instead of `since`: entries can become visible after entries with
+        higher sequence numbers, so resuming after the last one seen may miss
+        some, see `ChangeFeed.read`.
+
+        Entries are tuples of
+        (seq, job_id, round_id, to_id, from_id, type, status_code, created_at).
+        """
+        feed = ChangeFeed(self.db, self.session_id)
+        if cursor is not None:
+            return feed.read(cursor, to_id=to_id, from_id=from_id, round_id=round_id)
+        return feed.since(since, to_id=to_id, from_id=from_id, round_id=round_id)
 
     def fetch_jobs(self, job_type=None, active=False, return_query=False):
         """
@@ -261,32 +586,20 @@ class Session:
         If active is True, we pull all jobs that do not have a status of (0 or 3)
         """
         logging.info(f"Fetching jobs with session id: {self.session_id}")
-        if job_type is not None:
-            if active:
-                jobs = self.db.select(
-                    "job_queue",
-                    "`id`, `session_id`, `job_id`, `to_id`, `from_id`, `type`,  `created_at`, `deadline`, `status_code`",
-                    f"`session_id`='{self.session_id}' AND `type`='{job_type}' AND `status_code`, `status_code` NOT IN (0,3,4)",
-                )
-            else:
-                jobs = self.db.select(
-                    "job_queue",
-                    "`id`, `session_id`, `job_id`, `to_id`, `from_id`, `type`,  `created_at`, `deadline`, `status_code`",
-                    f"`session_id`='{self.session_id}' AND `type`='{job_type}' AND `status_code` NOT IN (2)",
-                )
+        if active:
+            where_clause = "`session_id`=%s AND `status_code` NOT IN (0,3,4)"
         else:
-            if active:
-                jobs = self.db.select(
-                    "job_queue",
-                    "`id`, `session_id`, `job_id`, `to_id`, `from_id`, `type`,  `created_at`, `deadline`, `status_code`",
-                    f"`session_id`='{self.session_id}' AND `status_code` NOT IN (0,3,4)",
-                )
-            else:
-                jobs = self.db.select(
-                    "job_queue",
-                    "`id`, `session_id`, `job_id`, `to_id`, `from_id`, `type`,  `created_at`, `deadline`, `status_code`",
-                    f"`session_id`='{self.session_id}' AND `status_code` NOT IN (2)",
-                )
+            where_clause = "`session_id`=%s AND `status_code` NOT IN (2)"
+        params = [self.session_id]
+        if job_type is not None:
+            where_clause += " AND `type`=%s"
+            params.append(job_type)
+        jobs = self.db.select(
+            "job_queue",
+            "`id`, `session_id`, `job_id`, `to_id`, `from_id`, `type`,  `created_at`, `deadline`, `status_code`",
+            where_clause,
+            params=params,
+        )
         logging.info(f"Fetched jobs with session id: {self.session_id}")
         if jobs is not None:
             if return_query:
@@ -306,7 +619,38 @@ class Session:
             ]
         return []
 
-    def clean_stale_jobs(self, job_type=None, round_id=None, from_id=None, deadline=None, check_deadline=True, clear_running=False):
+    def iter_jobs(
+        self, job_type=None, active=False, with_payload=False, chunk_size=1000
+    ):
+        """
+        Streaming variant of `fetch_jobs`: yield a `JobRecord` per job as the
+        rows arrive instead of building every `Job` first.
+        """
+        if active:
+            where_clause = "`session_id`=%s AND `status_code` NOT IN (0,3,4)"
+        else:
+            where_clause = "`session_id`=%s AND `status_code` NOT IN (2)"
+        params = [self.session_id]
+        if job_type is not None:
+            where_clause += " AND `type`=%s"
+            params.append(job_type)
+        return iter_job_records(
+            self.db,
+            where_clause,
+            params,
+            with_payload=with_payload,
+            chunk_size=chunk_size,
+        )
+
+    def clean_stale_jobs(
+        self,
+        job_type=None,
+        round_id=None,
+        from_id=None,
+        deadline=None,
+        check_deadline=True,
+        clear_running=False,
+    ):
         """
         Pull all jobs from the job queue associated with `session_id` that are
         older than the associated `deadline` that do not have a status code of (1,2,3)
@@ -320,89 +664,100 @@ class Session:
         else:
             check_statuses = "(1,2,3,4)"
 
-        # Connect to the database
-        self.db.connect()
-        conn = self.db.connection
-
-        try:
-            # Set isolation level to REPEATABLE READ
-            conn.autocommit(False)
-            conn.begin()
-
-            cursor = conn.cursor()
-
-            if job_type is None:
-                qry = f"`session_id`='{self.session_id}' AND `status_code` NOT IN {check_statuses}"
-                if check_deadline:
-                    qry += f" AND `deadline` < {time()}"
-                elif deadline:
-                    qry += f" AND `deadline` < {deadline}"
-                if from_id:
-                    qry += f" AND `from_id`='{from_id}'"
-                if round_id:
-                    qry += f" AND `round_id`='{round_id}'"
-
-                # Acquire row-level locks using SELECT ... FOR UPDATE
-                select_query = f"SELECT * FROM job_queue WHERE {qry} FOR UPDATE"
-                cursor.execute(select_query)
-
-                # Update the rows
-                update_query = f"UPDATE job_queue SET `status_code`=3 WHERE {qry}"
-                cursor.execute(update_query)
-
-            else:
-                qry = f"`session_id`='{self.session_id}' AND `type`='{job_type}' AND `status_code` NOT IN {check_statuses}"
-                if check_deadline:
-                    qry += f" AND `deadline` < {time()}"
-                elif deadline:
-                    qry += f" AND `deadline` < {deadline}"
-                if from_id:
-                    qry += f" AND `from_id`='{from_id}'"
-                if round_id:
-                    qry += f" AND `round_id`='{round_id}'"
-
-                # Acquire row-level locks using SELECT ... FOR UPDATE
-                select_query = f"SELECT * FROM job_queue WHERE {qry} FOR UPDATE"
-                cursor.execute(select_query)
-
-                # Update the rows
-                update_query = f"UPDATE job_queue SET `status_code`=3 WHERE {qry}"
-                cursor.execute(update_query)
-
-            # Commit the transaction
-            conn.commit()
-
-        except Exception as e:
-            # Rollback the transaction if an error occurs
-            conn.rollback()
-            raise e
-
-        finally:
-            # Restore autocommit and close the cursor and connection
-            conn.autocommit(True)
-            cursor.close()
-            conn.close()
+        qry = f"`session_id`=%s AND `status_code` NOT IN {check_statuses}"
+        params = [self.session_id]
+        if job_type is not None:
+            qry += " AND `type`=%s"
+            params.append(job_type)
+        if check_deadline:
+            qry += " AND `deadline` < %s"
+            params.append(time())
+        elif deadline:
+            qry += " AND `deadline` < %s"
+            params.append(deadline)
+        if from_id:
+            qry += " AND `from_id`=%s"
+            params.append(from_id)
+        if round_id:
+            qry += " AND `round_id`=%s"
+            params.append(round_id)
+
+        self._mark_jobs(3, qry, params)
 
+        self.invalidate_stats()
         logging.info(f"Tidied stale jobs with session id: {self.session_id}")
 
+    def clean_exhausted_jobs(self, max_attempts=MAX_ATTEMPTS, round_id=None):
+        """
+        Set in-progress jobs whose lease has expired after `max_attempts`
+        claims to stale (status 3). Jobs with attempts left are returned to
+        the claimable pool by their expired lease and need no sweep.
+        """
+        logging.info(f"Tidying exhausted jobs with session id: {self.session_id}")
+        now = time()
+        qry = "`session_id`=%s AND `status_code`=1 AND `lease_expires` < %s AND `attempts` >= %s"
+        params = [self.session_id, now, max_attempts]
+        if round_id:
+            qry += " AND `round_id`=%s"
+            params.append(round_id)
+        self._mark_jobs(3, qry, params)
+        self.invalidate_stats()
+        logging.info(f"Tidied exhausted jobs with session id: {self.session_id}")
+
+    def _mark_jobs(self, status, where_clause, params, chunk_size=500):
+        """
+        Set the jobs matching `where_clause` to `status` and record the change
+        in the change feed, in transactions of up to `chunk_size` jobs, and
+        return how many jobs were changed. `where_clause` must exclude jobs
+        already in `status`.
+        """
+        now = time()
+        changed = 0
+        while True:
+            n = self.db.transition(
+                "job_queue",
+                FEED_JOB_COLUMNS,
+                where_clause,
+                "`status_code`=%s, `last_updated`=%s",
+                "job_feed",
+                FEED_COLUMNS,
+                params=params,
+                set_params=(status, now),
+                extra_values=(status, now),
+                n=chunk_size,
+            )
+            changed += n
+            if n < chunk_size:
+                return changed
+
     def count_stale_jobs(self, job_type=None, from_id=None):
         """
         Return the number of stale jobs associated with `session_id` that do not have a status code of (1,2,3).
         """
         logging.info(f"Counting stale jobs with session id: {self.session_id}")
         if job_type is None:
-            where_clause = f"`session_id`='{self.session_id}' AND `deadline` < NOW() AND `status_code` NOT IN (1,2,3)"
+            where_clause = (
+                "`session_id`=%s AND `deadline` < %s AND `status_code` NOT IN (1,2,3)"
+            )
+            params = [self.session_id, time()]
         else:
-            where_clause = f"`session_id`='{self.session_id}' AND `type`='{job_type}' AND `deadline` < NOW() AND `status_code`=3"
+            where_clause = (
+                "`session_id`=%s AND `type`=%s AND `deadline` < %s AND `status_code`=3"
+            )
+            params = [self.session_id, job_type, time()]
         if from_id:
-            where_clause += f" AND `from_id`='{from_id}'"
-        result = self.db.select(
+            where_clause += " AND `from_id`=%s"
+            params.append(from_id)
+        result = self.db.select_one(
             "job_queue",
-            "`job_id`",
+            "COUNT(*)",
             where_clause,
+            params=params,
         )
         logging.info(f"Counted stale jobs with session id: {self.session_id}")
-        return len(result)
+        if result is None:
+            return 0
+        return result[0]
 
     def fetch_stale_jobs(self, round_id=None, job_type=None, from_id=None):
         """
@@ -410,21 +765,26 @@ class Session:
         Return a list of Job objects.
         """
         logging.info(f"Fetching stale jobs with session id: {self.session_id}")
-        if job_type is None:
-            where_clause = f"`session_id`='{self.session_id}' AND `status_code`=3"
-        else:
-            where_clause = f"`session_id`='{self.session_id}' AND `type`='{job_type}' AND `status_code`=3"
+        where_clause = "`session_id`=%s AND `status_code`=3"
+        params = [self.session_id]
+
+        if job_type is not None:
+            where_clause += " AND `type`=%s"
+            params.append(job_type)
 
         if from_id:
-            where_clause += f" AND `from_id`='{from_id}'"
-        
+            where_clause += " AND `from_id`=%s"
+            params.append(from_id)
+
         if round_id:
-            where_clause += f" AND `round_id`='{round_id}'"
+            where_clause += " AND `round_id`=%s"
+            params.append(round_id)
 
         stale_jobs = self.db.select(
             "job_queue",
             "`id`, `session_id`, `job_id`, `to_id`, `from_id`, `type`, `created_at`, `deadline`",
             where_clause,
+            params=params,
         )
 
         logging.info(f"Fetched stale jobs with session id: {self.session_id}")
@@ -447,64 +807,196 @@ class Session:
         else:
             return [], 0
 
+    def iter_stale_jobs(
+        self,
+        round_id=None,
+        job_type=None,
+        from_id=None,
+        with_payload=False,
+        chunk_size=1000,
+    ):
+        """
+        Streaming variant of `fetch_stale_jobs` yielding a `JobRecord` per
+        stale job.
+        """
+        where_clause = "`session_id`=%s AND `status_code`=3"
+        params = [self.session_id]
+
+        if job_type is not None:
+            where_clause += " AND `type`=%s"
+            params.append(job_type)
+
+        if from_id:
+            where_clause += " AND `from_id`=%s"
+            params.append(from_id)
+
+        if round_id:
+            where_clause += " AND `round_id`=%s"
+            params.append(round_id)
+
+        return iter_job_records(
+            self.db,
+            where_clause,
+            params,
+            with_payload=with_payload,
+            chunk_size=chunk_size,
+        )
+
+    def archive_jobs(
+        self, older_than=3600, status_codes=(2, 3, 4), chunk_size=500, max_chunks=None
+    ):
+        """
+        Move jobs with one of `status_codes` that have not been updated for
+        `older_than` seconds from `job_queue` to `job_history`, keeping the live
+        table small for the polling queries.
+
+        Rows are moved `chunk_size` at a time, each chunk in its own short
+        transaction, until no more qualify or `max_chunks` chunks have been
+        moved. Returns the number of jobs archived.
+        """
+        status_codes = tuple(status_codes)
+        where_clause = (
+            f"`session_id`=%s AND `status_code` IN {in_clause(status_codes)}"
+            " AND `last_updated` < %s"
+        )
+        params = (self.session_id,) + status_codes + (time() - older_than,)
+        logging.info(f"Archiving jobs with session id: {self.session_id}")
+        archived = 0
+        chunks = 0
+        while max_chunks is None or chunks < max_chunks:
+            moved = self.db.move(
+                "job_queue",
+                "job_history",
+                ARCHIVE_COLUMNS,
+                f"({ARCHIVE_COLUMNS}, `archived_at`)",
+                where_clause,
+                params=params,
+                extra_values=(time(),),
+                n=chunk_size,
+            )
+            archived += moved
+            chunks += 1
+            if moved < chunk_size:
+                break
+        self.invalidate_stats()
+        logging.info(f"Archived {archived} jobs with session id: {self.session_id}")
+        return archived
+
+    def iter_history(
+        self,
+        job_id=None,
+        round_id=None,
+        to_id=None,
+        from_id=None,
+        status_code=None,
+        archived_after=None,
+        with_payload=False,
+        chunk_size=1000,
+    ):
+        """
+        Yield a `JobRecord` for each archived job matching the given filters,
+        in the order they were archived, for post-mortems over `job_history`.
+        """
+        where_clause = "`session_id`=%s"
+        params = [self.session_id]
+        for column, value in (
+            ("job_id", job_id),
+            ("round_id", round_id),
+            ("to_id", to_id),
+            ("from_id", from_id),
+            ("status_code", status_code),
+        ):
+            if value is not None:
+                where_clause += f" AND `{column}`=%s"
+                params.append(value)
+        if archived_after is not None:
+            where_clause += " AND `archived_at` > %s"
+            params.append(archived_after)
+        return iter_job_records(
+            self.db,
+            where_clause,
+            params,
+            orderby="`id` ASC",
+            with_payload=with_payload,
+            chunk_size=chunk_size,
+            table="job_history",
+        )
+
     def clean_complete_jobs(self, from_id=None, to_id=None):
         """
         Remove all jobs from the job queue associated with `session_id` that have a status code of 4.
         """
         logging.info(f"Cleaning complete jobs with session id: {self.session_id}")
         if from_id:
-            where_clause = f"`session_id`='{self.session_id}' AND `status_code`=4 AND `from_id`='{from_id}'"
+            where_clause = "`session_id`=%s AND `status_code`=4 AND `from_id`=%s"
+            params = (self.session_id, from_id)
         elif to_id:
-            where_clause = f"`session_id`='{self.session_id}' AND `status_code`=4 AND `to_id`='{to_id}'"
+            where_clause = "`session_id`=%s AND `status_code`=4 AND `to_id`=%s"
+            params = (self.session_id, to_id)
         else:
-            where_clause = f"`session_id`='{self.session_id}' AND `status_code`=4"
+            where_clause = "`session_id`=%s AND `status_code`=4"
+            params = (self.session_id,)
 
-        self.db.delete(
-            "job_queue",
-            where_clause
-        )
+        self.db.delete("job_queue", where_clause, params=params)
 
+        self.invalidate_stats()
         logging.info(f"Cleaned complete jobs with session id: {self.session_id}")
 
-    def clean_stale_daemons(self, ids=None, role=None, timeout=60):
+    def clean_stale_daemons(self, ids=None, role=None, timeout=60, chunk_size=500):
         """
         Check for workers that have not checked in for longer than the specified timeout.
+        Stale workers are set to held (status 2) with one UPDATE for every `chunk_size`
+        workers, sent as a single batch, and the jobs allocated to them to stale
+        (status 3), recording each job in the change feed.
         """
         logging.info(f"Checking for stale workers with session id: {self.session_id}")
-        where_query = f"`session_id`='{self.session_id}' AND `status_code` NOT IN (2,3) AND `last_seen` < {time() - timeout}"
+        where_query = (
+            "`session_id`=%s AND `status_code` NOT IN (2,3) AND `last_seen` < %s"
+        )
+        params = [self.session_id, time() - timeout]
         if role:
-            where_query += f" AND `role`='{role}'"
+            where_query += " AND `role`=%s"
+            params.append(role)
         if ids:
-            ids_str = ", ".join([f"'{id}'" for id in ids])
-            where_query += f" AND `node_id` IN ({ids_str})"
+            where_query += f" AND `node_id` IN {in_clause(ids)}"
+            params.extend(ids)
         result = self.db.select(
             "pool",
-            "`id`, `session_id`, `node_id`, `status_code`, `last_seen`",
-            # f"`session_id`='{self.session_id}' AND `status_code` NOT IN (0,1,3) AND `last_seen` < {time() - timeout}",
+            "`node_id`",
             where_query,
+            params=params,
         )
         logging.info(f"Checked for stale workers with session id: {self.session_id}")
 
         if result is not None:
-            logging.info(f"Found stale workers with session id: {self.session_id}")
-            for worker in result:
+            logging.info(
+                f"Found {len(result)} stale workers with session id: {self.session_id}"
+            )
+            node_ids = [worker[0] for worker in result]
+            for i in range(0, len(node_ids), chunk_size):
+                chunk = tuple(node_ids[i : i + chunk_size])
+
                 # Set worker status to 2 (Held)
                 self.db.update(
                     "pool",
                     "`status_code`=2",
-                    f"`session_id`='{self.session_id}' AND `node_id`='{worker[2]}'",
+                    f"`session_id`=%s AND `node_id` IN {in_clause(chunk)}",
                     queue_query=True,
+                    params=(self.session_id,) + chunk,
                 )
+            self.db._execute_query_queue()
 
-                # Set any jobs allocated to them as stale
-                self.db.update(
-                    "job_queue",
-                    "`status_code`=3",
-                    f"`session_id`='{self.session_id}' AND `to_id`='{worker[2]}'",
-                    queue_query=True,
+            # Set any jobs allocated to them as stale
+            for i in range(0, len(node_ids), chunk_size):
+                chunk = tuple(node_ids[i : i + chunk_size])
+                self._mark_jobs(
+                    3,
+                    f"`session_id`=%s AND `to_id` IN {in_clause(chunk)} AND `status_code` NOT IN (3)",
+                    (self.session_id,) + chunk,
+                    chunk_size=chunk_size,
                 )
-            self.db._execute_query_queue()
 
+        self.invalidate_stats()
         logging.info(f"Checked for stale workers with session id: {self.session_id}")
 
     def clean_jobs(self, round_id):
@@ -514,18 +1006,30 @@ class Session:
         logging.info(f"Cleaning jobs with session id: {self.session_id}")
         self.db.delete(
             "job_queue",
-            f"`session_id`='{self.session_id}' AND `round_id`='{round_id}'"
+            "`session_id`=%s AND `round_id`=%s",
+            params=(self.session_id, round_id),
         )
+        self.invalidate_stats()
         logging.info(f"Cleaned jobs with session id: {self.session_id}")
 
     def clear_session(self, clear_results=False):
-        logging.info(f"Clearing session with session id: {self.session_id}", queue_query=True)
-        self.db.delete("job_queue", f"`session_id`='{self.session_id}'", queue_query=True)
-        self.db.delete("pool", f"`session_id`='{self.session_id}'", queue_query=True)
-        self.db.delete("session", f"`session_id`='{self.session_id}'", queue_query=True)
-        self.db.delete("checkpoint", f"`session_id`='{self.session_id}'", queue_query=True)
+        logging.info(f"Clearing session with session id: {self.session_id}")
+        tables = [
+            "job_queue",
+            "job_history",
+            "job_feed",
+            "broadcast",
+            "pool",
+            "session",
+            "checkpoint",
+        ]
         if clear_results:
-            self.db.delete("results", f"`session_id`='{self.session_id}'", queue_query=True)
+            tables.append("results")
+        for table in tables:
+            self.db.delete(
+                table, "`session_id`=%s", queue_query=True, params=(self.session_id,)
+            )
         self.db._execute_query_queue()
 
+        self.invalidate_stats()
         logging.info(f"Session cleared with session id: {self.session_id}")
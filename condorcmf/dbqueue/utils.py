@@ -1,4 +1,5 @@
 import json
+import random
 
 import numpy as np  # type: ignore
 
@@ -16,3 +17,39 @@ class NpEncoder(json.JSONEncoder):
         if isinstance(obj, np.ndarray):
             return obj.tolist()
         return super(NpEncoder, self).default(obj)
+
+
+class Backoff:
+    """
+    Exponential poll backoff with deterministic jitter.
+
+    Each call to `next` returns the current delay scaled by a jitter factor in
+    [1 - jitter, 1 + jitter] and then grows the delay by `factor` up to
+    `max_delay`. Seeding with the node id gives every daemon its own, repeatable
+    jitter sequence so a pool of followers does not poll in lockstep.
+
+    Args:
+        min_delay (float): Delay in seconds after a reset.
+        max_delay (float): Upper bound on the delay in seconds.
+        factor (float): Growth factor applied after each empty poll.
+        jitter (float): Relative jitter applied to each delay.
+        seed: Seed for the jitter sequence, e.g. the node id.
+    """
+
+    def __init__(
+        self, min_delay=0.05, max_delay=5.0, factor=2.0, jitter=0.1, seed=None
+    ):
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.factor = factor
+        self.jitter = jitter
+        self.delay = min_delay
+        self._random = random.Random(seed)
+
+    def next(self):
+        delay = self.delay * (1 + self.jitter * (2 * self._random.random() - 1))
+        self.delay = min(self.delay * self.factor, self.max_delay)
+        return delay
+
+    def reset(self):
+        self.delay = self.min_delay
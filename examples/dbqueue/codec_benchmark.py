@@ -0,0 +1,80 @@
+import argparse
+from time import perf_counter
+
+import numpy as np
+
+from condorcmf.dbqueue.codec import JSONCodec, NumpyCodec
+
+CODECS = [
+    ("json", JSONCodec, None, None),
+    ("json+zlib-1", JSONCodec, "zlib", 1),
+    ("json+zlib-6", JSONCodec, "zlib", 6),
+    ("numpy", NumpyCodec, None, None),
+    ("numpy+zlib-1", NumpyCodec, "zlib", 1),
+    ("numpy+zlib-6", NumpyCodec, "zlib", 6),
+    ("numpy+zlib-9", NumpyCodec, "zlib", 9),
+    ("numpy+lzma-0", NumpyCodec, "lzma", 0),
+    ("numpy+lzma-6", NumpyCodec, "lzma", 6),
+]
+
+
+def particle_payloads(n_particles, dim, seed=0):
+    """
+    Return SMC-style payloads: freshly drawn particles, the same particles after
+    multinomial resampling (many duplicated rows) and single precision draws.
+    """
+    rng = np.random.default_rng(seed)
+    x = rng.normal(size=(n_particles, dim))
+    logw = rng.normal(size=n_particles)
+    w = np.exp(logw - logw.max())
+    resampled = rng.choice(n_particles, size=n_particles, p=w / w.sum())
+    return {
+        "random": {"x": x, "logw": logw, "ess": float(n_particles)},
+        "resampled": {
+            "x": x[resampled],
+            "logw": np.zeros(n_particles),
+            "ess": float(n_particles),
+        },
+        "float32": {"x": x.astype(np.float32), "logw": logw.astype(np.float32)},
+    }
+
+
+def timed(function, argument, repeat):
+    start = perf_counter()
+    for _ in range(repeat):
+        result = function(argument)
+    return result, (perf_counter() - start) / repeat
+
+
+def main(n_particles, dim, repeat):
+    payloads = particle_payloads(n_particles, dim)
+    for name, payload in payloads.items():
+        raw = sum(
+            value.nbytes for value in payload.values() if hasattr(value, "nbytes")
+        )
+        print(
+            f"\n{name}: {n_particles} particles x {dim}, {raw / 1e6:.2f} MB of array data"
+        )
+        print(
+            f"{'codec':>14} {'bytes':>12} {'ratio':>7} {'encode MB/s':>12} {'decode MB/s':>12}"
+        )
+        for label, codec_class, compression, level in CODECS:
+            codec = codec_class(compression=compression, level=level)
+            encoded, encode_time = timed(codec.encode, payload, repeat)
+            _, decode_time = timed(codec.decode, encoded, repeat)
+            print(
+                f"{label:>14} {len(encoded):>12} {raw / len(encoded):>7.2f} "
+                f"{raw / 1e6 / encode_time:>12.1f} {raw / 1e6 / decode_time:>12.1f}"
+            )
+    print()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark payload size and encode/decode throughput of the dbqueue codecs"
+    )
+    parser.add_argument("--particles", type=int, default=10000)
+    parser.add_argument("--dim", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    main(args.particles, args.dim, args.repeat)
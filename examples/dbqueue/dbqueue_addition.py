@@ -12,6 +12,7 @@ try:
 except:
     from condorcmf.dbqueue.connector.pymysql import PyMySQLConnector as DBQConnector
 
+from condorcmf.dbqueue import schema
 from condorcmf.dbqueue.daemon import Daemon
 from condorcmf.dbqueue.job import Job
 from condorcmf.dbqueue.session import Session
@@ -36,6 +37,9 @@ def main():
         MYSQL_POLL_DELAY,
     )
 
+    # Create the dbqueue tables, or migrate them to the current schema version
+    schema.migrate(db)
+
     # Instantiate session
     session_deadline = 60 * 60 * 7 * 24  # 1 week
     session = Session(db, deadline=session_deadline)
@@ -54,42 +58,27 @@ def main():
 
     print(f"Pool status: {session.pool_status()}")
 
-    # Create a job for each follower
+    # Create a job for each follower in a single transaction
     deadline = 60 * 60  # 1 hour
     global_sum = 0
     data = []
-    follower_jobs = []
     for i in range(n_followers):
         data.append(np.random.randint(1, 100, size=10))
-        payload = {"data": data[i]}
         global_sum += np.sum(data[i])
-        job = Job(
-            db,
-            session.session_id,
-            follower_daemons[i].node_id,
-            coordinator_daemon.node_id,
-            0,
-            deadline=deadline,
-            payload=payload,
-        )
-        job.create()
-        follower_jobs.append(job)
-
-    # Print status of jobs
-    for follower_job in follower_jobs:
-        print(follower_job.status())
+    job_ids = session.scatter(
+        [daemon.node_id for daemon in follower_daemons],
+        coordinator_daemon.node_id,
+        0,
+        payloads=[{"data": d} for d in data],
+        deadline=deadline,
+    )
+    print(f"Created {len(job_ids)} follower jobs")
 
     # Each follower fetches and completes its job
     # the results are then sent to the coordinator
     for i in range(n_followers):
-        # Fetch latest job from queue
-        follwer_job = follower_daemons[i].fetch_job()
-
-        # Fetch payload
-        follwer_job.get_payload()
-
-        # Set job status to 1 (in progress)
-        follwer_job.set_status(1)
+        # Take the latest job and its payload, setting its status to 1 (in progress)
+        follwer_job = follower_daemons[i].take_job()
 
         # Complete job
         follower_sum = np.sum(follwer_job.payload["data"])
@@ -102,8 +91,8 @@ def main():
         coordinator_job = Job(
             db,
             session.session_id,
-            follower_job.from_id,
-            follower_job.to_id,
+            follwer_job.from_id,
+            follwer_job.to_id,
             1,
             deadline=deadline,
             payload={"data": follower_sum},
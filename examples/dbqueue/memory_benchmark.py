@@ -0,0 +1,79 @@
+import argparse
+import logging
+from time import perf_counter
+
+from condorcmf.dbqueue.connector.memory import InMemoryConnector
+from condorcmf.dbqueue.daemon import Daemon
+from condorcmf.dbqueue.session import Session
+
+logging.basicConfig(level=logging.WARNING)
+
+
+def main(n_followers, n_rounds):
+    # Every daemon shares one in-process store, so the timings below are the
+    # framework's own overhead per job with no database round trips
+    db = InMemoryConnector()
+
+    session = Session(db)
+    session.create(active=True)
+
+    coordinator = Daemon(db, session.session_id, 0)
+    coordinator.join()
+    followers = [Daemon(db, session.session_id, 1) for _ in range(n_followers)]
+    for daemon in followers:
+        daemon.join()
+    follower_ids = [daemon.node_id for daemon in followers]
+
+    timings = {"scatter": 0.0, "take": 0.0, "reply": 0.0, "collect": 0.0}
+    for i in range(n_rounds):
+        round_id = f"round-{i}"
+
+        start = perf_counter()
+        session.scatter(
+            follower_ids,
+            coordinator.node_id,
+            0,
+            payloads=[{"data": j} for j in range(n_followers)],
+            round_id=round_id,
+        )
+        timings["scatter"] += perf_counter() - start
+
+        start = perf_counter()
+        jobs = [daemon.take_job(round_id=round_id) for daemon in followers]
+        timings["take"] += perf_counter() - start
+
+        start = perf_counter()
+        session.set_status_many(jobs, 2)
+        session.scatter(
+            [coordinator.node_id] * n_followers,
+            coordinator.node_id,
+            1,
+            payloads=[{"data": job.payload["data"] + 1} for job in jobs],
+            round_id=round_id,
+        )
+        timings["reply"] += perf_counter() - start
+
+        start = perf_counter()
+        replies = coordinator.take_job(round_id=round_id, n=n_followers)
+        session.set_status_many(replies, 2)
+        timings["collect"] += perf_counter() - start
+
+        assert len(replies) == n_followers, "Lost replies"
+
+    n_jobs = n_followers * n_rounds
+    print(f"\n{n_followers} followers x {n_rounds} rounds")
+    for phase, elapsed in timings.items():
+        print(f"{phase:>8}: {1e6 * elapsed / n_jobs:8.1f} us/job")
+    print(f"{'total':>8}: {1e6 * sum(timings.values()) / n_jobs:8.1f} us/job\n")
+
+    session.clear_session()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark dbqueue overhead per job on the in-memory connector"
+    )
+    parser.add_argument("--followers", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+    main(args.followers, args.rounds)
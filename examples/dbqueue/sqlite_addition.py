@@ -0,0 +1,79 @@
+import logging
+from pathlib import Path
+
+import numpy as np
+
+from condorcmf.dbqueue.connector.sqlite import SQLiteConnector
+from condorcmf.dbqueue.daemon import Daemon
+from condorcmf.dbqueue.job import Job
+from condorcmf.dbqueue.session import Session
+
+logging.basicConfig(level=logging.INFO)
+
+SQLITE_PATH = Path("condorcmf.db")
+
+
+def main():
+    # Create database connection, the tables are created on first use
+    db = SQLiteConnector(SQLITE_PATH)
+
+    # Instantiate session
+    session = Session(db)
+    session.create(active=True)
+
+    # Daemons join sesion pool
+    coordinator_daemon = Daemon(db, session.session_id, 0)
+    coordinator_daemon.join()
+
+    n_followers = 10
+    follower_daemons = []
+    for i in range(n_followers):
+        daemon = Daemon(db, session.session_id, 1)
+        daemon.join()
+        follower_daemons.append(daemon)
+
+    # Create a job for each follower
+    data = [np.random.randint(1, 100, size=10) for _ in range(n_followers)]
+    global_sum = sum(np.sum(d) for d in data)
+    round_id = "round-0"
+    session.scatter(
+        [daemon.node_id for daemon in follower_daemons],
+        coordinator_daemon.node_id,
+        0,
+        payloads=[{"data": d} for d in data],
+        round_id=round_id,
+    )
+
+    # Each follower takes its job and sends its result to the coordinator
+    for daemon in follower_daemons:
+        job = daemon.take_job()
+        follower_sum = np.sum(job.payload["data"])
+        job.set_status(2)
+        Job(
+            db,
+            session.session_id,
+            coordinator_daemon.node_id,
+            daemon.node_id,
+            1,
+            round_id=round_id,
+            payload={"data": follower_sum},
+        ).create()
+
+    # Coordinator takes and completes its jobs
+    coordinator_jobs = coordinator_daemon.take_job(round_id=round_id, n=n_followers)
+    coordinator_sum = sum(job.payload["data"] for job in coordinator_jobs)
+    session.set_status_many(coordinator_jobs, 2)
+
+    print(f"\n\nCoordinator sum: {coordinator_sum}, Global sum: {global_sum}\n\n")
+
+    # Clean up
+    session.clear_session()
+    db.close()
+
+    assert (
+        global_sum == coordinator_sum
+    ), "Global sum is not equal to sum of all follower sums"
+
+
+if __name__ == "__main__":
+    main()
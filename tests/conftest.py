@@ -0,0 +1,31 @@
+import pytest
+
+from condorcmf.dbqueue.connector.memory import InMemoryConnector
+from condorcmf.dbqueue.connector.sqlite import SQLiteConnector
+from condorcmf.dbqueue.daemon import Daemon
+from condorcmf.dbqueue.session import Session
+
+
+@pytest.fixture(params=["sqlite", "memory"])
+def db(request, tmp_path):
+    if request.param == "sqlite":
+        connector = SQLiteConnector(tmp_path / "dbqueue.db")
+    else:
+        connector = InMemoryConnector()
+    yield connector
+    connector.close()
+
+
+@pytest.fixture
+def session(db):
+    session = Session(db)
+    session.create()
+    return session
+
+
+@pytest.fixture
+def daemon(db, session):
+    daemon = Daemon(db, session.session_id, role=2, node_id="follower")
+    daemon.join()
+    yield daemon
+    daemon.stop_heartbeat(flush=False)
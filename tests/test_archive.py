@@ -0,0 +1,60 @@
+from condorcmf.dbqueue.connector.base import in_clause
+
+
+def finish(db, session, job_ids, status=2):
+    db.update(
+        "job_queue",
+        "`status_code` = %s",
+        f"`session_id` = %s AND `job_id` IN {in_clause(job_ids)}",
+        params=(status, session.session_id, *job_ids),
+    )
+
+
+def live_jobs(db, session):
+    rows = db.select(
+        "job_queue",
+        "`job_id`",
+        "`session_id`=%s",
+        limit=None,
+        params=(session.session_id,),
+    )
+    return {row[0] for row in rows or []}
+
+
+def test_archive_moves_finished_jobs(db, session):
+    job_ids = session.scatter(
+        ["a"] * 5, "leader", 1, payloads=[{"n": i} for i in range(5)]
+    )
+    finish(db, session, job_ids[:2], status=2)
+    finish(db, session, job_ids[2:3], status=3)
+    assert session.archive_jobs(older_than=3600) == 0
+    assert session.archive_jobs(older_than=-1) == 3
+    assert live_jobs(db, session) == set(job_ids[3:])
+    records = list(session.iter_history(with_payload=True))
+    assert [record.job_id for record in records] == job_ids[:3]
+    assert [record.status_code for record in records] == [2, 2, 3]
+    assert [record.payload for record in records] == [{"n": i} for i in range(3)]
+
+
+def test_archive_in_chunks(db, session):
+    job_ids = session.scatter(["a"] * 5, "leader", 1)
+    finish(db, session, job_ids)
+    assert session.archive_jobs(older_than=-1, chunk_size=2, max_chunks=2) == 4
+    assert len(live_jobs(db, session)) == 1
+    assert session.archive_jobs(older_than=-1, chunk_size=2) == 1
+    assert live_jobs(db, session) == set()
+    assert sorted(
+        record.job_id for record in session.iter_history(chunk_size=2)
+    ) == sorted(job_ids)
+
+
+def test_history_filters(db, session):
+    first = session.scatter(["a", "b"], "leader", 1, round_id="r1")
+    second = session.scatter(["a"], "leader", 1, round_id="r2")
+    finish(db, session, first + second)
+    session.archive_jobs(older_than=-1)
+    assert [r.job_id for r in session.iter_history(round_id="r2")] == second
+    assert [r.job_id for r in session.iter_history(to_id="b")] == first[1:]
+    assert [r.job_id for r in session.iter_history(job_id=first[0])] == first[:1]
+    assert all(r.payload is None for r in session.iter_history())
+    assert list(session.iter_history(status_code=3)) == []
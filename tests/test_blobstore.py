@@ -0,0 +1,78 @@
+import os
+
+import numpy as np
+import pytest
+
+from condorcmf.dbqueue.blobstore import FileBlobStore
+from condorcmf.dbqueue.codec import BLOB_MARKER, JSONCodec, NumpyCodec
+
+
+@pytest.fixture
+def store(tmp_path):
+    return FileBlobStore(tmp_path / "blobs", cache_dir=tmp_path / "cache")
+
+
+def blobs(directory):
+    return [path for path in directory.glob("*/*/*") if not path.name.startswith(".")]
+
+
+def test_large_payloads_spill_to_the_store(db, session, daemon, store):
+    db.codec = NumpyCodec(blob_store=store, spill_threshold=1024)
+    weights = np.arange(4096, dtype=np.float64)
+    job_ids = session.scatter([daemon.node_id] * 2, "leader", 1, payload={"w": weights})
+    session.scatter([daemon.node_id], "leader", 1, payload={"w": [1, 2]})
+    # Identical payloads share one blob, small ones stay in the row
+    assert len(blobs(store.root)) == 1
+    rows = db.select(
+        "job_queue",
+        "`payload`",
+        "`session_id`=%s AND `job_id` IN (%s, %s)",
+        params=(session.session_id, *job_ids),
+    )
+    assert all(row[0][0] == BLOB_MARKER and len(row[0]) == 65 for row in rows)
+    payloads = [daemon.take_job().payload["w"] for _ in range(3)]
+    assert sorted(len(payload) for payload in payloads) == [2, 4096, 4096]
+    np.testing.assert_array_equal(max(payloads, key=len), weights)
+
+
+def test_spill_after_compression(store):
+    codec = JSONCodec(
+        compression="zlib", threshold=64, blob_store=store, spill_threshold=1024
+    )
+    # Compresses below the spill threshold and stays in the row
+    assert codec.encode({"x": [0] * 10000})[0] == 1
+    noise = np.random.default_rng(0).integers(0, 1 << 30, 2000).tolist()
+    encoded = codec.encode({"x": noise})
+    assert encoded[0] == BLOB_MARKER
+    assert codec.decode(encoded) == {"x": noise}
+
+
+def test_reading_a_blob_needs_a_store(store):
+    encoded = JSONCodec(blob_store=store, spill_threshold=16).encode({"x": "y" * 100})
+    with pytest.raises(ValueError):
+        JSONCodec().decode(encoded)
+
+
+def test_blobs_are_cached_locally(store):
+    digest = store.put(b"payload")
+    assert store.get(digest) == b"payload"
+    os.remove(store._path(store.root, digest))
+    assert store.get(digest) == b"payload"
+    store.clear_cache()
+    with pytest.raises(FileNotFoundError):
+        store.get(digest)
+
+
+def test_corrupt_blob_is_rejected(tmp_path):
+    store = FileBlobStore(tmp_path / "blobs", cache=False)
+    digest = store.put(b"payload")
+    store._path(store.root, digest).write_bytes(b"tampered")
+    with pytest.raises(ValueError):
+        store.get(digest)
+
+
+def test_prune_removes_old_blobs(store):
+    old, new = store.put(b"old"), store.put(b"new")
+    os.utime(store._path(store.root, old), (0, 0))
+    assert store.prune(older_than=3600) == 1
+    assert not store.exists(old) and store.exists(new)
@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+
+from condorcmf.dbqueue import broadcast
+from condorcmf.dbqueue.broadcast import Broadcast
+from condorcmf.dbqueue.codec import NumpyCodec
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    broadcast._cache.clear()
+    yield
+    broadcast._cache.clear()
+
+
+def count_reads(monkeypatch, db):
+    reads = []
+    select_one = db.select_one
+
+    def counting_select_one(table, *args, **kwargs):
+        if table == "broadcast":
+            reads.append(args)
+        return select_one(table, *args, **kwargs)
+
+    monkeypatch.setattr(db, "select_one", counting_select_one)
+    return reads
+
+
+def test_jobs_see_the_shared_payload_merged_with_their_own(db, session, daemon):
+    session.broadcast(
+        [daemon.node_id] * 3,
+        "leader",
+        1,
+        {"model": "shared", "step": 0},
+        payloads=[{"step": i} for i in range(3)],
+    )
+    payloads = [daemon.take_job().payload for _ in range(3)]
+    assert sorted(payloads, key=lambda p: p["step"]) == [
+        {"model": "shared", "step": i} for i in range(3)
+    ]
+    assert db.select_one(
+        "broadcast", "COUNT(*)", "`session_id`=%s", params=(session.session_id,)
+    ) == (1,)
+
+
+def test_shared_payload_is_fetched_once(monkeypatch, db, session, daemon):
+    db.codec = NumpyCodec()
+    session.broadcast([daemon.node_id] * 4, "leader", 1, {"w": np.arange(8)})
+    reads = count_reads(monkeypatch, db)
+    payloads = [daemon.take_job().payload for _ in range(4)]
+    assert len(reads) == 1
+    assert all(payload["w"] is payloads[0]["w"] for payload in payloads)
+
+
+def test_cache_evicts_least_recently_used(monkeypatch, db, session):
+    monkeypatch.setattr(broadcast, "CACHE_SIZE", 2)
+    broadcasts = Broadcast(db, session.session_id)
+    first, second, third = (broadcasts.create({"n": i}) for i in range(3))
+    reads = count_reads(monkeypatch, db)
+    for broadcast_id in (first, second, first, third, first, second):
+        broadcasts.get(broadcast_id)
+    # `second` was evicted by `third`, `first` stayed in use
+    assert len(reads) == 4
+
+
+def test_merge_without_a_broadcast(db, session):
+    broadcasts = Broadcast(db, session.session_id)
+    assert broadcasts.merge(None, {"x": 1}) == {"x": 1}
+    assert broadcasts.merge("missing", {"x": 1}) == {"x": 1}
+
+
+def test_clear_round(db, session):
+    broadcasts = Broadcast(db, session.session_id)
+    broadcasts.create({}, round_id="a")
+    kept = broadcasts.create({"n": 1}, round_id="b")
+    broadcasts.clear(round_id="a")
+    broadcast._cache.clear()
+    assert broadcasts.get(kept) == {"n": 1}
+    assert db.select_one(
+        "broadcast", "COUNT(*)", "`session_id`=%s", params=(session.session_id,)
+    ) == (1,)
@@ -0,0 +1,98 @@
+import multiprocessing
+import threading
+from collections import Counter
+
+import pytest
+
+from condorcmf.dbqueue.connector.sqlite import SQLiteConnector
+from condorcmf.dbqueue.daemon import Daemon
+from condorcmf.dbqueue.session import Session
+
+N_JOBS = 300
+N_WORKERS = 6
+
+
+def drain(db, session_id, node_id, n=3):
+    daemon = Daemon(db, session_id, role=2, node_id=node_id, lease_time=600)
+    daemon.join()
+    claimed = []
+    while True:
+        jobs = daemon.fetch_global_jobs(n=n)
+        if not jobs:
+            return claimed
+        claimed.extend(job.job_id for job in jobs)
+
+
+def drain_process(path, session_id, node_id, claimed):
+    db = SQLiteConnector(path, create_schema=False)
+    claimed.extend(drain(db, session_id, node_id))
+    db.close()
+
+
+@pytest.fixture
+def sqlite_session(tmp_path):
+    db = SQLiteConnector(tmp_path / "claims.db")
+    session = Session(db)
+    session.create()
+    job_ids = session.scatter([""] * N_JOBS, "leader", 1)
+    yield db, session, job_ids
+    db.close()
+
+
+def claimed_by(db, session):
+    return dict(
+        db.select(
+            "job_queue",
+            "`job_id`, `claimed_by`",
+            "`session_id`=%s",
+            limit=None,
+            params=(session.session_id,),
+        )
+    )
+
+
+def test_threads_claim_each_job_once(sqlite_session):
+    db, session, job_ids = sqlite_session
+    results = {}
+
+    def work(node_id):
+        results[node_id] = drain(db, session.session_id, node_id)
+
+    threads = [
+        threading.Thread(target=work, args=(f"worker-{i}",)) for i in range(N_WORKERS)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    counts = Counter(job_id for claimed in results.values() for job_id in claimed)
+    assert set(counts) == set(job_ids)
+    assert set(counts.values()) == {1}
+    owners = claimed_by(db, session)
+    assert all(
+        owners[job_id] == node
+        for node, claimed in results.items()
+        for job_id in claimed
+    )
+
+
+def test_processes_claim_each_job_once(sqlite_session):
+    db, session, job_ids = sqlite_session
+    context = multiprocessing.get_context("spawn")
+    with context.Manager() as manager:
+        claimed = manager.list()
+        processes = [
+            context.Process(
+                target=drain_process,
+                args=(db.path, session.session_id, f"worker-{i}", claimed),
+            )
+            for i in range(N_WORKERS)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        counts = Counter(claimed)
+    assert all(process.exitcode == 0 for process in processes)
+    assert set(counts) == set(job_ids)
+    assert set(counts.values()) == {1}
@@ -0,0 +1,93 @@
+import numpy as np
+import pytest
+
+from condorcmf.dbqueue.codec import JSON, MAGIC, JSONCodec, NumpyCodec
+
+
+def payload():
+    return {
+        "weights": np.arange(12, dtype=np.float32).reshape(3, 4),
+        "columns": np.arange(20, dtype=np.int64).reshape(4, 5)[:, ::2],
+        "empty": np.zeros((0, 3)),
+        "nested": [np.array([1, 2], dtype=np.uint8), {"step": np.float64(0.5)}],
+        "objects": np.array(["a", 1], dtype=object),
+        "name": "round",
+    }
+
+
+def take(session, daemon, payload):
+    session.scatter([daemon.node_id], "leader", 1, payload=payload)
+    return daemon.take_job().payload
+
+
+def test_json_codec_round_trip(db, session, daemon):
+    assert take(session, daemon, payload()) == {
+        "weights": np.arange(12).reshape(3, 4).tolist(),
+        "columns": np.arange(20).reshape(4, 5)[:, ::2].tolist(),
+        "empty": [],
+        "nested": [[1, 2], {"step": 0.5}],
+        "objects": ["a", 1],
+        "name": "round",
+    }
+
+
+def test_numpy_codec_round_trip(db, session, daemon):
+    db.codec = NumpyCodec()
+    expected = payload()
+    decoded = take(session, daemon, expected)
+    for key in ("weights", "columns", "empty"):
+        assert decoded[key].dtype == expected[key].dtype
+        np.testing.assert_array_equal(decoded[key], expected[key])
+    assert decoded["nested"][0].dtype == np.uint8
+    np.testing.assert_array_equal(decoded["nested"][0], [1, 2])
+    assert decoded["nested"][1] == {"step": 0.5}
+    assert decoded["objects"] == ["a", 1]
+    assert decoded["name"] == "round"
+
+
+def test_numpy_codec_writes_raw_buffers():
+    array = np.arange(1000, dtype=np.float64)
+    encoded = NumpyCodec().encode({"x": array})
+    assert encoded.startswith(MAGIC)
+    assert array.tobytes() in encoded
+    decoded = NumpyCodec().decode(encoded)["x"]
+    assert not decoded.flags.writeable
+
+
+@pytest.mark.parametrize("writer, reader", [(JSON, NumpyCodec()), (NumpyCodec(), JSON)])
+def test_codecs_read_each_others_rows(writer, reader):
+    decoded = reader.decode(writer.encode({"x": np.arange(3)}))
+    np.testing.assert_array_equal(decoded["x"], [0, 1, 2])
+
+
+@pytest.mark.parametrize("compression, marker", [("zlib", 1), ("lzma", 2)])
+def test_compressed_round_trip(db, session, daemon, compression, marker):
+    db.codec = NumpyCodec(compression=compression, threshold=256)
+    weights = np.zeros((64, 64))
+    encoded = db.codec.encode({"weights": weights})
+    assert encoded[0] == marker
+    assert len(encoded) < weights.nbytes // 10
+    decoded = take(session, daemon, {"weights": weights})
+    np.testing.assert_array_equal(decoded["weights"], weights)
+
+
+@pytest.mark.parametrize("compression", ["zlib", "lzma"])
+def test_small_and_incompressible_payloads_are_stored_as_is(compression):
+    codec = JSONCodec(compression=compression, threshold=256)
+    assert codec.encode({"x": 1}) == '{"x": 1}'
+    noise = np.random.default_rng(0).integers(0, 256, 4096, dtype=np.uint8)
+    encoded = NumpyCodec(compression=compression, threshold=256).encode(noise)
+    assert encoded.startswith(MAGIC)
+
+
+def test_compressed_and_plain_rows_decode_side_by_side(db, session, daemon):
+    plain = {"values": list(range(500))}
+    session.scatter([daemon.node_id], "leader", 1, payload=plain)
+    db.codec = JSONCodec(compression="zlib", threshold=256)
+    session.scatter([daemon.node_id], "leader", 1, payload=plain)
+    assert [daemon.take_job().payload for _ in range(2)] == [plain, plain]
+
+
+def test_unknown_compression_is_rejected():
+    with pytest.raises(ValueError):
+        JSONCodec(compression="brotli")
@@ -0,0 +1,52 @@
+import threading
+
+import pytest
+
+from condorcmf.dbqueue.connector.memory import InMemoryConnector
+from condorcmf.dbqueue.session import Session
+
+
+def test_failed_batch_is_rolled_back_and_dropped(db, session):
+    db.insert(
+        "pool",
+        "(`session_id`, `node_id`)",
+        (session.session_id, "a"),
+        queue_query=True,
+    )
+    db.update("missing", "`x` = %s", "`y` LIKE %s", queue_query=True, params=(1, 2))
+    with pytest.raises(Exception):
+        db._execute_query_queue()
+    assert db.query_queue == []
+    assert db.select_one("pool", "COUNT(*)", "`node_id`=%s", params=("a",)) == (0,)
+
+
+def test_memory_batch_is_atomic_across_threads():
+    db = InMemoryConnector()
+    session = Session(db)
+    session.create()
+    seen = []
+
+    def read():
+        for _ in range(200):
+            seen.append(
+                db.select_one(
+                    "pool",
+                    "COUNT(*)",
+                    "`session_id`=%s",
+                    params=(session.session_id,),
+                )[0]
+            )
+
+    reader = threading.Thread(target=read)
+    reader.start()
+    for i in range(50):
+        for j in range(2):
+            db.insert(
+                "pool",
+                "(`session_id`, `node_id`)",
+                (session.session_id, f"{i}-{j}"),
+                queue_query=True,
+            )
+        db._execute_query_queue()
+    reader.join()
+    assert all(count % 2 == 0 for count in seen)
@@ -0,0 +1,126 @@
+import threading
+from time import sleep, time
+
+from condorcmf.dbqueue.daemon import Daemon
+from condorcmf.dbqueue.feed import FEED_COLUMNS, ChangeFeed, FeedCursor
+
+FEED_COLUMNS_WITH_SEQ = "(`seq`, " + FEED_COLUMNS[1:]
+
+
+def insert_entry(db, session_id, seq, created_at, to_id="follower"):
+    db.insert(
+        "job_feed",
+        FEED_COLUMNS_WITH_SEQ,
+        (seq, session_id, f"job-{seq}", "r", to_id, "leader", 1, 0, created_at),
+    )
+
+
+def test_cursor_returns_entries_that_become_visible_late(db, session):
+    feed = ChangeFeed(db, session.session_id)
+    cursor = FeedCursor()
+    # seq 105 commits while the transaction holding seq 103 is still open
+    insert_entry(db, session.session_id, 105, time())
+    assert [change[0] for change in feed.read(cursor)] == [105]
+    insert_entry(db, session.session_id, 103, time())
+    assert [change[0] for change in feed.read(cursor)] == [103]
+    assert feed.read(cursor) == []
+
+
+def test_cursor_moves_past_settled_entries(db, session):
+    feed = ChangeFeed(db, session.session_id)
+    cursor = FeedCursor(settle=1.0)
+    insert_entry(db, session.session_id, 10, time() - 10)
+    insert_entry(db, session.session_id, 11, time() - 10)
+    insert_entry(db, session.session_id, 12, time())
+    assert [change[0] for change in feed.read(cursor)] == [10, 11, 12]
+    assert cursor.seq == 11
+    assert cursor.seen == {12}
+
+
+def test_daemon_changes_do_not_repeat_entries(session, daemon):
+    session.scatter([daemon.node_id] * 3, "leader", 1, round_id="r")
+    assert len(daemon.changes()) == 3
+    assert daemon.changes() == []
+
+
+def test_stale_job_sweep_is_recorded(session, daemon):
+    session.scatter(
+        [daemon.node_id] * 2, "leader", 1, round_id="r", deadline=time() - 1
+    )
+    daemon.changes()
+    session.clean_stale_jobs()
+    assert [change[6] for change in daemon.changes()] == [3, 3]
+
+
+def test_stale_daemon_sweep_is_recorded(db, session, daemon):
+    session.scatter([daemon.node_id] * 2, "leader", 1, round_id="r")
+    daemon.changes()
+    session.clean_stale_daemons(timeout=-1)
+    assert [change[6] for change in daemon.changes()] == [3, 3]
+    # Already stale jobs are not recorded again
+    session.clean_stale_daemons(timeout=-1)
+    assert daemon.changes() == []
+
+
+def test_exhausted_job_sweep_is_recorded(db, session):
+    daemon = Daemon(
+        db, session.session_id, role=2, node_id="worker", lease_time=-1, max_attempts=1
+    )
+    daemon.join()
+    session.scatter([daemon.node_id], "leader", 1, round_id="r")
+    assert daemon.take_job() is not None
+    daemon.changes()
+    session.clean_exhausted_jobs(max_attempts=1)
+    assert [change[6] for change in daemon.changes()] == [3]
+
+
+def test_released_prefetched_jobs_are_recorded(db, session):
+    daemon = Daemon(db, session.session_id, role=2, node_id="worker", prefetch=4)
+    daemon.join()
+    session.scatter([daemon.node_id] * 3, "leader", 1, round_id="r")
+    daemon.changes()
+    assert daemon.take_job() is not None
+    assert daemon.release_prefetched() == 2
+    assert [change[6] for change in daemon.changes()] == [0, 0]
+
+
+def test_id_only_batch_entries_carry_job_columns(session, daemon):
+    job_ids = session.scatter([daemon.node_id] * 2, "leader", 7, round_id="r")
+    daemon.changes()
+    session.set_status_many(job_ids, 2)
+    changes = daemon.changes()
+    assert sorted(change[1] for change in changes) == sorted(job_ids)
+    for _, _, round_id, to_id, from_id, job_type, status_code, _ in changes:
+        assert (round_id, to_id, from_id, job_type, status_code) == (
+            "r",
+            daemon.node_id,
+            "leader",
+            7,
+            2,
+        )
+
+
+def test_feed_waiter_sees_id_only_reset(session, daemon):
+    (job_id,) = session.scatter([daemon.node_id], "leader", 1, round_id="r")
+    assert daemon.take_job().job_id == job_id
+    received = []
+    waiter = threading.Thread(
+        target=lambda: received.append(daemon.wait_for_job(timeout=3, use_feed=True))
+    )
+    waiter.start()
+    sleep(0.3)
+    session.set_status_many([job_id], 0)
+    waiter.join()
+    assert received[0] is not None and received[0].job_id == job_id
+
+
+def test_feed_cursor_starts_at_join(db, session):
+    session.scatter(["late"] * 3, "leader", 1)
+    daemon = Daemon(db, session.session_id, role=2, node_id="late")
+    daemon.join()
+    assert daemon.feed_cursor.seq == ChangeFeed(db, session.session_id).latest()
+    assert daemon.changes() == []
+    (job_id,) = session.scatter(["late"], "leader", 1)
+    assert [entry[1] for entry in daemon.changes()] == [job_id]
+    # Jobs sent before joining are still taken
+    assert len(daemon.take_job(n=10)) == 4
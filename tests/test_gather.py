@@ -0,0 +1,82 @@
+import threading
+from time import sleep, time
+
+import numpy as np
+
+
+def reply(session, from_id, value, round_id="r"):
+    session.scatter(["leader"], from_id, 2, payload={"x": value}, round_id=round_id)
+
+
+def test_gather_orders_replies_by_follower(session):
+    for follower in ("b", "c", "a"):
+        reply(session, follower, ord(follower))
+    gathered = session.gather("r", ["a", "b", "c"], timeout=1, stack="x")
+    assert [record.from_id for record in gathered.records] == ["a", "b", "c"]
+    assert np.array_equal(gathered.payloads, [ord("a"), ord("b"), ord("c")])
+    assert gathered.stragglers == []
+
+
+def test_gather_waits_for_late_replies(session):
+    reply(session, "a", 1)
+    late = threading.Thread(target=lambda: (sleep(0.3), reply(session, "b", 2)))
+    late.start()
+    gathered = session.gather("r", ["a", "b"], timeout=5)
+    late.join()
+    assert [record.from_id for record in gathered.records] == ["a", "b"]
+    assert gathered.stragglers == []
+
+
+def test_duplicate_replies_do_not_complete_the_round(db, session):
+    reply(session, "a", 1)
+    reply(session, "a", 2)
+    start = time()
+    gathered = session.gather("r", ["a", "b"], timeout=0.5)
+    assert time() - start >= 0.45
+    assert [record.from_id for record in gathered.records] == ["a"]
+    assert gathered.stragglers == ["b"]
+    statuses = db.select(
+        "job_queue",
+        "`status_code`",
+        "`session_id`=%s AND `round_id`=%s",
+        params=(session.session_id, "r"),
+    )
+    assert sorted(row[0] for row in statuses) == [2, 4]
+
+
+def test_dropped_duplicates_do_not_count_later(session):
+    reply(session, "a", 1)
+    reply(session, "a", 2)
+    session.gather("r", ["a", "b"], timeout=0.2)
+    gathered = session.gather("r", 1, timeout=0.2)
+    assert gathered.records == []
+    assert gathered.stragglers == 1
+
+
+def test_replies_from_unexpected_followers_are_left_pending(session):
+    reply(session, "a", 1)
+    reply(session, "z", 2)
+    gathered = session.gather("r", ["a"], timeout=1)
+    assert [record.from_id for record in gathered.records] == ["a"]
+    assert [record.from_id for record in session.gather("r", 1, timeout=1).records] == [
+        "z"
+    ]
+
+
+def test_gather_by_count(session):
+    reply(session, "a", 1)
+    reply(session, "a", 2)
+    gathered = session.gather("r", 3, timeout=0.2)
+    assert len(gathered.records) == 2
+    assert gathered.stragglers == 1
+
+
+def test_gather_by_numpy_count(session):
+    followers = np.array(["a", "b"])
+    for follower in followers:
+        reply(session, str(follower), 1)
+    gathered = session.gather("r", followers.size, timeout=1)
+    assert len(gathered.records) == 2
+    assert gathered.stragglers == 0
+    gathered = session.gather("r", np.int32(1), timeout=0.1)
+    assert gathered.stragglers == 1
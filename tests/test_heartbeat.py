@@ -0,0 +1,42 @@
+from time import sleep, time
+
+from condorcmf.dbqueue.daemon import Daemon
+
+
+def test_heartbeat_coalesces_status_updates(db, session, daemon, monkeypatch):
+    updates = []
+    update = db.update
+
+    def counting_update(*args, **kwargs):
+        updates.append(args)
+        return update(*args, **kwargs)
+
+    monkeypatch.setattr(db, "update", counting_update)
+    daemon.start_heartbeat(interval=0.1)
+    start = time()
+    while time() - start < 0.5:
+        for status in (1, 2, 1):
+            daemon.set_status(status)
+        sleep(0.01)
+    daemon.set_status(2)
+    daemon.stop_heartbeat()
+    assert len(updates) <= 8
+    assert daemon.status() == 2
+
+
+def test_heartbeat_and_prefetch_share_the_connector(db, session):
+    daemon = Daemon(
+        db, session.session_id, role=2, node_id="a", lease_time=5, prefetch=4
+    )
+    daemon.join()
+    job_ids = set(session.scatter(["a"] * 40, "leader", 1))
+    daemon.start_heartbeat(interval=0.01, renew_leases=True)
+    taken = set()
+    while True:
+        job = daemon.take_job()
+        if job is None:
+            break
+        taken.add(job.job_id)
+        job.set_status(2)
+    daemon.leave()
+    assert taken == job_ids
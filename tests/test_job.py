@@ -0,0 +1,47 @@
+import threading
+
+from condorcmf.dbqueue.job import Job
+
+
+def count_jobs(db, session):
+    return db.select_one(
+        "job_queue",
+        "COUNT(*)",
+        "`session_id`=%s",
+        params=(session.session_id,),
+    )[0]
+
+
+def test_queued_statements_stay_with_their_thread(db, session):
+    job = Job(db, session.session_id, "a", "leader", 1)
+    db.insert(
+        "job_queue", "(`session_id`, `job_id`)", ("other", "queued"), queue_query=True
+    )
+    thread = threading.Thread(target=job.create)
+    thread.start()
+    thread.join()
+    assert count_jobs(db, session) == 1
+    assert len(db.query_queue) == 1
+    assert db._execute_query_queue() == [True]
+
+
+def test_concurrent_creates_on_a_shared_connector(db, session):
+    errors = []
+
+    def create():
+        try:
+            for _ in range(50):
+                assert Job(db, session.session_id, "a", "leader", 1).create()
+            Job.create_many(
+                [Job(db, session.session_id, "a", "leader", 1) for _ in range(50)]
+            )
+        except Exception as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=create) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert count_jobs(db, session) == 800
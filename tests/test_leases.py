@@ -0,0 +1,78 @@
+from time import sleep, time
+
+from condorcmf.dbqueue.daemon import Daemon
+
+
+def worker(db, session, node_id, lease_time=0.2, max_attempts=3):
+    daemon = Daemon(
+        db,
+        session.session_id,
+        role=2,
+        node_id=node_id,
+        lease_time=lease_time,
+        max_attempts=max_attempts,
+    )
+    daemon.join()
+    return daemon
+
+
+def job_row(db, session, job_id):
+    return db.select_one(
+        "job_queue",
+        "`status_code`, `claimed_by`, `attempts`",
+        "`session_id`=%s AND `job_id`=%s",
+        params=(session.session_id, job_id),
+    )
+
+
+def test_expired_lease_is_redelivered(db, session):
+    first, second = worker(db, session, "a"), worker(db, session, "b")
+    (job_id,) = session.scatter([""], "leader", 1, payload={"x": 1})
+    (job,) = first.fetch_global_jobs()
+    assert second.fetch_global_jobs() == []
+    sleep(0.3)
+    (again,) = second.fetch_global_jobs()
+    assert again.job_id == job_id and again.attempts == 2
+    assert again.payload == {"x": 1}
+    assert job_row(db, session, job_id) == (1, "b", 2)
+    # The first worker has lost the job
+    assert not job.extend_lease(10)
+    assert again.extend_lease(10)
+
+
+def test_extend_lease_keeps_job(db, session):
+    first, second = worker(db, session, "a"), worker(db, session, "b")
+    session.scatter([""], "leader", 1)
+    (job,) = first.fetch_global_jobs()
+    assert job.extend_lease(10)
+    assert job.lease_expires > time() + 9
+    sleep(0.3)
+    assert second.fetch_global_jobs() == []
+
+
+def test_renew_leases_keeps_jobs(db, session):
+    first, second = worker(db, session, "a"), worker(db, session, "b")
+    session.scatter([""] * 2, "leader", 1)
+    assert len(first.fetch_global_jobs(n=2)) == 2
+    first.renew_leases(10)
+    sleep(0.3)
+    assert second.fetch_global_jobs(n=2) == []
+
+
+def test_exhausted_jobs_are_not_redelivered(db, session):
+    daemon = worker(db, session, "a", max_attempts=2)
+    (job_id,) = session.scatter([""], "leader", 1)
+    for _ in range(2):
+        assert len(daemon.fetch_global_jobs()) == 1
+        sleep(0.3)
+    assert daemon.fetch_global_jobs() == []
+    session.clean_exhausted_jobs(max_attempts=2)
+    assert job_row(db, session, job_id)[0] == 3
+
+
+def test_feed_waiter_picks_up_expired_lease(db, session):
+    daemon = worker(db, session, "a")
+    (job_id,) = session.scatter(["a"], "leader", 1)
+    assert daemon.take_job().job_id == job_id
+    job = daemon.wait_for_job(timeout=3, use_feed=True, probe_interval=0.5)
+    assert job is not None and job.job_id == job_id and job.attempts == 2
@@ -0,0 +1,168 @@
+import threading
+
+import pytest
+
+from condorcmf.dbqueue.connector import pool as pool_module
+from condorcmf.dbqueue.connector.pool import ConnectionPool, PoolTimeout
+
+
+class OperationalError(Exception):
+    pass
+
+
+class InterfaceError(Exception):
+    pass
+
+
+class FakeConnection:
+    def __init__(self, n):
+        self.n = n
+        self.pings = 0
+        self.closed = False
+        self.alive = True
+
+    def ping(self, reconnect=True):
+        self.pings += 1
+        if not self.alive:
+            raise OperationalError(2006, "MySQL server has gone away")
+
+    def close(self):
+        self.closed = True
+
+
+class Factory:
+    def __init__(self):
+        self.connections = []
+
+    def __call__(self):
+        connection = FakeConnection(len(self.connections))
+        self.connections.append(connection)
+        return connection
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(pool_module, "monotonic", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def factory():
+    return Factory()
+
+
+def make_pool(factory, **kwargs):
+    options = dict(
+        max_size=2, idle_timeout=300, recycle=3600, ping_after=10, timeout=0.05
+    )
+    options.update(kwargs)
+    return ConnectionPool(factory, **options)
+
+
+def test_connections_are_reused(clock, factory):
+    pool = make_pool(factory)
+    connection = pool.acquire()
+    pool.release(connection)
+    assert pool.acquire() is connection
+    assert len(factory.connections) == 1
+    assert connection.pings == 0
+
+
+def test_checkout_pings_idle_connection(clock, factory):
+    pool = make_pool(factory)
+    connection = pool.acquire()
+    pool.release(connection)
+    clock[0] += 11
+    assert pool.acquire() is connection
+    assert connection.pings == 1
+
+
+def test_failed_ping_replaces_connection(clock, factory):
+    pool = make_pool(factory)
+    connection = pool.acquire()
+    pool.release(connection)
+    connection.alive = False
+    clock[0] += 11
+    replacement = pool.acquire()
+    assert replacement is not connection
+    assert connection.closed
+    assert pool.size == 1
+
+
+def test_old_connection_is_recycled(clock, factory):
+    pool = make_pool(factory, ping_after=1e9)
+    connection = pool.acquire()
+    for _ in range(4):
+        clock[0] += 1000
+        pool.release(connection)
+        connection = pool.acquire()
+    assert connection is not factory.connections[0]
+    assert factory.connections[0].closed
+    assert len(factory.connections) == 2
+
+
+def test_idle_connection_is_dropped(clock, factory):
+    pool = make_pool(factory, ping_after=1e9)
+    connection = pool.acquire()
+    pool.release(connection)
+    clock[0] += 301
+    assert pool.acquire() is not connection
+    assert connection.closed
+    assert pool.size == 1
+
+
+def test_size_is_bounded(factory):
+    pool = make_pool(factory)
+    first, second = pool.acquire(), pool.acquire()
+    with pytest.raises(PoolTimeout):
+        pool.acquire()
+    assert pool.size == 2
+
+    def release():
+        pool.release(first)
+
+    timer = threading.Timer(0.01, release)
+    timer.start()
+    pool.timeout = 5
+    assert pool.acquire() is first
+    timer.join()
+    pool.release(second)
+
+
+def test_failed_connect_frees_its_slot():
+    def factory():
+        raise OperationalError(2003, "Can't connect")
+
+    pool = make_pool(factory)
+    with pytest.raises(OperationalError):
+        pool.acquire()
+    assert pool.size == 0
+
+
+@pytest.mark.parametrize(
+    "error, discarded",
+    [
+        (OperationalError(2013, "Lost connection"), True),
+        (InterfaceError(0, "Interface error"), True),
+        (OperationalError(1213, "Deadlock found"), False),
+        (ValueError("bad value"), False),
+    ],
+)
+def test_connection_errors_discard_the_connection(factory, error, discarded):
+    pool = make_pool(factory)
+    with pytest.raises(type(error)):
+        with pool.connection() as connection:
+            raise error
+    assert connection.closed is discarded
+    assert pool.size == (0 if discarded else 1)
+    assert pool.idle == (0 if discarded else 1)
+
+
+def test_close_drops_idle_connections(factory):
+    pool = make_pool(factory)
+    connection = pool.acquire()
+    pool.release(connection)
+    pool.close()
+    assert connection.closed
+    assert (pool.size, pool.idle) == (0, 0)
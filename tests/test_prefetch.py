@@ -0,0 +1,83 @@
+from time import time
+
+from condorcmf.dbqueue.daemon import Daemon
+
+
+def prefetcher(db, session, prefetch=4, low_water=None):
+    daemon = Daemon(
+        db,
+        session.session_id,
+        role=2,
+        node_id="a",
+        lease_time=30,
+        prefetch=prefetch,
+        low_water=low_water,
+    )
+    daemon.join()
+    return daemon
+
+
+def statuses(db, session):
+    return dict(
+        db.select(
+            "job_queue",
+            "`job_id`, `status_code`",
+            "`session_id`=%s",
+            limit=None,
+            params=(session.session_id,),
+        )
+    )
+
+
+def test_typed_take_job_skips_queued_jobs_of_other_types(db, session):
+    daemon = prefetcher(db, session, prefetch=2, low_water=2)
+    session.scatter(["a"] * 4, "leader", 0)
+    assert daemon.take_job(job_type=0).type == 0
+    daemon._wait_for_refill()
+    assert len(daemon.job_queue) == 2
+    (job_id,) = session.scatter(["a"], "leader", 5)
+    job = daemon.take_job(job_type=5)
+    assert job is not None and job.job_id == job_id
+
+
+def test_typed_take_job_refills_matching_jobs(db, session):
+    daemon = prefetcher(db, session, prefetch=2)
+    session.scatter(["a"] * 2, "leader", 0)
+    session.scatter(["a"] * 3, "leader", 5)
+    assert daemon.take_job(job_type=0).type == 0
+    daemon._wait_for_refill()
+    taken = [daemon.take_job(job_type=5) for _ in range(3)]
+    assert [job.type for job in taken] == [5, 5, 5]
+    assert daemon.take_job(job_type=5) is None
+
+
+def test_release_prefetched_on_leave(db, session):
+    daemon = prefetcher(db, session)
+    job_ids = session.scatter(["a"] * 4, "leader", 1)
+    job = daemon.take_job()
+    daemon._wait_for_refill()
+    daemon.leave()
+    assert statuses(db, session) == {
+        job_id: 1 if job_id == job.job_id else 0 for job_id in job_ids
+    }
+    assert len(daemon.job_queue) == 0
+
+
+def test_expired_prefetched_jobs_are_released(db, session):
+    daemon = prefetcher(db, session)
+    job_ids = session.scatter(["a"] * 2, "leader", 1)
+    job = daemon.take_job()
+    daemon._wait_for_refill()
+    past = time() - 1
+    db.update(
+        "job_queue",
+        "`deadline` = %s",
+        "`session_id`=%s AND `status_code`=1",
+        params=(past, session.session_id),
+    )
+    for queued in daemon.job_queue:
+        queued.deadline = past
+    assert daemon.take_job() is None
+    assert statuses(db, session) == {
+        job_id: 1 if job_id == job.job_id else 0 for job_id in job_ids
+    }
@@ -0,0 +1,114 @@
+import pytest
+
+from condorcmf.dbqueue.connector.memory import InMemoryConnector
+
+
+def add_node(db, node_id, status=0):
+    db.insert(
+        "pool",
+        "(`session_id`, `node_id`, `status_code`)",
+        ("s", node_id, status),
+    )
+
+
+def node_ids(db, **kwargs):
+    rows = db.select("pool", "`node_id`", "`session_id`=%s", params=("s",), **kwargs)
+    return sorted(row[0] for row in rows or [])
+
+
+@pytest.fixture
+def replica():
+    replica = InMemoryConnector()
+    add_node(replica, "replica")
+    return replica
+
+
+@pytest.fixture
+def primary(replica):
+    primary = InMemoryConnector(replicas=[replica], lag_check_interval=0)
+    add_node(primary, "primary")
+    return primary
+
+
+def set_lag(monkeypatch, replica, lag):
+    monkeypatch.setattr(replica, "replication_lag", lambda: lag)
+
+
+def test_reads_go_to_the_replica(primary, replica):
+    assert node_ids(primary, read_only=True) == ["replica"]
+    assert node_ids(primary) == ["primary"]
+
+
+def test_writes_and_claims_go_to_the_primary(primary, replica):
+    add_node(primary, "written")
+    primary.update(
+        "pool", "`status_code` = %s", "`node_id` = %s", params=(1, "replica")
+    )
+    claimed = primary.claim(
+        "pool",
+        "`node_id`",
+        "`session_id`=%s AND `status_code`=0",
+        "`status_code` = 1",
+        params=("s",),
+        n=10,
+    )
+    assert sorted(row[0] for row in claimed) == ["primary", "written"]
+    assert node_ids(replica) == ["replica"]
+    assert replica.select_one(
+        "pool", "`status_code`", "`node_id`=%s", params=("replica",)
+    ) == (0,)
+
+
+def test_queued_reads_go_to_the_primary(primary):
+    primary.select(
+        "pool",
+        "`node_id`",
+        "`session_id`=%s",
+        params=("s",),
+        read_only=True,
+        queue_query=True,
+    )
+    assert primary._execute_query_queue() == [[("primary",)]]
+
+
+@pytest.mark.parametrize("lag", [10.0, None])
+def test_stale_or_broken_replica_falls_back_to_the_primary(
+    monkeypatch, primary, replica, lag
+):
+    set_lag(monkeypatch, replica, lag)
+    assert node_ids(primary, read_only=True) == ["primary"]
+    set_lag(monkeypatch, replica, 1.0)
+    assert node_ids(primary, read_only=True) == ["replica"]
+
+
+def test_unreachable_replica_falls_back_to_the_primary(monkeypatch, primary, replica):
+    def fail(*args, **kwargs):
+        raise ConnectionError("replica is down")
+
+    monkeypatch.setattr(replica, "replication_lag", fail)
+    assert node_ids(primary, read_only=True) == ["primary"]
+    monkeypatch.undo()
+    monkeypatch.setattr(replica, "select", fail)
+    assert node_ids(primary, read_only=True) == ["primary"]
+
+
+def test_failed_replica_stays_out_until_rechecked(monkeypatch, replica):
+    primary = InMemoryConnector(replicas=[replica], lag_check_interval=60)
+    add_node(primary, "primary")
+    monkeypatch.setattr(replica, "select", lambda *args, **kwargs: 1 / 0)
+    assert node_ids(primary, read_only=True) == ["primary"]
+    monkeypatch.undo()
+    assert node_ids(primary, read_only=True) == ["primary"]
+    primary._replica_checks.clear()
+    assert node_ids(primary, read_only=True) == ["replica"]
+
+
+def test_reads_rotate_between_replicas(replica):
+    other = InMemoryConnector()
+    add_node(other, "other")
+    primary = InMemoryConnector(replicas=[replica, other])
+    assert [node_ids(primary, read_only=True) for _ in range(3)] == [
+        ["replica"],
+        ["other"],
+        ["replica"],
+    ]
@@ -0,0 +1,74 @@
+import pytest
+
+from condorcmf.dbqueue import schema
+from condorcmf.dbqueue.checkpoint import Checkpoint
+from condorcmf.dbqueue.connector.sqlite import SQLiteConnector
+from condorcmf.dbqueue.daemon import Daemon
+from condorcmf.dbqueue.result import Result
+from condorcmf.dbqueue.session import Session
+
+
+@pytest.fixture
+def sqlite(tmp_path):
+    db = SQLiteConnector(tmp_path / "dbqueue.db", create_schema=False)
+    schema.migrate(db)
+    yield db
+    db.close()
+
+
+def run_workload(db):
+    """
+    Issue the queries behind every entry of HOT_QUERIES through the public API.
+    """
+    session = Session(db)
+    session.create()
+    session.status()
+    follower = Daemon(db, session.session_id, role=2, node_id="follower", lease_time=60)
+    follower.join()
+    follower.status()
+    session.scatter(["follower"] * 2, "leader", 1, round_id="r1")
+    session.broadcast(["follower"], "leader", 1, payload={"x": 1}, round_id="r1")
+    follower.fetch_job()
+    job = follower.take_job(round_id="r1")
+    follower.take_job()
+    job.status()
+    follower.fetch_global_jobs()
+    follower.renew_leases()
+    follower.changes()
+    session.count_stale_jobs()
+    session.scatter(["leader"] * 2, "follower", 2, round_id="r2")
+    session.gather("r2", ["follower", "other"], timeout=0)
+    session.gather("r2", 1, timeout=0)
+    session.clean_stale_daemons(timeout=60)
+    session.archive_jobs(older_than=0)
+    list(session.iter_history(round_id="r1"))
+    session.clean_jobs("r1")
+    Checkpoint(db, session.session_id, "follower", 2).get(1)
+    Result(db, session.session_id, "follower", 2, results_id=job.job_id).fetch()
+    prefetcher = Daemon(
+        db, session.session_id, role=2, node_id="prefetcher", prefetch=2
+    )
+    prefetcher.join()
+    prefetcher.take_job()
+
+
+def test_migrated_schema_covers_hot_queries(sqlite):
+    assert schema.verify_index_coverage(sqlite) == {}
+
+
+def test_hot_queries_are_issued(sqlite):
+    run_workload(sqlite)
+    issued = [
+        (s.key[1], " ".join(s.key[3].split()), s.key[4])
+        for s in sqlite.statements
+        if s.key[3]
+    ]
+    missing = [
+        name
+        for name, table, where_clause, orderby in schema.HOT_QUERIES
+        if not any(
+            t == table and w == where_clause and orderby in (None, o)
+            for t, w, o in issued
+        )
+    ]
+    assert missing == []
@@ -0,0 +1,49 @@
+from condorcmf.dbqueue.daemon import Daemon
+
+
+def count_selects(monkeypatch, db):
+    selects = []
+    select = db.select
+
+    def counting_select(table, *args, **kwargs):
+        selects.append(table)
+        return select(table, *args, **kwargs)
+
+    monkeypatch.setattr(db, "select", counting_select)
+    return selects
+
+
+def test_stats_counts_pool_and_jobs(db, session, daemon):
+    session.scatter([daemon.node_id] * 3, "leader", 1)
+    session.scatter([daemon.node_id], "leader", 5)
+    daemon.take_job(job_type=1)
+    stats = session.stats(ttl=0)
+    assert stats["pool"] == {2: {daemon.status_code: 1}}
+    assert stats["jobs"] == {1: {0: 2, 1: 1}, 5: {0: 1}}
+    assert stats["pending_jobs"] == 3
+    assert stats["active_jobs"] == 1
+    assert stats["active_daemons"] == 1
+
+
+def test_stats_are_cached_for_ttl(monkeypatch, db, session, daemon):
+    selects = count_selects(monkeypatch, db)
+    first = session.stats(ttl=60)
+    assert len(selects) == 2
+    assert session.stats(ttl=60) is first
+    assert len(selects) == 2
+    # Writes by a daemon only show up once the snapshot expires
+    other = Daemon(db, session.session_id, role=2, node_id="other")
+    other.join()
+    assert session.stats(ttl=60)["active_daemons"] == 1
+    assert session.stats(ttl=0)["active_daemons"] == 2
+    assert len(selects) == 4
+
+
+def test_session_writes_invalidate_stats(db, session, daemon):
+    assert session.stats(ttl=60)["pending_jobs"] == 0
+    session.scatter([daemon.node_id] * 2, "leader", 1)
+    assert session.stats(ttl=60)["pending_jobs"] == 2
+    session.broadcast([daemon.node_id], "leader", 1, {})
+    assert session.stats(ttl=60)["pending_jobs"] == 3
+    session.invalidate_stats()
+    assert session._stats is None
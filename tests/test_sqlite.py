@@ -0,0 +1,82 @@
+import sqlite3
+import threading
+
+import pytest
+
+from condorcmf.dbqueue.connector.sqlite import SQLiteConnector
+
+
+@pytest.fixture
+def path(tmp_path):
+    return tmp_path / "dbqueue.db"
+
+
+def hold_lock(path, seconds):
+    """
+    Take the database write lock from another connection for `seconds`, and
+    return once it is held.
+    """
+    held = threading.Event()
+
+    def run():
+        connection = sqlite3.connect(path, isolation_level=None)
+        connection.execute("BEGIN IMMEDIATE")
+        held.set()
+        threading.Event().wait(seconds)
+        connection.execute("COMMIT")
+        connection.close()
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    held.wait()
+    return thread
+
+
+def count_nodes(db):
+    return db.select_one("pool", "COUNT(*)", "`session_id`=%s", params=("s",))[0]
+
+
+def add_node(db, node_id, **kwargs):
+    return db.insert("pool", "(`session_id`, `node_id`)", ("s", node_id), **kwargs)
+
+
+def test_statements_use_sqlite_placeholders(path):
+    db = SQLiteConnector(path)
+    statement = db.statements.get("select", "pool", "`node_id`", "`session_id`=%s")
+    assert "?" in statement.sql and "%s" not in statement.sql
+    with db.transaction() as cursor:
+        cursor.execute(
+            "INSERT INTO `pool` (`session_id`, `node_id`) VALUES (%s, %s)",
+            ("s", "50%s"),
+        )
+    assert db.select_one("pool", "`node_id`", "`session_id`=%s", params=("s",)) == (
+        "50%s",
+    )
+
+
+def test_locked_database_is_retried(path):
+    db = SQLiteConnector(path, timeout=0.01, poll_delay=0.05)
+    holder = hold_lock(path, 0.2)
+    assert add_node(db, "a")
+    holder.join()
+    assert count_nodes(db) == 1
+    assert db.statement_stats()["shapes"]["insert pool"]["retries"] > 0
+
+
+def test_locked_database_retries_queued_batch(path):
+    db = SQLiteConnector(path, timeout=0.01, poll_delay=0.05)
+    add_node(db, "a", queue_query=True)
+    add_node(db, "b", queue_query=True)
+    holder = hold_lock(path, 0.2)
+    assert db._execute_query_queue() == [True, True]
+    holder.join()
+    assert count_nodes(db) == 2
+
+
+def test_retries_give_up_after_limit(path):
+    db = SQLiteConnector(path, timeout=0.01, poll_delay=0.01)
+    holder = hold_lock(path, 1.0)
+    with pytest.raises(RuntimeError):
+        add_node(db, "a", limit=3)
+    holder.join()
+    assert count_nodes(db) == 0
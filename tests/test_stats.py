@@ -0,0 +1,65 @@
+import json
+
+import pytest
+
+from condorcmf.dbqueue.connector.stats import QueryStats, classify, normalize
+
+
+class TooManyConnections(Exception):
+    errno = 1040
+
+
+def add_nodes(db, session, node_ids):
+    for node_id in node_ids:
+        db.insert(
+            "pool",
+            "(`session_id`, `node_id`)",
+            (session.session_id, node_id),
+        )
+
+
+def test_snapshot_counts_calls_and_rows_per_shape(db, session):
+    db.stats.reset()
+    add_nodes(db, session, ["a", "b", "c"])
+    for _ in range(2):
+        db.select(
+            "pool", "`node_id`", "`session_id` = %s", params=(session.session_id,)
+        )
+    shapes = db.statement_stats()["shapes"]
+    assert shapes["insert pool"]["calls"] == 3
+    select = shapes["select pool WHERE `session_id` = %s"]
+    assert select["calls"] == 2
+    assert select["rows"] == 6
+    assert select["latency"]["count"] == 2
+    assert select["errors"] == 0
+    json.dumps(shapes)
+
+
+def test_in_lists_share_a_shape():
+    assert normalize("`id` IN (%s, %s, %s)") == normalize("`id`  IN (%s)")
+    assert normalize("`a`=%s") == "`a` = %s"
+
+
+def test_retries_and_events():
+    stats = QueryStats()
+    stats.record_event(TooManyConnections())
+    stats.record_event(RuntimeError("polling too quickly"), shape="queue")
+    shapes = stats.snapshot()["shapes"]
+    assert shapes["connect"]["events"]["too_many_connections"] == 1
+    assert shapes["queue"]["events"]["polling_too_quickly"] == 1
+    assert classify(RuntimeError("deadlock")) is None
+
+
+def test_start_dump_writes_snapshots(tmp_path, db, session):
+    path = tmp_path / "stats" / "dbqueue-stats.json"
+    assert db.stats.start_dump(interval=0.01, path=path) == path
+    add_nodes(db, session, ["a"])
+    db.stats.stop_dump()
+    snapshot = json.loads(path.read_text())
+    assert snapshot["shapes"]["insert pool"]["calls"] >= 1
+    assert db.stats._dump_thread is None
+
+
+def test_start_dump_needs_a_session_or_path():
+    with pytest.raises(ValueError):
+        QueryStats().start_dump()